@@ -98,6 +98,21 @@ class BaseTag(object):
         """
         return cElementTree.XML('<div>[Unimplemented custom tag]</div>')
 
+    def prefetch(self, nodes, handler):  # pylint: disable=W0613
+        """Optionally load, in bulk, the data needed to render the nodes.
+
+        Called once per page, before any tag on the page is rendered, with
+        all the DOM nodes bound to this tag. Override this to fetch the data
+        referenced by all the nodes in a single batch rather than once per
+        call to render().
+
+        Args:
+            nodes: list of cElementTree.Element. The DOM nodes for all
+                instances of this tag on the page.
+            handler: controllers.utils.BaseHandler. The server runtime.
+        """
+        pass
+
     def get_icon_url(self):
         """Return the URL for the icon to be displayed in the rich text editor.
 
@@ -325,6 +340,20 @@ def html_string_to_element_tree(html_string):
     return parser.parseFragment('<div>%s</div>' % html_string)[0]
 
 
+def _prefetch_tags(root, tag_bindings, handler):
+    """Lets each tag type on the page prefetch the data of all its nodes."""
+    nodes_by_tag = {}
+    for elt in root.iter():
+        if elt.tag in tag_bindings:
+            nodes_by_tag.setdefault(elt.tag, []).append(elt)
+    for tag_name, nodes in nodes_by_tag.iteritems():
+        try:
+            tag_bindings[tag_name]().prefetch(nodes, handler)
+        except Exception:  # pylint: disable=broad-except
+            # Tags fall back to loading their own data in render().
+            logging.exception('Error prefetching data for tag: %s', tag_name)
+
+
 def html_to_safe_dom(html_string, handler, render_custom_tags=True):
     """Render HTML text as a tree of safe_dom elements."""
 
@@ -416,6 +445,8 @@ def html_to_safe_dom(html_string, handler, render_custom_tags=True):
                 original_elt, '%s: %s' % (INVALID_HTML_TAG_MESSAGE, e))
 
     root = html_string_to_element_tree(html_string)
+    if render_custom_tags:
+        _prefetch_tags(root, tag_bindings, handler)
     if root.text:
         node_list.append(safe_dom.Text(root.text))
 
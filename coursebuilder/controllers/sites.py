@@ -121,6 +121,7 @@ from webapp2_extras import i18n
 import appengine_config
 from common import caching
 from common import safe_dom
+from models import counters
 from models import models
 from models import transforms
 from models.config import ConfigProperty
@@ -894,6 +895,7 @@ def unset_path_info():
                     PATH_INFO_THREAD_LOCAL.old_namespace)
                 del PATH_INFO_THREAD_LOCAL.old_namespace
                 del PATH_INFO_THREAD_LOCAL.path
+                counters.Registry.flush_global_values()
 
 
 def _build_course_list_from(rules_text, create_vfs=True):
@@ -25,10 +25,19 @@ from controllers import sites
 from controllers import utils as controllers_utils
 from models.analytics import display
 from models.analytics import utils as analytics_utils
+from models import config
 from models import data_sources
+from models import jobs
 
 by_name = {}
 
+CAN_UPDATE_ALL_ANALYTICS = config.ConfigProperty(
+    'gcb_can_update_all_analytics', bool,
+    'Whether or not to run the jobs computing the analytics of all courses '
+    'once a day.  Each run maps over all the entities used by any analytics '
+    'of every course, which may be costly for large courses.',
+    default_value=False)
+
 
 class Visualization(object):
 
@@ -182,8 +191,8 @@ class AnalyticsHandler(controllers_utils.ReflectiveRequestHandler,
             [by_name[name] for name in self.request.get_all('visualization')])
 
     def post_run_visualizations(self):
-        for generator_class in self._get_generator_classes():
-            generator_class(self.app_context).submit()
+        jobs.CompositeMapReduceJob.submit_jobs(
+            self.app_context, self._get_generator_classes())
         self.redirect(str(self.request.get('r')))
 
     def post_cancel_visualizations(self):
@@ -192,6 +201,36 @@ class AnalyticsHandler(controllers_utils.ReflectiveRequestHandler,
         self.redirect(str(self.request.get('r')))
 
 
+def submit_all_generators(app_context):
+    """Runs the generators required by all data sources of a course.
+
+    Generators over the same entity kind are run together, with a single
+    pass over that kind; see jobs.CompositeMapReduceJob.submit_jobs().
+    """
+    jobs.CompositeMapReduceJob.submit_jobs(
+        app_context, data_sources.Registry.get_generator_classes())
+
+
+class UpdateAllAnalyticsHandler(controllers_utils.BaseHandler):
+    """Handle callback from cron; update the statistics of all courses."""
+
+    URL = '/cron/analytics/update_all'
+
+    def get(self):
+        if not CAN_UPDATE_ALL_ANALYTICS.value:
+            self.response.write('Disabled.')
+            self.response.set_status(200)
+            return
+        if 'X-AppEngine-Cron' not in self.request.headers:
+            self.response.out.write('Forbidden.')
+            self.response.set_status(403)
+            return
+        for app_context in sites.get_all_courses():
+            submit_all_generators(app_context)
+        self.response.write('OK.')
+        self.response.set_status(200)
+
+
 def get_namespaced_handlers():
     return [('/analytics', AnalyticsHandler)]
 
@@ -228,6 +267,7 @@ def get_global_handlers():
 
     # Restrict files served from full zip package to minimum needed
     return [
+        (UpdateAllAnalyticsHandler.URL, UpdateAllAnalyticsHandler),
         ('/static/crossfilter-1.3.7/(crossfilter-1.3.7/crossfilter.min.js)',
          crossfilter_handler),
         ('/static/d3-3.4.3/(d3.min.js)', d3_handler),
@@ -23,6 +23,7 @@ of this with performance in mind.
 
 __author__ = 'Pavel Simakov (psimakov@google.com)'
 
+import datetime
 import logging
 import os
 import threading
@@ -33,6 +34,7 @@ import transforms
 
 import appengine_config
 
+from google.appengine.api import memcache
 from google.appengine.api import namespace_manager
 from google.appengine.ext import db
 
@@ -43,6 +45,13 @@ DEFAULT_UPDATE_INTERVAL_SEC = 60
 # The longest update interval supported.
 MAX_UPDATE_INTERVAL_SEC = 60 * 5
 
+# How often to check the version stamp of properties for changes.
+VERSION_CHECK_INTERVAL_SEC = 1
+
+# Properties saved this long before the last load are loaded again, to allow
+# for clock skew between instances and for eventually consistent queries.
+CHANGED_SINCE_OVERLAP = datetime.timedelta(seconds=10)
+
 
 # Allowed property types.
 TYPE_INT = int
@@ -204,15 +213,24 @@ class Registry(object):
     test_overrides = {}
     db_items = {}
     db_overrides = {}
-    names_with_draft = {}
+    names_with_draft = set()
     last_update_time = 0
+    last_version_check_time = 0
+    last_loaded_on = None
+    version = None
     update_index = 0
     threadlocal = threading.local()
     REENTRY_ATTR_NAME = 'busy'
 
     @classmethod
     def get_overrides(cls, force_update=False):
-        """Returns current property overrides, maybe cached."""
+        """Returns current property overrides, maybe cached.
+
+        All properties are reloaded from the datastore every
+        UPDATE_INTERVAL_SEC. In between, the version stamp of properties is
+        checked every VERSION_CHECK_INTERVAL_SEC, and only properties saved
+        since the last load are reloaded when it has changed.
+        """
 
         now = long(time.time())
         age = now - cls.last_update_time
@@ -221,38 +239,53 @@ class Registry(object):
         # do not update if call is reentrant or outer db transaction exists
         busy = hasattr(cls.threadlocal, cls.REENTRY_ATTR_NAME) or (
             db.is_in_transaction())
+        if busy:
+            return cls.db_overrides
 
-        if (not busy) and (force_update or age < 0 or age >= max_age):
+        if force_update or age < 0 or age >= max_age:
             # Value of '0' disables all datastore overrides.
             if UPDATE_INTERVAL_SEC.get_value() == 0:
                 cls.db_overrides = {}
                 return cls.db_overrides
 
-            # Load overrides from a datastore.
-            setattr(cls.threadlocal, cls.REENTRY_ATTR_NAME, True)
-            try:
-                old_namespace = namespace_manager.get_namespace()
-                try:
-                    namespace_manager.set_namespace(
-                        appengine_config.DEFAULT_NAMESPACE_NAME)
-                    cls._load_from_db()
-                finally:
-                    namespace_manager.set_namespace(old_namespace)
-            except Exception as e:  # pylint: disable=broad-except
-                logging.error(
-                    'Failed to load properties from a database: %s.', str(e))
-            finally:
-                delattr(cls.threadlocal, cls.REENTRY_ATTR_NAME)
+            cls._update_from_db(cls._load_from_db)
 
-                # Avoid overload and update timestamp even if we failed.
-                cls.last_update_time = now
-                cls.update_index += 1
+            # Avoid overload and update timestamp even if we failed.
+            cls.last_update_time = now
+            cls.last_version_check_time = now
+            cls.update_index += 1
+        else:
+            check_age = now - cls.last_version_check_time
+            if (cls.last_loaded_on and UPDATE_INTERVAL_SEC.get_value() and (
+                    check_age < 0 or check_age >= VERSION_CHECK_INTERVAL_SEC)):
+                cls._update_from_db(cls._load_changed_from_db)
+                cls.last_version_check_time = now
 
         return cls.db_overrides
 
+    @classmethod
+    def _update_from_db(cls, loader):
+        """Calls loader in the default namespace, guarding against reentry."""
+        setattr(cls.threadlocal, cls.REENTRY_ATTR_NAME, True)
+        try:
+            old_namespace = namespace_manager.get_namespace()
+            try:
+                namespace_manager.set_namespace(
+                    appengine_config.DEFAULT_NAMESPACE_NAME)
+                loader()
+            finally:
+                namespace_manager.set_namespace(old_namespace)
+        except Exception as e:  # pylint: disable=broad-except
+            logging.error(
+                'Failed to load properties from a database: %s.', str(e))
+        finally:
+            delattr(cls.threadlocal, cls.REENTRY_ATTR_NAME)
+
     @classmethod
     def _load_from_db(cls):
         """Loads dynamic properties from db."""
+        loaded_on = datetime.datetime.utcnow()
+        version = ConfigVersionStamp.get()
         items = {}
         overrides = {}
         drafts = set()
@@ -262,11 +295,50 @@ class Registry(object):
         cls.db_items = items
         cls.db_overrides = overrides
         cls.names_with_draft = drafts
+        cls.version = version
+        cls.last_loaded_on = loaded_on
+
+    @classmethod
+    def _load_changed_from_db(cls):
+        """Loads properties saved since the last load, if the stamp changed."""
+        version = ConfigVersionStamp.get()
+        if version == cls.version:
+            return
+        loaded_on = datetime.datetime.utcnow()
+
+        # The query is eventually consistent; the property named in the stamp
+        # is also read by key, which also tells if it was deleted. Anything
+        # missed here is picked up by the next full reload.
+        items = ConfigPropertyEntity.all().filter(
+            'updated_on >=', cls.last_loaded_on - CHANGED_SINCE_OVERLAP).fetch(
+                1000)
+        name = ConfigVersionStamp.get_name(version)
+        if name:
+            try:
+                item = ConfigPropertyEntity.get_by_key_name(name)
+            except db.BadKeyError:
+                item = None
+            if item:
+                items.append(item)
+            else:
+                cls._config_property_entity_deleted(name)
+
+        for item in items:
+            cls.db_items[item.key().name()] = item
+            cls._config_property_entity_changed(item)
+        cls.version = version
+        cls.last_loaded_on = loaded_on
 
     @classmethod
     def _config_property_entity_changed(cls, item):
         cls._set_value(item, cls.db_overrides, cls.names_with_draft)
 
+    @classmethod
+    def _config_property_entity_deleted(cls, name):
+        cls.db_items.pop(name, None)
+        cls.db_overrides.pop(name, None)
+        cls.names_with_draft.discard(name)
+
     @classmethod
     def _set_value(cls, item, overrides, drafts):
         name = item.key().name()
@@ -312,24 +384,79 @@ class Registry(object):
             overrides[name] = value
 
 
+class ConfigVersionStamp(object):
+    """A version stamp of config properties, shared by all instances.
+
+    The stamp changes every time a property is saved or deleted, and names
+    the property changed last. It is kept in memcache; when evicted, it is
+    recreated from the last saved property in the datastore.
+    """
+
+    MEMCACHE_KEY = 'config:version'
+
+    @classmethod
+    def _make(cls, updated_on, name):
+        return '%s|%s' % (updated_on.isoformat(), name)
+
+    @classmethod
+    def get_name(cls, version):
+        """Returns the name of the property changed last, or None."""
+        if not version:
+            return None
+        return version.split('|', 1)[1]
+
+    @classmethod
+    def get(cls):
+        version = memcache.get(
+            cls.MEMCACHE_KEY, namespace=appengine_config.DEFAULT_NAMESPACE_NAME)
+        if version is not None:
+            return version
+
+        # Deleted properties leave no trace in the datastore; those are
+        # picked up by the next full reload.
+        version = ''
+        item = ConfigPropertyEntity.all().order('-updated_on').get()
+        if item:
+            version = cls._make(item.updated_on, item.key().name())
+        memcache.add(
+            cls.MEMCACHE_KEY, version,
+            namespace=appengine_config.DEFAULT_NAMESPACE_NAME)
+        return version
+
+    @classmethod
+    def bump(cls, name):
+        memcache.set(
+            cls.MEMCACHE_KEY, cls._make(datetime.datetime.utcnow(), name),
+            namespace=appengine_config.DEFAULT_NAMESPACE_NAME)
+
+
 class ConfigPropertyEntity(entities.BaseEntity):
     """A class that represents a named configuration property."""
     value = db.TextProperty(indexed=False)
     is_draft = db.BooleanProperty(indexed=False)
+    updated_on = db.DateTimeProperty(indexed=True)
 
     def put(self):
         # Persist to DB.
+        self.updated_on = datetime.datetime.utcnow()
         super(ConfigPropertyEntity, self).put()
 
         # And tell local registry.  Do this by direct call and synchronously
         # so that this setting will be internally consistent within the
-        # remainder of this server's path of execution.  (Note that the
-        # setting is _not_ going to be immediately available at all other
-        # instances; they will pick it up in due course after
-        # UPDATE_INTERVAL_SEC has elapsed.
+        # remainder of this server's path of execution.  Other instances
+        # notice the new version stamp within VERSION_CHECK_INTERVAL_SEC.
 
         # pylint: disable=protected-access
         Registry._config_property_entity_changed(self)
+        ConfigVersionStamp.bump(self.key().name())
+
+    def delete(self):
+        name = self.key().name()
+        super(ConfigPropertyEntity, self).delete()
+
+        # pylint: disable=protected-access
+        Registry._config_property_entity_deleted(name)
+        ConfigVersionStamp.bump(name)
 
 
 def run_all_unit_tests():
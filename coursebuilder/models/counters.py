@@ -16,9 +16,15 @@
 
 __author__ = 'Pavel Simakov (psimakov@google.com)'
 
+import threading
+import time
 
-def incr_counter_global_value(unused_name, unused_delta):
-    """Hook method for global aggregation."""
+# Buffered increments of global values are flushed at least this often.
+GLOBAL_VALUE_FLUSH_INTERVAL_SEC = 10
+
+
+def incr_counter_global_values(unused_deltas):
+    """Hook method for global aggregation of a dict of name to delta."""
     pass
 
 
@@ -45,7 +51,7 @@ class PerfCounter(object):
         self, increment=1, context=None):  # pylint: disable=unused-argument
         """Increments value by a given increment."""
         self._value += increment
-        incr_counter_global_value(self.name, increment)
+        Registry.buffer_global_value_increment(self.name, increment)
 
     def poll_value(self):
         """Override this method to return the desired value directly."""
@@ -74,11 +80,43 @@ class PerfCounter(object):
 
 
 class Registry(object):
-    """Holds all registered counters."""
+    """Holds all registered counters.
+
+    Increments of global values are buffered in process and sent to the
+    aggregation hook in one call at the end of each request, or after
+    GLOBAL_VALUE_FLUSH_INTERVAL_SEC when there is no request to end.
+    """
     registered = {}
+    pending_global_deltas = {}
+    last_flush_time = 0
+    lock = threading.Lock()
+
+    @classmethod
+    def buffer_global_value_increment(cls, name, delta):
+        with cls.lock:
+            cls.pending_global_deltas[name] = (
+                cls.pending_global_deltas.get(name, 0) + delta)
+            age = time.time() - cls.last_flush_time
+            if 0 <= age < GLOBAL_VALUE_FLUSH_INTERVAL_SEC:
+                return
+        cls.flush_global_values()
+
+    @classmethod
+    def flush_global_values(cls):
+        """Sends all buffered increments of global values to the hook."""
+        with cls.lock:
+            deltas = cls.pending_global_deltas
+            cls.pending_global_deltas = {}
+            cls.last_flush_time = time.time()
+
+        # Called without the lock: the hook may increment counters itself.
+        if deltas:
+            incr_counter_global_values(deltas)
 
     @classmethod
     def _clear_all(cls):
         """Clears all counters for tests."""
         for counter in cls.registered.values():
             counter._clear()  # pylint: disable=protected-access
+        with cls.lock:
+            cls.pending_global_deltas = {}
@@ -1005,7 +1005,7 @@ class CachedCourse13(AbstractCachedObject):
 
     def __init__(
         self, next_id=None, units=None, lessons=None,
-        unit_id_to_lesson_ids=None):
+        unit_id_to_lesson_ids=None, unit_id_to_parent_unit_id=None):
 
         self.version = self.VERSION
         self.next_id = next_id
@@ -1017,6 +1017,7 @@ class CachedCourse13(AbstractCachedObject):
         # is no need to persist these indexes in durable storage, but it is
         # nice to have them in memcache.
         self.unit_id_to_lesson_ids = unit_id_to_lesson_ids
+        self.unit_id_to_parent_unit_id = unit_id_to_parent_unit_id
 
     @classmethod
     def _max_size(cls):
@@ -1033,14 +1034,17 @@ class CachedCourse13(AbstractCachedObject):
         return CourseModel13(
             app_context, next_id=memento.next_id,
             units=memento.units, lessons=memento.lessons,
-            unit_id_to_lesson_ids=memento.unit_id_to_lesson_ids)
+            unit_id_to_lesson_ids=memento.unit_id_to_lesson_ids,
+            unit_id_to_parent_unit_id=getattr(
+                memento, 'unit_id_to_parent_unit_id', None))
 
     @classmethod
     def memento_from_instance(cls, course):
         return CachedCourse13(
             next_id=course.next_id,
             units=course.units, lessons=course.lessons,
-            unit_id_to_lesson_ids=course.unit_id_to_lesson_ids)
+            unit_id_to_lesson_ids=course.unit_id_to_lesson_ids,
+            unit_id_to_parent_unit_id=course.unit_id_to_parent_unit_id)
 
 
 class CourseModel13(object):
@@ -1048,6 +1052,11 @@ class CourseModel13(object):
 
     VERSION = COURSE_MODEL_VERSION_1_3
 
+    # Holds callback functions which are passed the app_context of a course
+    # after its units and lessons are saved, e.g. to drop rendered views of
+    # the course structure.
+    POST_SAVE_HOOKS = []
+
     @classmethod
     def load(cls, app_context):
         """Loads course from memcache or persistence."""
@@ -1069,9 +1078,19 @@ class CourseModel13(object):
             unit_id_to_lesson_ids[key].append(str(lesson.lesson_id))
         return unit_id_to_lesson_ids
 
+    @classmethod
+    def _make_unit_id_to_parent_unit_id_lookup_dict(cls, units):
+        """Creates an index of pre/post assessment ids to their unit ids."""
+        unit_id_to_parent_unit_id = {}
+        for unit in units:
+            for child_id in (unit.pre_assessment, unit.post_assessment):
+                if child_id is not None:
+                    unit_id_to_parent_unit_id[str(child_id)] = str(unit.unit_id)
+        return unit_id_to_parent_unit_id
+
     def __init__(
         self, app_context, next_id=None, units=None, lessons=None,
-        unit_id_to_lesson_ids=None):
+        unit_id_to_lesson_ids=None, unit_id_to_parent_unit_id=None):
 
         # Init default values.
         self._app_context = app_context
@@ -1079,6 +1098,7 @@ class CourseModel13(object):
         self._units = []
         self._lessons = []
         self._unit_id_to_lesson_ids = {}
+        self._unit_id_to_parent_unit_id = {}
 
         # These array keep dirty object in current transaction.
         self._dirty_units = []
@@ -1095,6 +1115,11 @@ class CourseModel13(object):
             self._lessons = lessons
         if unit_id_to_lesson_ids:
             self._unit_id_to_lesson_ids = unit_id_to_lesson_ids
+            if unit_id_to_parent_unit_id is None:
+                unit_id_to_parent_unit_id = (
+                    self._make_unit_id_to_parent_unit_id_lookup_dict(
+                        self._units))
+            self._unit_id_to_parent_unit_id = unit_id_to_parent_unit_id
         else:
             self._index()
 
@@ -1118,6 +1143,10 @@ class CourseModel13(object):
     def unit_id_to_lesson_ids(self):
         return self._unit_id_to_lesson_ids
 
+    @property
+    def unit_id_to_parent_unit_id(self):
+        return self._unit_id_to_parent_unit_id
+
     def _get_next_id(self):
         """Allocates next id in sequence."""
         next_id = self._next_id
@@ -1128,6 +1157,8 @@ class CourseModel13(object):
         """Indexes units and lessons."""
         self._unit_id_to_lesson_ids = self._make_unit_id_to_lessons_lookup_dict(
             self._lessons)
+        self._unit_id_to_parent_unit_id = (
+            self._make_unit_id_to_parent_unit_id_lookup_dict(self._units))
         index_units_and_lessons(self)
 
     def get_file_content(self, filename):
@@ -1266,6 +1297,7 @@ class CourseModel13(object):
         self._index()
         PersistentCourse13.save(self._app_context, self)
         CachedCourse13.delete(self._app_context)
+        common_utils.run_hooks(self.POST_SAVE_HOOKS, self._app_context)
 
     def get_units(self):
         return self._units[:]
@@ -1317,14 +1349,11 @@ class CourseModel13(object):
 
     def get_parent_unit(self, unit_id):
         # See if the unit is an assessment being used as a pre/post
-        # unit lesson.
-        for unit in self.get_units():
-            if (str(unit.pre_assessment) == str(unit_id) or
-                str(unit.post_assessment) == str(unit_id)):
-                return unit
-
-        # Nope, no other kinds of parentage; no parent.
-        return None
+        # unit lesson. Nope, no other kinds of parentage; no parent.
+        parent_unit_id = self._unit_id_to_parent_unit_id.get(str(unit_id))
+        if parent_unit_id is None:
+            return None
+        return self.find_unit_by_id(parent_unit_id)
 
     def add_unit(self, unit_type, title, custom_unit_type=None):
         """Adds a brand new unit."""
@@ -1473,6 +1502,8 @@ class CourseModel13(object):
             existing_unit.html_review_form = unit.html_review_form
             existing_unit.workflow_yaml = unit.workflow_yaml
 
+        self._unit_id_to_parent_unit_id = (
+            self._make_unit_id_to_parent_unit_id_lookup_dict(self._units))
         self._dirty_units.append(existing_unit)
         return existing_unit
 
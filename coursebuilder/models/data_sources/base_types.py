@@ -165,6 +165,27 @@ class _AbstractRestDataSource(_DataSource):
         """
         return cls.RECOMMENDED_MAX_DATA_ITEMS
 
+    @classmethod
+    def get_watermark_column(cls):
+        """Name the field telling when each item was added, if there is one.
+
+        Data sources over tables to which items are only ever added may
+        return the name of an indexed 'datetime' field of their schema that
+        is set when an item is created.  The data pump then records how far
+        it has exported items along that field, and can later export only
+        the items added since, appending them to the table in BigQuery.
+        Changes to items already exported are not picked up by such
+        incremental exports.
+
+        This requires the context class to support filters and orderings,
+        as models.data_sources.paginated_table._DbTableContext does.
+
+        Returns:
+            The name of the field, or None if items cannot be exported
+            incrementally.
+        """
+        return None
+
     @classmethod
     def get_context_class(cls):
         raise NotImplementedError(
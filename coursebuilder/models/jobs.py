@@ -25,6 +25,7 @@ import urllib
 
 import entities
 from mapreduce import base_handler
+from mapreduce import context
 from mapreduce import input_readers
 from mapreduce import mapreduce_pipeline
 from mapreduce.lib.pipeline import pipeline
@@ -521,6 +522,309 @@ class AbstractCountingMapReduceJob(MapReduceJob):
         yield (key, total)
 
 
+class CompositeMapReduceJobPipeline(base_handler.PipelineBase):
+
+    def run(self, job_name, sequence_num, component_sequence_nums, kwargs,
+            namespace):
+        time_started = time.time()
+
+        with Namespace(namespace):
+            output = MapReduceJob.build_output(self.root_pipeline_id, [])
+            db.run_in_transaction(
+                DurableJobEntity._start_job, job_name, sequence_num, output)
+            for component_job_name, component_sequence_num in (
+                component_sequence_nums):
+                db.run_in_transaction(
+                    DurableJobEntity._start_job, component_job_name,
+                    component_sequence_num, output)
+        output = yield mapreduce_pipeline.MapreducePipeline(**kwargs)
+        yield StoreCompositeMapReduceResults(
+            job_name, sequence_num, component_sequence_nums, time_started,
+            namespace, output)
+
+    def finalized(self):
+        pass  # Suppress default Pipeline behavior of sending email.
+
+
+class StoreCompositeMapReduceResults(base_handler.PipelineBase):
+
+    def run(self, job_name, sequence_num, component_sequence_nums,
+            time_started, namespace, output):
+        results = [[] for _ in component_sequence_nums]
+        try:
+            iterator = input_readers.RecordsReader(output, 0)
+            for item in iterator:
+                # Composite reducers tag each result with the index of the
+                # component job that produced it, and keep the result as the
+                # string map/reduce would have written had the component
+                # run alone; see StoreMapReduceResults.
+                index, result = ast.literal_eval(item)
+                results[index].append(ast.literal_eval(result))
+            time_completed = time.time()
+            with Namespace(namespace):
+                for (component_job_name, component_sequence_num), (
+                    component_results) in zip(component_sequence_nums,
+                                              results):
+                    db.run_in_transaction(
+                        DurableJobEntity._complete_job, component_job_name,
+                        component_sequence_num,
+                        MapReduceJob.build_output(
+                            self.root_pipeline_id, component_results),
+                        long(time_completed - time_started))
+                db.run_in_transaction(
+                    DurableJobEntity._complete_job, job_name, sequence_num,
+                    MapReduceJob.build_output(
+                        self.root_pipeline_id,
+                        [[component_job_name, len(component_results)]
+                         for (component_job_name, _), component_results in
+                         zip(component_sequence_nums, results)]),
+                    long(time_completed - time_started))
+        # See StoreMapReduceResults for why all exceptions are caught here.
+        #
+        # pylint: disable=broad-except
+        except Exception, ex:
+            time_completed = time.time()
+            with Namespace(namespace):
+                for component_job_name, component_sequence_num in (
+                    component_sequence_nums):
+                    db.run_in_transaction(
+                        DurableJobEntity._fail_job, component_job_name,
+                        component_sequence_num,
+                        MapReduceJob.build_output(
+                            self.root_pipeline_id, [], str(ex)),
+                        long(time_completed - time_started))
+                db.run_in_transaction(
+                    DurableJobEntity._fail_job, job_name, sequence_num,
+                    MapReduceJob.build_output(
+                        self.root_pipeline_id, [], str(ex)),
+                    long(time_completed - time_started))
+
+
+class CompositeMapReduceJob(MapReduceJob):
+    """Runs several map/reduce jobs over the same entity kind in one pass.
+
+    Each component job is an ordinary MapReduceJob.  A single map/reduce
+    scans the entity kind once and calls the map() of every component on
+    each item.  Map output keys are tagged with the index of the component
+    that produced them, so that the shuffle keeps the data of components
+    apart and each key is handed to the reduce() (and combine(), if any) of
+    the component that produced it.
+
+    The status and results of every component are recorded under the
+    component's own DurableJobEntity, exactly as if it had been run alone;
+    this job's own record only lists the number of results per component.
+    Mapper params of all components are merged into a single dict, so
+    components must not use the same param name for different values.
+    Components that map only some entities, by setting the 'filters' mapper
+    param, are run on their own.
+
+    Use submit_jobs() to run a set of generators with one pass per entity
+    kind.
+    """
+
+    _COMPONENTS_PARAM = 'composite_components'
+    _component_classes_by_path = {}
+
+    @staticmethod
+    def get_description():
+        return 'combined analytics'
+
+    def __init__(self, app_context, component_classes):
+        self._components = [
+            component_class(app_context)
+            for component_class in component_classes]
+        self._entity_class = self._components[0].entity_class()
+        for component in self._components:
+            if component.entity_class() != self._entity_class:
+                raise ValueError(
+                    'All component jobs must map over the same entity '
+                    'kind; %s maps over %s, not %s.' % (
+                        component.__class__.__name__,
+                        component.entity_class().__name__,
+                        self._entity_class.__name__))
+        super(CompositeMapReduceJob, self).__init__(app_context)
+        self._job_name = 'job-%s-%s-%s' % (
+            self.__class__.__name__, self._entity_class.__name__,
+            self._namespace)
+
+    @classmethod
+    def can_combine(cls, job_class):
+        """Whether a job class can run as a component of a composite job."""
+        return (
+            issubclass(job_class, MapReduceJob) and
+            not issubclass(job_class, CompositeMapReduceJob) and
+            (getattr(job_class, 'non_transactional_submit') ==
+             getattr(MapReduceJob, 'non_transactional_submit')))
+
+    @classmethod
+    def submit_jobs(cls, app_context, job_classes):
+        """Submits jobs, running those over the same entity kind together.
+
+        Jobs that are already running are left alone.  Map/reduce jobs over
+        the same entity kind are run as one CompositeMapReduceJob; all other
+        jobs, and jobs whose mapper params clash, are submitted on their own.
+
+        Args:
+            app_context: The course to run the jobs for.
+            job_classes: An iterable of DurableJobBase subclasses.
+        """
+        by_entity_class = {}
+        singles = []
+        for job_class in job_classes:
+            job = job_class(app_context)
+            if job.is_active():
+                continue
+            if cls.can_combine(job_class):
+                by_entity_class.setdefault(
+                    job.entity_class(), []).append(job_class)
+            else:
+                singles.append(job_class)
+
+        for group in by_entity_class.itervalues():
+            if len(group) > 1 and cls(app_context, group).submit() >= 0:
+                continue
+            singles.extend(group)
+
+        for job_class in singles:
+            job_class(app_context).submit()
+
+    def entity_class(self):
+        return self._entity_class
+
+    def is_active(self):
+        # The components' records are the ones shown and cleaned up, so they
+        # are authoritative.
+        return any(component.is_active() for component in self._components)
+
+    def _pre_transaction_setup(self):
+        self.mapper_params = {}
+        for component in self._components:
+            if not component._pre_transaction_setup():
+                return False
+            if 'filters' in component.mapper_params:
+                # The filters would apply to the scan shared by all.
+                logging.info(
+                    'Not combining jobs for %s: %s only maps some entities.',
+                    self._entity_class.__name__, component.__class__.__name__)
+                return False
+            for name, value in component.mapper_params.iteritems():
+                if (name in self.mapper_params and
+                    self.mapper_params[name] != value):
+                    logging.warning(
+                        'Not combining jobs for %s: mapper param %s of %s '
+                        'clashes with another component.',
+                        self._entity_class.__name__, name,
+                        component.__class__.__name__)
+                    return False
+                self.mapper_params[name] = value
+        self.mapper_params[self._COMPONENTS_PARAM] = [
+            '%s.%s' % (component.__class__.__module__,
+                       component.__class__.__name__)
+            for component in self._components]
+        return True
+
+    def non_transactional_submit(self):
+        if self.is_active():
+            return -1
+        with Namespace(self._namespace):
+            sequence_num = DurableJobEntity._create_job(self._job_name)
+            component_sequence_nums = [
+                [component._job_name,
+                 DurableJobEntity._create_job(component._job_name)]
+                for component in self._components]
+        entity_class_name = '%s.%s' % (self._entity_class.__module__,
+                                       self._entity_class.__name__)
+        self.mapper_params.update({
+            'entity_kind': entity_class_name,
+            'namespace': self._namespace,
+            })
+
+        cls_path = '%s.%s' % (
+            CompositeMapReduceJob.__module__, CompositeMapReduceJob.__name__)
+        kwargs = {
+            'job_name': self._job_name,
+            'mapper_spec': cls_path + '.map',
+            'reducer_spec': cls_path + '.reduce',
+            'input_reader_spec':
+                'mapreduce.input_readers.DatastoreInputReader',
+            'output_writer_spec':
+                'mapreduce.output_writers.BlobstoreRecordsOutputWriter',
+            'mapper_params': self.mapper_params,
+            'reducer_params': self.mapper_params,
+        }
+        if any(getattr(component.__class__, 'combine') !=
+               getattr(MapReduceJob, 'combine')
+               for component in self._components):
+            kwargs['combiner_spec'] = cls_path + '.combine'
+        mr_pipeline = CompositeMapReduceJobPipeline(
+            self._job_name, sequence_num, component_sequence_nums, kwargs,
+            self._namespace)
+        mr_pipeline.start(base_path='/mapreduce/worker/pipeline')
+        return sequence_num
+
+    def _cancel_queued_work(self, job, message):
+        super(CompositeMapReduceJob, self)._cancel_queued_work(job, message)
+        for component in self._components:
+            component_job = component.load()
+            if component_job and not component_job.has_finished:
+                duration = int((datetime.datetime.now() -
+                                component_job.updated_on).total_seconds())
+                db.run_in_transaction(
+                    component._mark_job_canceled, component_job, message,
+                    duration)
+
+    @classmethod
+    def _get_component_classes(cls):
+        paths = context.get().mapreduce_spec.mapper.params[
+            cls._COMPONENTS_PARAM]
+        ret = []
+        for path in paths:
+            if path not in cls._component_classes_by_path:
+                module_name, class_name = path.rsplit('.', 1)
+                module = __import__(module_name, fromlist=[class_name])
+                cls._component_classes_by_path[path] = getattr(
+                    module, class_name)
+            ret.append(cls._component_classes_by_path[path])
+        return ret
+
+    @classmethod
+    def _split_key(cls, key):
+        index, component_key = key.split(':', 1)
+        index = int(index)
+        return index, cls._get_component_classes()[index], component_key
+
+    @staticmethod
+    def map(item):
+        for index, component_class in enumerate(
+            CompositeMapReduceJob._get_component_classes()):
+            for key, value in component_class.map(item) or []:
+                yield '%d:%s' % (index, key), value
+
+    @staticmethod
+    def combine(key, values, previously_combined_values=None):
+        _, component_class, component_key = CompositeMapReduceJob._split_key(
+            key)
+        if (getattr(component_class, 'combine') !=
+            getattr(MapReduceJob, 'combine')):
+            for value in component_class.combine(
+                component_key, values, previously_combined_values):
+                yield value
+        else:
+            # Components without a combine() step see all their values in
+            # reduce(), as they would if run alone.
+            for value in values:
+                yield value
+            for value in previously_combined_values or []:
+                yield value
+
+    @staticmethod
+    def reduce(key, values):
+        index, component_class, component_key = (
+            CompositeMapReduceJob._split_key(key))
+        for result in component_class.reduce(component_key, values) or []:
+            yield index, str(result)
+
+
 class DurableJobEntity(entities.BaseEntity):
     """A class that represents a persistent database entity of durable job."""
 
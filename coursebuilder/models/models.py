@@ -27,6 +27,7 @@ from config import ConfigProperty
 import counters
 from counters import PerfCounter
 from entities import BaseEntity
+from entities import put as entities_put
 import jinja2
 import services
 import transforms
@@ -197,15 +198,15 @@ class MemcacheManager(object):
     def _local_cache_get_multi(cls, keys, namespace):
         if cls._IS_READONLY:
             assert cls._is_same_app_context_if_set()
-            values = []
+            values = {}
             for key in keys:
                 is_cached, value = cls._local_cache_get(key, namespace)
                 if not is_cached:
-                    return False, []
+                    return False, {}
                 else:
-                    values.append(value)
+                    values[key] = value
             return True, values
-        return False, []
+        return False, {}
 
     @classmethod
     def _local_cache_put_multi(cls, values, namespace):
@@ -337,12 +338,37 @@ class MemcacheManager(object):
                 key_list, namespace=cls._get_namespace(namespace))
 
     @classmethod
-    def incr(cls, key, delta, namespace=None):
-        """Incr an item in memcache if memcache is enabled."""
+    def incr(cls, key, delta, namespace=None, initial_value=0):
+        """Incr an item in memcache if memcache is enabled.
+
+        Returns:
+            The new value of the item, or None if memcache is disabled or the
+            item could not be incremented.
+        """
         if CAN_USE_MEMCACHE.value:
-            memcache.incr(
-                key, delta,
-                namespace=cls._get_namespace(namespace), initial_value=0)
+            return memcache.incr(
+                key, delta, namespace=cls._get_namespace(namespace),
+                initial_value=initial_value)
+        return None
+
+    @classmethod
+    def offset_multi(cls, mapping, namespace=None, initial_value=0):
+        """Incr a dict of items by their deltas if memcache is enabled.
+
+        Returns:
+            A dict of the new values of the items, or None if memcache is
+            disabled.
+        """
+        try:
+            if CAN_USE_MEMCACHE.value:
+                return memcache.offset_multi(
+                    mapping, namespace=cls._get_namespace(namespace),
+                    initial_value=initial_value)
+        except:  # pylint: disable=bare-except
+            logging.exception(
+                'Failed to offset_multi: %s, %s',
+                mapping, cls._get_namespace(namespace))
+        return None
 
 
 CAN_AGGREGATE_COUNTERS = ConfigProperty(
@@ -356,10 +382,11 @@ CAN_AGGREGATE_COUNTERS = ConfigProperty(
     default_value=False)
 
 
-def incr_counter_global_value(name, delta):
+def incr_counter_global_values(deltas):
     if CAN_AGGREGATE_COUNTERS.value:
-        MemcacheManager.incr(
-            'counter:' + name, delta,
+        MemcacheManager.offset_multi(
+            dict(('counter:' + name, delta)
+                 for name, delta in deltas.iteritems()),
             namespace=appengine_config.DEFAULT_NAMESPACE_NAME)
 
 
@@ -372,7 +399,7 @@ def get_counter_global_value(name):
         return None
 
 counters.get_counter_global_value = get_counter_global_value
-counters.incr_counter_global_value = incr_counter_global_value
+counters.incr_counter_global_values = incr_counter_global_values
 
 
 # Whether to record tag events in a database.
@@ -1046,6 +1073,36 @@ class Student(BaseEntity):
         else:
             return None
 
+    @classmethod
+    def get_enrolled_students_by_email(cls, emails):
+        """Returns a dict of enrolled students keyed by email.
+
+        Looks up all the emails with one memcache and at most one datastore
+        batch get. Emails without an enrolled student are left out.
+        """
+        memcache_keys = dict(
+            (email, cls._memcache_key(email)) for email in emails)
+        cached = MemcacheManager.get_multi(memcache_keys.values())
+        students = {}
+        missing = []
+        for email, memcache_key in memcache_keys.iteritems():
+            if memcache_key not in cached:
+                missing.append(email)
+            elif NO_OBJECT != cached[memcache_key]:
+                students[email] = cached[memcache_key]
+        if missing:
+            memcache_update = {}
+            for email, student in zip(missing, Student.get_by_key_name(
+                [email.encode('utf8') for email in missing])):
+                if student:
+                    students[email] = student
+                memcache_update[memcache_keys[email]] = (
+                    student if student else NO_OBJECT)
+            MemcacheManager.set_multi(memcache_update)
+        return dict(
+            (email, student) for email, student in students.iteritems()
+            if student.is_enrolled)
+
     @classmethod
     def _get_user_and_student(cls):
         """Loads user and student and asserts both are present."""
@@ -1204,6 +1261,15 @@ class StudentPropertyEntity(BaseEntity):
         super(StudentPropertyEntity, self).delete()
         MemcacheManager.delete(self._memcache_key(self.key().name()))
 
+    @classmethod
+    def put_multi(cls, properties):
+        """Puts a list of properties in a single batch and caches them."""
+        result = entities_put(properties)
+        MemcacheManager.set_multi(dict(
+            (cls._memcache_key(prop.key().name()), prop)
+            for prop in properties))
+        return result
+
     @classmethod
     def get(cls, student, property_name):
         """Loads student property."""
@@ -1230,8 +1296,12 @@ class BaseJsonDao(object):
             return entity_class.get_by_id(int(key))
 
         @classmethod
-        def new_entity(cls, entity_class, unused_key):
-            return entity_class()  # ID auto-generated when entity is put().
+        def new_entity(cls, entity_class, key):
+            if key is None:
+                return entity_class()  # ID auto-generated when entity is put().
+            # IDs reserved with db.allocate_ids() are kept.
+            return entity_class(key=db.Key.from_path(
+                entity_class.kind(), int(key)))
 
     class EntityKeyTypeName(object):
 
@@ -1397,7 +1467,9 @@ class BaseJsonDao(object):
                 if NO_OBJECT == entity:
                     ret.append(None)
                 else:
-                    ret.append(cls.DTO(obj_id, transforms.loads(entity.data)))
+                    dto = cls.DTO(obj_id, transforms.loads(entity.data))
+                    ret.append(dto)
+                    dtos_for_post_hooks.append(dto)
 
         # run hooks
         cls._maybe_apply_post_load_hooks(dtos_for_post_hooks)
@@ -1449,12 +1521,28 @@ class BaseJsonDao(object):
         cls._maybe_apply_post_save_hooks(zip(id_or_name_list, dtos))
         return id_or_name_list
 
+    @classmethod
+    def _maybe_apply_post_delete_hooks(cls, dto_list):
+        """Run any post-delete processing hooks.
+
+        Modules may insert post-delete processing hooks (e.g. to update their
+        caches) into the list POST_DELETE_HOOKS defined on the DAO class. If
+        the class has this list and any hook functions are present, they are
+        passed the list of deleted DTO's.
+
+        Args:
+            dto_list: list of DTO objects
+        """
+        if hasattr(cls, 'POST_DELETE_HOOKS'):
+            common_utils.run_hooks(cls.POST_DELETE_HOOKS, dto_list)
+
     @classmethod
     def delete(cls, dto):
         entity = cls._load_entity(dto.id)
         entity.delete()
         MemcacheManager.delete(cls._memcache_all_key())
         MemcacheManager.delete(cls._memcache_key(entity.key().id_or_name()))
+        cls._maybe_apply_post_delete_hooks([dto])
 
     @classmethod
     def clone(cls, dto):
@@ -1527,6 +1615,8 @@ class QuestionDAO(LastModfiedJsonDao):
     POST_LOAD_HOOKS = []
     # Enable other modules to add post-save transformations
     POST_SAVE_HOOKS = []
+    # Enable other modules to act on deletions
+    POST_DELETE_HOOKS = []
 
     @classmethod
     def used_by(cls, question_id):
@@ -1837,6 +1927,8 @@ class QuestionGroupDAO(LastModfiedJsonDao):
     POST_LOAD_HOOKS = []
     # Enable other modules to add post-save transformations
     POST_SAVE_HOOKS = []
+    # Enable other modules to act on deletions
+    POST_DELETE_HOOKS = []
 
     @classmethod
     def get_question_groups_descriptions(cls):
@@ -24,7 +24,6 @@ from collections import defaultdict
 import courses
 import transforms
 
-from common import utils
 from models import QuestionDAO
 from models import QuestionGroupDAO
 from models import StudentPropertyEntity
@@ -101,6 +100,11 @@ class UnitLessonCompletionTracker(object):
         EVENT_CODE_MAPPING['custom_unit']
     ]
 
+    # Callbacks run after each update of the progress and before it is saved.
+    # They are called with (course, student, progress, event_entity,
+    # event_key) and may return a list of other StudentPropertyEntity
+    # instances derived from the progress; those are saved along with the
+    # progress in a single batch put, instead of by the hook itself.
     POST_UPDATE_PROGRESS_HOOK = []
 
     def __init__(self, course):
@@ -808,15 +812,18 @@ class UnitLessonCompletionTracker(object):
             return
 
         progress = self.get_or_create_progress(student)
+        hook_properties = {}
 
         self._update_event(
-            student, progress, event_entity, event_key, direct_update=True)
+            student, progress, event_entity, event_key, direct_update=True,
+            hook_properties=hook_properties)
 
         progress.updated_on = datetime.datetime.now()
-        progress.put()
+        StudentPropertyEntity.put_multi(
+            [progress] + hook_properties.values())
 
     def _update_event(self, student, progress, event_entity, event_key,
-                      direct_update=False):
+                      direct_update=False, hook_properties=None):
         """Updates statistics for the given event, and for derived events.
 
         Args:
@@ -826,7 +833,11 @@ class UnitLessonCompletionTracker(object):
           event_key: the key for the recorded event
           direct_update: True if this event is being updated explicitly; False
               if it is being auto-updated.
+          hook_properties: a dict to which the properties returned by
+              POST_UPDATE_PROGRESS_HOOK are added, keyed by key name.
         """
+        if hook_properties is None:
+            hook_properties = {}
         if direct_update or event_entity not in self.UPDATER_MAPPING:
             if event_entity in self.UPDATER_MAPPING:
                 # This is a derived event, so directly mark it as completed.
@@ -853,7 +864,8 @@ class UnitLessonCompletionTracker(object):
                             student=student,
                             progress=progress,
                             event_entity=event_entity,
-                            event_key=parent_event_key)
+                            event_key=parent_event_key,
+                            hook_properties=hook_properties)
                 else:
                     # Only update course status when we are at the top of
                     # a containment list
@@ -862,8 +874,10 @@ class UnitLessonCompletionTracker(object):
             # Or only update course status when we are doing something not
             # in derived events (Unit, typically).
             self._update_course(progress, student)
-        utils.run_hooks(self.POST_UPDATE_PROGRESS_HOOK, self._get_course(),
-                        student, progress, event_entity, event_key)
+        for hook in self.POST_UPDATE_PROGRESS_HOOK:
+            for prop in hook(self._get_course(), student, progress,
+                             event_entity, event_key) or []:
+                hook_properties[prop.key().name()] = prop
 
     def get_course_status(self, progress):
         return self._get_entity_value(progress, self._get_course_key())
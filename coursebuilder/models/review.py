@@ -79,6 +79,29 @@ class ReviewsProcessor(object):
         review_step_keys = self._get_review_step_keys_by(unit_id, reviewer_key)
         return self.get_review_steps_by_keys(unit_id, review_step_keys)
 
+    def get_review_steps_by_multi(self, unit_id, reviewer_keys):
+        """Gets the review steps in a unit for each of several reviewers.
+
+        Args:
+            unit_id: string. Id of the unit to get the review steps for.
+            reviewer_keys: [db.Key of models.models.Student]. The reviewers.
+
+        Returns:
+            [[domain.ReviewStep]], one list per reviewer key, in the order of
+            reviewer_keys. All review steps are fetched in a single batch.
+        """
+        impl = self._get_impl(unit_id)
+        keys_list = impl.get_review_step_keys_by_multi(
+            str(unit_id), reviewer_keys)
+        all_steps = self.get_review_steps_by_keys(
+            unit_id, [key for keys in keys_list for key in keys])
+        steps_list = []
+        start = 0
+        for keys in keys_list:
+            steps_list.append(all_steps[start:start + len(keys)])
+            start += len(keys)
+        return steps_list
+
     def get_reviews_by_keys(
         self, unit_id, review_keys, handle_empty_keys=False):
         """Gets a list of reviews, given their review keys.
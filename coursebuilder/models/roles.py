@@ -17,7 +17,10 @@
 __author__ = 'Pavel Simakov (psimakov@google.com)'
 
 import collections
+import threading
+
 import config
+from common import caching
 from common import utils
 from models import MemcacheManager
 from models import RoleDAO
@@ -54,9 +57,54 @@ GCB_WHITELISTED_USERS = config.ConfigProperty(
         'Regular expressions are not supported.'),
     '', multiline=True)
 
+# Int. Maximum number of distinct compiled email lists kept in process.
+MAX_COMPILED_ACL_COUNT = 500
+
 Permission = collections.namedtuple('Permission', ['name', 'description'])
 
 
+class AccessControlList(object):
+    """A pre-parsed list of email addresses.
+
+    Whitelists and admin lists are stored as free-form text. Splitting that
+    text on every check is expensive for large lists, so the text is parsed
+    once into sets and the result is kept in process, keyed by the text
+    itself. Any edit of a course whitelist, a course admin list or of the
+    global properties yields new text and thus a newly compiled list; stale
+    entries simply age out of the cache.
+    """
+
+    _CACHE = caching.LRUCache(max_item_count=MAX_COMPILED_ACL_COUNT)
+    _CACHE_LOCK = threading.Lock()
+
+    def __init__(self, text):
+        self._emails = frozenset(utils.text_to_list(
+            text, utils.BACKWARD_COMPATIBLE_SPLITTER))
+
+    @property
+    def emails(self):
+        return self._emails
+
+    def contains(self, email):
+        return bool(email) and email in self._emails
+
+    @classmethod
+    def get(cls, text):
+        """Returns a compiled list for the text, reusing a cached one."""
+        with cls._CACHE_LOCK:
+            found, acl = cls._CACHE.get(text)
+        if not found:
+            acl = cls(text)
+            with cls._CACHE_LOCK:
+                cls._CACHE.put(text, acl)
+        return acl
+
+    @classmethod
+    def clear(cls):
+        with cls._CACHE_LOCK:
+            cls._CACHE.items.clear()
+
+
 class Roles(object):
     """A class that provides information about user roles."""
 
@@ -94,11 +142,23 @@ class Roles(object):
                     return True
         return False
 
+    @classmethod
+    def is_course_admin_for(cls, admin_user_emails):
+        """Like is_course_admin(), given the admin list of the course."""
+        if cls.is_super_admin():
+            return True
+        return cls._user_email_in(users.get_current_user(), admin_user_emails)
+
     @classmethod
     def is_user_whitelisted(cls, app_context):
+        return cls.is_user_whitelisted_for(app_context.whitelist)
+
+    @classmethod
+    def is_user_whitelisted_for(cls, course_whitelist):
+        """Like is_user_whitelisted(), given the whitelist of the course."""
         user = users.get_current_user()
         global_whitelist = GCB_WHITELISTED_USERS.value.strip()
-        course_whitelist = app_context.whitelist.strip()
+        course_whitelist = (course_whitelist or '').strip()
 
         # Most-specific whitelist used if present.
         if course_whitelist:
@@ -114,8 +174,9 @@ class Roles(object):
 
     @classmethod
     def _user_email_in(cls, user, text):
-        return user and user.email() in utils.text_to_list(
-            text, utils.BACKWARD_COMPATIBLE_SPLITTER)
+        if not user or not text or not text.strip():
+            return False
+        return AccessControlList.get(text).contains(user.email())
 
     @classmethod
     def update_permissions_map(cls):
@@ -137,6 +198,13 @@ class Roles(object):
                         module_name, set())
                     module_permissions.update(permissions)
 
+        # Freeze the sets so that checks against the map are plain set lookups
+        # and the cached copy can't be modified by callers.
+        for user_permissions in permissions_map.itervalues():
+            for module_name in user_permissions:
+                user_permissions[module_name] = frozenset(
+                    user_permissions[module_name])
+
         MemcacheManager.set(cls.memcache_key, permissions_map)
         return permissions_map
 
@@ -168,7 +236,7 @@ class Roles(object):
         permissions_map = cls._load_permissions_map()
         user_permissions = permissions_map.get(
             users.get_current_user().email(), {})
-        return permission in user_permissions.get(module.name, set())
+        return permission in user_permissions.get(module.name, frozenset())
 
     @classmethod
     def register_permissions(cls, module, callback_function):
@@ -112,6 +112,21 @@ class Unsubscribe(Service):
         """
         raise NotImplementedError()
 
+    def has_unsubscribed_multi(self, emails):
+        """Check which of several users have requested to be unsubscribed.
+
+        Prefer this to calling has_unsubscribed() for each recipient of a
+        mailing; the states are looked up in batches.
+
+        Args:
+          emails: iterable of string. The email addresses of the users.
+
+        Returns:
+          dict of string to bool. Maps each email address to True if the user
+          has requested to be unsubscribed.
+        """
+        raise NotImplementedError()
+
     def set_subscribed(self, email, is_subscribed):
         """Set the state of a given user.
 
@@ -16,11 +16,13 @@
 
 __author__ = 'Pavel Simakov (psimakov@google.com)'
 
+import copy
 import datetime
 import os
 import re
 import sys
 import threading
+import time
 import unittest
 
 from config import ConfigProperty
@@ -28,6 +30,8 @@ from counters import PerfCounter
 from entities import BaseEntity
 from entities import put as entities_put
 import jinja2
+from models import CAN_USE_MEMCACHE
+from models import MemcacheManager
 
 from common import caching
 from common import jinja_utils
@@ -48,6 +52,26 @@ _MAX_VFS_SHARD_SIZE = 1000 * 1000
 # Max number of shards for a single VFS cached file.
 _MAX_VFS_NUM_SHARDS = 4
 
+# Max number of file manifests, one per namespace, kept in process.
+MAX_CACHED_MANIFEST_COUNT = 100
+
+# Max number of generations of logged changes replayed to catch up a cache;
+# caches further behind are resynchronized from the datastore.
+MAX_REPLAYED_GENERATION_COUNT = 100
+
+# Max age of the VFS generation held by a request.  Deferred tasks, cron jobs
+# and map/reduce workers are not bound to a request, and may run for longer;
+# they read the generation again once it is this old.
+MAX_VFS_GENERATION_AGE_SECONDS = 5
+
+# Max number of file metadata entities read by key in one batch while
+# building a file manifest.
+MAX_MANIFEST_BUILD_BATCH_SIZE = 500
+
+# Deletions recorded this long before the last resynchronization of a cache
+# are looked at again, to allow for clock skew between instances.
+_TOMBSTONE_OVERLAP = datetime.timedelta(seconds=10)
+
 # Global memcache controls.
 CAN_USE_VFS_IN_PROCESS_CACHE = ConfigProperty(
     'gcb_can_use_vfs_in_process_cache', bool, (
@@ -234,6 +258,11 @@ class FileDataEntity(BaseEntity):
     data = db.BlobProperty()
 
 
+class FileTombstoneEntity(BaseEntity):
+    """An entity to record a file deletion; absolute file name is a key."""
+    deleted_on = db.DateTimeProperty(indexed=True)
+
+
 class FileStreamWrapped(object):
     """A class that wraps a file stream, but adds extra attributes to it."""
 
@@ -301,6 +330,106 @@ class VirtualFileSystemTemplateLoader(jinja2.BaseLoader):
         return all_templates
 
 
+class RequestScopedVfsGenerations(caching.RequestScopedSingleton):
+    """This class holds the VFS generations seen by the current request.
+
+    Generations are kept as tuples (generation, read_at), read_at being the
+    time.time() at which the generation was read or recorded.
+    """
+
+    def __init__(self):
+        self.generations = {}
+
+
+class VfsChangeLog(object):
+    """A per-namespace generation counter and a log of changed files.
+
+    Every write to a DatastoreBackedFileSystem atomically increments the
+    generation of its namespace, a counter in memcache, and logs the files it
+    changed under the new generation. Caches remember the generation they are
+    up to date with. Checking whether anything changed is then a single
+    memcache lookup per namespace and request, and a stale cache replays the
+    logged changes to update or evict only the affected files. If some of the
+    log is missing, the cache is resynchronized from the datastore instead.
+
+    The counter starts from the current time in milliseconds, so a counter
+    evicted from memcache never reuses generations that may still be logged.
+    """
+
+    GENERATION_KEY = 'vfs:generation'
+    CHANGES_KEY = 'vfs:changes:%s'
+
+    @classmethod
+    def is_enabled(cls):
+        return CAN_USE_MEMCACHE.value
+
+    @classmethod
+    def _incr(cls, namespace, delta):
+        return MemcacheManager.incr(
+            cls.GENERATION_KEY, delta, namespace=namespace,
+            initial_value=long(time.time() * 1000))
+
+    @classmethod
+    def get_generation(cls, namespace):
+        """Returns the current generation, or None.
+
+        The generation is read once per request, and again if the request,
+        or the task not bound to any, has held it for more than
+        MAX_VFS_GENERATION_AGE_SECONDS.
+        """
+        if not cls.is_enabled():
+            return None
+        generations = RequestScopedVfsGenerations.instance().generations
+        now = time.time()
+        if (namespace not in generations or
+            now - generations[namespace][1] > MAX_VFS_GENERATION_AGE_SECONDS):
+            generations[namespace] = (cls._incr(namespace, 0), now)
+        return generations[namespace][0]
+
+    @classmethod
+    def record(cls, namespace, changes):
+        """Starts a new generation with the given changes.
+
+        Args:
+            namespace: string. The namespace of the files.
+            changes: list of tuples (filename, entry). The entry is a tuple
+                (size, updated_on) for an added or updated file, or None for a
+                deleted file.
+        """
+        if not cls.is_enabled():
+            return
+        generation = cls._incr(namespace, 1)
+        RequestScopedVfsGenerations.instance().generations[
+            namespace] = (generation, time.time())
+        if generation is not None:
+            MemcacheManager.set(
+                cls.CHANGES_KEY % generation, changes, namespace=namespace)
+
+    @classmethod
+    def get_changes(cls, namespace, since, until):
+        """Returns the changes made after generation since up to until.
+
+        Returns:
+            A list of changes as passed to record(), oldest first, or None if
+            they are not all available.
+        """
+        if since is None or until is None or since > until:
+            return None
+        if until - since > MAX_REPLAYED_GENERATION_COUNT:
+            return None
+        keys = [cls.CHANGES_KEY % generation
+                for generation in xrange(since + 1, until + 1)]
+        if not keys:
+            return []
+        logged = MemcacheManager.get_multi(keys, namespace=namespace)
+        changes = []
+        for key in keys:
+            if logged.get(key) is None:
+                return None
+            changes += logged[key]
+        return changes
+
+
 class ProcessScopedVfsCache(caching.ProcessScopedSingleton):
     """This class holds in-process global cache of VFS objects."""
 
@@ -320,6 +449,10 @@ class ProcessScopedVfsCache(caching.ProcessScopedSingleton):
             max_item_size_bytes=MAX_GLOBAL_CACHE_ITEM_SIZE_BYTES)
         self._cache.get_entry_size = self._get_entry_size
 
+        # Maps namespace to a tuple (generation, synced_on) of the last time
+        # the cache was brought up to date with the changes of the namespace.
+        self._synced = {}
+
     def _get_entry_size(self, key, value):
         return sys.getsizeof(key) + value.getsizeof() if value else 0
 
@@ -327,6 +460,10 @@ class ProcessScopedVfsCache(caching.ProcessScopedSingleton):
     def cache(self):
         return self._cache
 
+    @property
+    def synced(self):
+        return self._synced
+
 
 VFS_CACHE_LEN = PerfCounter(
     'gcb-models-VfsCacheConnection-cache-len',
@@ -403,11 +540,262 @@ class VfsCacheConnection(caching.AbstractCacheConnection):
     def __init__(self, namespace):
         super(VfsCacheConnection, self).__init__(namespace)
         self.cache = ProcessScopedVfsCache.instance().cache
+        self.synced = ProcessScopedVfsCache.instance().synced
+
+    def _get_incremental_updates(self):
+        """Gets the files changed since the cache was last synchronized.
+
+        Changes logged in VfsChangeLog are used if all are available: the
+        files they name are evicted right away, whether cached as present or
+        as missing, and no updates are returned. Otherwise the datastore is
+        queried for files updated, and files deleted, since then.
+
+        Returns:
+          an dict of {key: update} objects that represent recent updates; an
+          update of None evicts the file
+        """
+        synced_generation, synced_on = self.synced.get(
+            self.namespace, (None, None))
+        now = datetime.datetime.utcnow()
+        generation = VfsChangeLog.get_generation(self.namespace)
+        if generation is not None and generation == synced_generation:
+            return {}
+
+        changes = VfsChangeLog.get_changes(
+            self.namespace, synced_generation, generation)
+        if changes is not None:
+            # A file created since may be cached here as missing, which is
+            # up to date with an update of None; evict it rather than apply.
+            filenames = set(filename for filename, _ in changes)
+            self.CACHE_UPDATE_COUNT.inc(len(filenames))
+            for filename in filenames:
+                if self.cache.delete(self.make_key(self.namespace, filename)):
+                    self.CACHE_EVICT.inc()
+            updates = {}
+        else:
+            updates = super(VfsCacheConnection, self)._get_incremental_updates()
+            if synced_on:
+                query = FileTombstoneEntity.all().filter(
+                    'deleted_on >', synced_on - _TOMBSTONE_OVERLAP)
+                for tombstone in caching.iter_all(query):
+                    updates[tombstone.key().name()] = None
+        self.synced[self.namespace] = (generation, now)
+        return updates
+
+    def sync(self):
+        """Applies changes made by other instances since the last sync."""
+        generation = VfsChangeLog.get_generation(self.namespace)
+        if generation is None:
+            return
+        synced_generation, _ = self.synced.get(self.namespace, (None, None))
+        if generation != synced_generation:
+            self.apply_updates(self._get_incremental_updates())
 
 
 VfsCacheConnection.init_counters()
 
 
+VFS_MANIFEST_HIT = PerfCounter(
+    'gcb-models-VfsManifest-hit',
+    'A number of times a file manifest was found in process memory.')
+VFS_MANIFEST_MEMCACHE_HIT = PerfCounter(
+    'gcb-models-VfsManifest-memcache-hit',
+    'A number of times a file manifest was loaded from memcache.')
+VFS_MANIFEST_REBUILD = PerfCounter(
+    'gcb-models-VfsManifest-rebuild',
+    'A number of times a file manifest was rebuilt from the datastore.')
+
+
+class ProcessScopedVfsManifestCache(caching.ProcessScopedSingleton):
+    """This class holds in-process copies of the VFS file manifests."""
+
+    def __init__(self):
+        self.cache = caching.LRUCache(max_item_count=MAX_CACHED_MANIFEST_COUNT)
+        self.lock = threading.Lock()
+
+
+class VfsManifest(object):
+    """A tree of all file paths of a namespace with their sizes and timestamps.
+
+    Listing files used to fetch the keys of all files of a namespace and to
+    filter them by prefix, and every existence check used to read a datastore
+    row. The manifest holds the same information as a tree of dicts, one per
+    folder, so listing a folder is a walk of its subtree and an existence
+    check of a file that is there is a lookup. Folders are keyed by their
+    name followed by '/' and map to their own dict; files are keyed by their
+    name and map to a tuple (size, updated_on).
+
+    The manifest is kept in memcache, in the namespace it describes, and in
+    process memory, along with the VfsChangeLog generation it is up to date
+    with. An older copy is brought up to date by replaying the logged
+    changes, and is only rebuilt from the datastore if they are missing.
+    Without memcache no copy could be kept consistent across instances, so the
+    manifest is not used at all.
+    """
+
+    MEMCACHE_KEY = 'vfs:manifest'
+
+    @classmethod
+    def _split(cls, filename):
+        return filename.lstrip('/').split('/')
+
+    @classmethod
+    def _add(cls, tree, filename, entry):
+        parts = cls._split(filename)
+        node = tree
+        for part in parts[:-1]:
+            node = node.setdefault(part + '/', {})
+        node[parts[-1]] = entry
+
+    @classmethod
+    def _remove(cls, tree, filename):
+        parts = cls._split(filename)
+        nodes = [tree]
+        for part in parts[:-1]:
+            node = nodes[-1].get(part + '/')
+            if node is None:
+                return
+            nodes.append(node)
+        nodes[-1].pop(parts[-1], None)
+
+        # Prune folders left empty, deepest first.
+        for index in xrange(len(nodes) - 1, 0, -1):
+            if nodes[index]:
+                break
+            del nodes[index - 1][parts[index - 1] + '/']
+
+    @classmethod
+    def _walk(cls, node, prefix, result):
+        for name, child in node.iteritems():
+            if name.endswith('/'):
+                cls._walk(child, prefix + name, result)
+            else:
+                result.append(prefix + name)
+
+    @classmethod
+    def _build(cls):
+        """Builds the tree of files from the datastore.
+
+        Queries are eventually consistent and may still list a file that was
+        just deleted, so the files listed are read again by key, which is
+        consistent, and only those found are added.
+        """
+        VFS_MANIFEST_REBUILD.inc()
+        tree = {}
+        keys = list(caching.iter_all(FileMetadataEntity.all(keys_only=True)))
+        for start in xrange(0, len(keys), MAX_MANIFEST_BUILD_BATCH_SIZE):
+            for metadata in db.get(
+                keys[start:start + MAX_MANIFEST_BUILD_BATCH_SIZE]):
+                if metadata:
+                    cls._add(tree, metadata.key().name(), (
+                        metadata.size, metadata.updated_on))
+        return tree
+
+    @classmethod
+    def _get_cached(cls, namespace):
+        instance = ProcessScopedVfsManifestCache.instance()
+        with instance.lock:
+            found, cached = instance.cache.get(namespace)
+        return cached if found else None
+
+    @classmethod
+    def _put_cached(cls, namespace, generation, tree):
+        instance = ProcessScopedVfsManifestCache.instance()
+        with instance.lock:
+            instance.cache.put(namespace, (generation, tree))
+
+    @classmethod
+    def _catch_up(cls, namespace, generation, cached):
+        """Replays logged changes onto a cached (generation, tree) tuple."""
+        cached_generation, tree = cached
+        changes = VfsChangeLog.get_changes(
+            namespace, cached_generation, generation)
+        if changes is None:
+            return None
+        if changes:
+            tree = copy.deepcopy(tree)
+            for filename, entry in changes:
+                if entry:
+                    cls._add(tree, filename, entry)
+                else:
+                    cls._remove(tree, filename)
+        return tree
+
+    @classmethod
+    def get(cls, namespace):
+        """Returns the manifest of the current namespace, building if needed.
+
+        Args:
+            namespace: string. The current namespace; used to find the copy
+                kept in process memory.
+
+        Returns:
+            The tree of files, which must not be modified, or None if the
+            manifest is not enabled.
+        """
+        generation = VfsChangeLog.get_generation(namespace)
+        if generation is None:
+            return None
+        cached = cls._get_cached(namespace)
+        if cached and cached[0] == generation:
+            VFS_MANIFEST_HIT.inc()
+            return cached[1]
+
+        tree = None
+        if cached:
+            tree = cls._catch_up(namespace, generation, cached)
+        if tree is None:
+            cached = MemcacheManager.get(cls.MEMCACHE_KEY, namespace=namespace)
+            if cached:
+                VFS_MANIFEST_MEMCACHE_HIT.inc()
+                if cached[0] >= generation:
+                    cls._put_cached(namespace, cached[0], cached[1])
+                    return cached[1]
+                tree = cls._catch_up(namespace, generation, cached)
+        if tree is None:
+            # A tree built now includes all changes up to the generation read
+            # before; replaying any of them again later is harmless.
+            tree = cls._build()
+        MemcacheManager.set(
+            cls.MEMCACHE_KEY, (generation, tree), namespace=namespace)
+        cls._put_cached(namespace, generation, tree)
+        return tree
+
+    @classmethod
+    def isfile(cls, tree, filename):
+        parts = cls._split(filename)
+        node = tree
+        for part in parts[:-1]:
+            node = node.get(part + '/')
+            if node is None:
+                return False
+        return parts[-1] in node
+
+    @classmethod
+    def list(cls, tree, prefix):
+        """Lists all files with names starting with prefix, unsorted."""
+        if not prefix:
+            prefix = '/'
+        if not prefix.startswith('/'):
+            return []
+        parts = cls._split(prefix)
+        node = tree
+        for part in parts[:-1]:
+            node = node.get(part + '/')
+            if node is None:
+                return []
+        folder = '/' + ''.join(part + '/' for part in parts[:-1])
+        result = []
+        for name, child in node.iteritems():
+            if not name.startswith(parts[-1]):
+                continue
+            if name.endswith('/'):
+                cls._walk(child, folder + name, result)
+            else:
+                result.append(folder + name)
+        return result
+
+
 class DatastoreBackedFileSystem(object):
     """A read-write file system backed by a datastore."""
 
@@ -481,6 +869,9 @@ class DatastoreBackedFileSystem(object):
                     if not hasattr(self._cache, 'connection'):
                         self._cache.connection = (
                             VfsCacheConnection.new_connection(self.ns))
+                    elif isinstance(
+                        self._cache.connection, VfsCacheConnection):
+                        self._cache.connection.sync()
                     return attr(*args, **kwargs)
                 finally:
                     namespace_manager.set_namespace(old_namespace)
@@ -596,12 +987,14 @@ class DatastoreBackedFileSystem(object):
             content = stream.read()
         else:
             content = stream
-        self._transactional_put(filename, content, is_draft, metadata_only)
+        metadata = self._transactional_put(
+            filename, content, is_draft, metadata_only)
+        self._record_changes([metadata])
 
     @db.transactional(xg=True)
     def _transactional_put(
         self, filename, stream, is_draft=False, metadata_only=False):
-        self.non_transactional_put(
+        return self._put(
             filename, stream, is_draft=is_draft, metadata_only=metadata_only)
 
     @classmethod
@@ -645,6 +1038,17 @@ class DatastoreBackedFileSystem(object):
     def non_transactional_put(
         self, filename, content, is_draft=False, metadata_only=False):
         """Non-transactional put; use only when transactions are impossible."""
+        metadata = self._put(
+            filename, content, is_draft=is_draft, metadata_only=metadata_only)
+        self._record_changes([metadata])
+
+    def _record_changes(self, metadata_list):
+        VfsChangeLog.record(self._ns, [
+            (metadata.key().name(), (metadata.size, metadata.updated_on))
+            for metadata in metadata_list])
+
+    def _put(self, filename, content, is_draft=False, metadata_only=False):
+        """Writes the entities of a file; returns its FileMetadataEntity."""
         filename = self._logical_to_physical(filename)
 
         metadata = FileMetadataEntity.get_by_key_name(filename)
@@ -672,6 +1076,7 @@ class DatastoreBackedFileSystem(object):
 
         metadata.put()
         self.cache.delete(filename)
+        return metadata
 
     def put_multi_async(self, filedata_list):
         """Initiate an async put of the given files.
@@ -729,25 +1134,38 @@ class DatastoreBackedFileSystem(object):
         def wait_and_finalize():
             data_future.check_success()
             metadata_future.check_success()
+            self._record_changes(metadata_list)
 
         return wait_and_finalize
 
-    @db.transactional(xg=True)
     def delete(self, filename):
         filename = self._logical_to_physical(filename)
+        self._transactional_delete(filename)
+        VfsChangeLog.record(self._ns, [(filename, None)])
+
+    @db.transactional(xg=True)
+    def _transactional_delete(self, filename):
         metadata = FileMetadataEntity.get_by_key_name(filename)
         if metadata:
             metadata.delete()
+            FileTombstoneEntity(
+                key_name=filename,
+                deleted_on=datetime.datetime.utcnow()).put()
         data = FileDataEntity(key_name=filename)
         if data:
             data.delete()
         self.cache.delete(filename)
 
     def isfile(self, afilename):
-        """Checks file existence by looking up the datastore row."""
+        """Checks file existence in the manifest or the datastore row."""
         filename = self._logical_to_physical(afilename)
-        metadata = FileMetadataEntity.get_by_key_name(filename)
-        if metadata:
+        manifest = VfsManifest.get(self._ns)
+        if manifest is not None and VfsManifest.isfile(manifest, filename):
+            return True
+
+        # The manifest is built by an eventually consistent query, which may
+        # leave out files written just before; only a keyed get is certain.
+        if FileMetadataEntity.get_by_key_name(filename):
             return True
         result = False
         if self._inherits_from and self._can_inherit(filename):
@@ -768,11 +1186,13 @@ class DatastoreBackedFileSystem(object):
         """
         dir_name = self._logical_to_physical(dir_name)
         result = set()
-        keys = FileMetadataEntity.all(keys_only=True)
-        for key in keys.fetch(1000):
-            filename = key.name()
-            if filename.startswith(dir_name):
-                result.add(self._physical_to_logical(filename))
+        manifest = VfsManifest.get(self._ns)
+        if manifest is not None:
+            filenames = VfsManifest.list(manifest, dir_name)
+        else:
+            filenames = self._list_by_key_range(dir_name)
+        for filename in filenames:
+            result.add(self._physical_to_logical(filename))
         if include_inherited and self._inherits_from:
             for inheritable_folder in self._inheritable_folders:
                 logical_folder = self._physical_to_logical(inheritable_folder)
@@ -781,6 +1201,17 @@ class DatastoreBackedFileSystem(object):
                     include_inherited)))
         return sorted(list(result))
 
+    def _list_by_key_range(self, dir_name):
+        """Yields names of all files starting with dir_name from datastore."""
+        query = FileMetadataEntity.all(keys_only=True)
+        if dir_name:
+            kind = FileMetadataEntity.kind()
+            query.filter('__key__ >=', db.Key.from_path(kind, dir_name))
+            query.filter(
+                '__key__ <', db.Key.from_path(kind, dir_name + u'\ufffd'))
+        for key in caching.iter_all(query):
+            yield key.name()
+
     def get_jinja_environ(self, dir_names, autoescape=True):
         return jinja_utils.create_jinja_environment(
             loader=VirtualFileSystemTemplateLoader(
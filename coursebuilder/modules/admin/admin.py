@@ -372,7 +372,8 @@ class BaseAdminHandler(ConfigPropertyEditor):
             config.Registry.last_update_time)
         perf_counters['gcb-config-update-index'] = config.Registry.update_index
 
-        # add all registered counters
+        # add all registered counters, including increments not yet flushed
+        counters.Registry.flush_global_values()
         all_counters = counters.Registry.registered.copy()
         for name in all_counters.keys():
             global_value = all_counters[name].global_value
@@ -18,16 +18,18 @@
 __author__ = 'Milagro Teruel (milit@google.com)'
 
 import appengine_config
+import bisect
 import collections
+import hashlib
 import json
 import math
 import os
 import urllib
-import zlib
 
 from mapreduce import context
 
 from common import schema_fields
+from common import utils as common_utils
 from controllers import utils
 from models import courses
 from models import jobs
@@ -461,6 +463,8 @@ class StudentVector(BaseEntity):
         }
     """
     vector = db.TextProperty(indexed=False)
+    # Only changes when the vector does; see StudentVectorGenerator.map().
+    updated_on = db.DateTimeProperty(auto_now=True, indexed=True)
     # TODO(milit): add a data source type so that all entities of this type
     # can be exported via data pump for external analysis.
 
@@ -495,14 +499,45 @@ class StudentClusters(BaseEntity):
     distance values for a given distance type (Hamming as default). This
     distances are claculated using the job ClusteringGenerator. For example:
         {'1': 3, '2': 0, ... }
+    The attribute sequence_num is the sequence number of the ClusteringGenerator
+    run that wrote the entity. For incremental runs, previous_clusters holds
+    the clusters attribute from before that run, so that a retried map of the
+    same run can still subtract the memberships counted by the previous run.
     """
     clusters = db.TextProperty(indexed=False)
+    previous_clusters = db.TextProperty(indexed=False)
+    sequence_num = db.IntegerProperty(indexed=False)
 
     @classmethod
     def safe_key(cls, db_key, transform_fn):
         return db.Key.from_path(cls.kind(), transform_fn(db_key.id_or_name()))
 
 
+class ClusteringWatermarkEntity(BaseEntity):
+    """Records which StudentVector changes are included in StudentClusters.
+
+    There is one of these per course.  'until' is set once the run that
+    evaluated all StudentVectors updated before that time has completed;
+    'results' then holds the statistics over all students as of that run,
+    and 'clusters_fingerprint' identifies the clusters it used.  The values
+    for the run in progress are kept in the 'pending_' fields until then.
+    They are written in the transaction that creates the run, so that
+    'pending_sequence_num' is always the sequence number of that run.  For
+    an incremental run, 'pending_base_results' holds the statistics the
+    run's changes are added to.
+    """
+
+    KEY_NAME = 'watermark'
+
+    until = db.DateTimeProperty(indexed=False)
+    clusters_fingerprint = db.StringProperty(indexed=False)
+    results = db.TextProperty(indexed=False)
+    pending_until = db.DateTimeProperty(indexed=False)
+    pending_sequence_num = db.IntegerProperty(indexed=False)
+    pending_clusters_fingerprint = db.StringProperty(indexed=False)
+    pending_base_results = db.TextProperty(indexed=False)
+
+
 class StudentVectorGenerator(jobs.MapReduceJob):
     """A map reduce job to create StudentVector.
 
@@ -570,7 +605,7 @@ class StudentVectorGenerator(jobs.MapReduceJob):
         from the assessment data in item.
         """
         mapper_params = context.get().mapreduce_spec.mapper.params
-        raw_data = transforms.loads(zlib.decompress(item.data))
+        raw_data = item.get_data()
 
         raw_assessments = raw_data.get('assessments', [])
         sub_data = StudentVectorGenerator._inverse_submission_data(
@@ -608,8 +643,12 @@ class StudentVectorGenerator(jobs.MapReduceJob):
                 DIM_ID: dim[DIM_ID],
                 DIM_VALUE: value}
             vector.append(new_dim)
-        StudentVector(key_name=str(item.key().name()),
-                      vector=transforms.dumps(vector)).put()
+        vector = transforms.dumps(vector)
+        student_vector = StudentVector.get_by_key_name(user_id)
+        if student_vector and student_vector.vector == vector:
+            # Keeps updated_on, so incremental clustering skips the student.
+            return
+        StudentVector(key_name=str(user_id), vector=vector).put()
 
     @staticmethod
     def reduce(item_id, values):
@@ -770,7 +809,19 @@ class StudentVectorGenerator(jobs.MapReduceJob):
         return 0
 
 
-def hamming_distance(vector, student_vector):
+def _get_student_values(student_vector):
+    """Maps (DIM_TYPE, DIM_ID as string) to the values of a StudentVector.
+
+    If a dimension appears several times, the first value is kept, like
+    StudentVector.get_dimension_value() does.
+    """
+    values = {}
+    for dim in student_vector:
+        values.setdefault((dim[DIM_TYPE], str(dim[DIM_ID])), dim[DIM_VALUE])
+    return values
+
+
+def hamming_distance(vector, student_vector, max_distance=None):
     """Return the hamming distance between a ClusterEntity and a StudentVector.
 
     The hamming distance between an ClusterEntity and a StudentVector is the
@@ -782,10 +833,10 @@ def hamming_distance(vector, student_vector):
     Params:
         vector: the vector field of a ClusterEntity instance.
         student_vector: the vector field of a StudentVector instance.
+        max_distance: if given, the calculation stops as soon as the
+            distance is known to be greater than max_distance, and
+            max_distance + 1 is returned.
     """
-    # TODO(milit): As we are discarding all distances greater than
-    # ClusteringGenerator.MAX_DISTANCE, add it as a parameter so we stop
-    # calculating the distance once this limit is reached.
     def fits_left_side(dim, value):
         """_has_left_side(dim) -> dim[DIM_LOW] <= value"""
         return not _has_left_side(dim) or dim[DIM_LOW] <= value
@@ -794,17 +845,209 @@ def hamming_distance(vector, student_vector):
         """_has_right_side(dim) -> dim[DIM_HIGH] >= value"""
         return not _has_right_side(dim) or dim[DIM_HIGH] >= value
 
+    values = _get_student_values(student_vector)
     distance = 0
     for dim in vector:
-        value = StudentVector.get_dimension_value(student_vector,
-                                                  dim[DIM_ID], dim[DIM_TYPE])
+        value = values.get((dim[DIM_TYPE], str(dim[DIM_ID])))
         if not value:
             value = 0
         if not fits_left_side(dim, value) or not fits_right_side(dim, value):
             distance += 1
+            if max_distance is not None and distance > max_distance:
+                break
     return distance
 
 
+class PackedClusterVectors(object):
+    """Encodes the vectors of a set of clusters as packed integers.
+
+    The bounds used by all the clusters in one dimension split the possible
+    student values into classes: each bound is a class, and so is each open
+    interval between two consecutive bounds. Every student value of the
+    dimension belongs to exactly one class, and every class is either
+    entirely inside or entirely outside the range of each cluster.
+
+    A student vector is encoded as an integer with one bit set for each
+    dimension, the bit of the class of the student value. A cluster is
+    encoded as an integer with the bits of all the classes outside its
+    ranges set. The hamming distance between them is then the number of bits
+    set in the AND of both integers, and the cost of comparing a student
+    with every cluster no longer depends on the number of dimensions.
+    """
+
+    def __init__(self, clusters):
+        """Creates the encoding.
+
+        Args:
+            clusters: a list of dictionaries with the 'id' and the 'vector'
+                of each cluster, as passed to ClusteringGenerator.
+        """
+        bounds_by_key = {}
+        for cluster in clusters:
+            for dim in cluster['vector']:
+                bounds = bounds_by_key.setdefault(
+                    (dim[DIM_TYPE], str(dim[DIM_ID])), set())
+                if _has_left_side(dim):
+                    bounds.add(dim[DIM_LOW])
+                if _has_right_side(dim):
+                    bounds.add(dim[DIM_HIGH])
+        # Each dimension takes 2 * len(bounds) + 1 consecutive bits,
+        # starting at its offset.
+        self._dimensions = {}
+        offset = 0
+        for key, bounds in sorted(bounds_by_key.items()):
+            self._dimensions[key] = (sorted(bounds), offset)
+            offset += 2 * len(bounds) + 1
+        self.clusters = [
+            (cluster['id'], self._encode_cluster(cluster['vector']))
+            for cluster in clusters]
+
+    @staticmethod
+    def _get_class(bounds, value):
+        """Returns the index of the class of value: odd for bounds."""
+        index = bisect.bisect_left(bounds, value)
+        if index < len(bounds) and bounds[index] == value:
+            return 2 * index + 1
+        return 2 * index
+
+    @staticmethod
+    def _class_fits(dim, bounds, class_index):
+        """Returns True if the values of the class are inside dim range."""
+        index = class_index // 2
+        if class_index % 2:
+            lowest = highest = bounds[index]
+        else:
+            # An open interval; the bounds of dim are in bounds, so the
+            # interval fits if its ends do.
+            lowest = bounds[index - 1] if index > 0 else None
+            highest = bounds[index] if index < len(bounds) else None
+        if _has_left_side(dim) and (lowest is None or dim[DIM_LOW] > lowest):
+            return False
+        if _has_right_side(dim) and (
+            highest is None or dim[DIM_HIGH] < highest):
+            return False
+        return True
+
+    def _encode_cluster(self, vector):
+        encoded = 0
+        for dim in vector:
+            bounds, offset = self._dimensions[
+                (dim[DIM_TYPE], str(dim[DIM_ID]))]
+            for class_index in xrange(2 * len(bounds) + 1):
+                if not self._class_fits(dim, bounds, class_index):
+                    encoded |= 1 << (offset + class_index)
+        return encoded
+
+    def encode_student(self, student_vector):
+        """Returns the packed integer for the vector of a StudentVector."""
+        values = _get_student_values(student_vector)
+        encoded = 0
+        for key, (bounds, offset) in self._dimensions.iteritems():
+            value = values.get(key)
+            if not value:
+                value = 0
+            encoded |= 1 << (offset + self._get_class(bounds, value))
+        return encoded
+
+    def get_distances(self, student_vector, max_distance=None):
+        """Yields (cluster_id, distance) for each cluster, in order.
+
+        The distance is the same returned by hamming_distance(). Clusters
+        farther than max_distance, if given, are skipped.
+        """
+        encoded = self.encode_student(student_vector)
+        for cluster_id, cluster_encoded in self.clusters:
+            distance = bin(encoded & cluster_encoded).count('1')
+            if max_distance is None or distance <= max_distance:
+                yield cluster_id, distance
+
+
+class ClusteringMapContext(object):
+    """Objects shared by all map() calls of one ClusteringGenerator run.
+
+    The clusters are encoded once per job run in each process rather than
+    once per Student.
+    """
+
+    _current = None
+
+    def __init__(self, mapreduce_id, params):
+        self.mapreduce_id = mapreduce_id
+        self.max_distance = params['max_distance']
+        self.packed_clusters = PackedClusterVectors(params['clusters'])
+
+    @classmethod
+    def get(cls):
+        mapreduce_spec = context.get().mapreduce_spec
+        current = cls._current
+        if not current or current.mapreduce_id != mapreduce_spec.mapreduce_id:
+            current = cls(
+                mapreduce_spec.mapreduce_id, mapreduce_spec.mapper.params)
+            cls._current = current
+        return current
+
+
+def _add_distance_lists(total, distances, cumulative):
+    """Adds distances to total in place, extending the shorter of them.
+
+    Missing values of count lists are 0; those of cumulative intersection
+    lists are the same as the last value.
+    """
+    if len(total) < len(distances):
+        total.extend(
+            [total[-1] if cumulative and total else 0] *
+            (len(distances) - len(total)))
+    for index in range(len(total)):
+        if index < len(distances):
+            total[index] += distances[index]
+        elif cumulative and distances:
+            total[index] += distances[-1]
+
+
+def merge_statistics(results, deltas):
+    """Adds the statistics of an incremental ClusteringGenerator run.
+
+    Args:
+        results: a list with the results of a ClusteringGenerator run, as
+            returned by jobs.MapReduceJob.get_results().
+        deltas: a list with the changes to those results, in the same format
+            but with counts that may be negative.
+
+    Returns:
+        A list with the merged statistics, in the form a full run over the
+        same students would have produced.
+    """
+    counts = {}
+    intersections = {}
+    student_count = None
+    for stats in (results, deltas):
+        for stat_name, value in stats:
+            if stat_name == 'student_count':
+                student_count = (student_count or 0) + value
+            elif stat_name == 'count':
+                _add_distance_lists(
+                    counts.setdefault(value[0], []), value[1], False)
+            elif stat_name == 'intersection':
+                _add_distance_lists(
+                    intersections.setdefault(tuple(value[0]), []), value[1],
+                    True)
+
+    merged = []
+    for cluster_id, distances in counts.iteritems():
+        while distances and not distances[-1]:
+            distances.pop()
+        if distances:
+            merged.append(['count', [cluster_id, distances]])
+    for cluster_ids, distances in intersections.iteritems():
+        while len(distances) > 1 and distances[-1] == distances[-2]:
+            distances.pop()
+        if distances and distances != [0]:
+            merged.append(['intersection', [list(cluster_ids), distances]])
+    if student_count is not None:
+        merged.append(['student_count', student_count])
+    return merged
+
+
 class ClusteringGenerator(jobs.MapReduceJob):
     """A map reduce job to calculate which students belong to each cluster.
 
@@ -820,25 +1063,215 @@ class ClusteringGenerator(jobs.MapReduceJob):
 
     In the reduce step it returns calculated two statistics: the number of
     students in each cluster and the intersection of pairs of clusters.
+
+    Once a run has completed, the next run is incremental as long as the
+    clusters have not changed: it maps only the StudentVectors updated since
+    the previous run started.  For each of them, the memberships stored in
+    StudentClusters are subtracted from the statistics and the new ones
+    added, so the run yields the changes to the previous statistics;
+    get_statistics() adds them up.  After a failed or canceled run, or when
+    constructed with full_rebuild=True, all students are evaluated again.
     """
     MAX_DISTANCE = 2
 
+    VECTORS_SINCE_PARAM = 'clustering_vectors_since'
+    VECTORS_UNTIL_PARAM = 'clustering_vectors_until'
+    SEQUENCE_NUM_PARAM = 'clustering_sequence_num'
+
+    def __init__(self, app_context, full_rebuild=False):
+        super(ClusteringGenerator, self).__init__(app_context)
+        self._full_rebuild = full_rebuild
+        self._next_run = None
+
     # TODO(milit): Add settings to disable heavy statistics.
     @staticmethod
     def get_description():
         return 'StudentVector clusterization'
 
-    @classmethod
-    def entity_class(cls):
+    def entity_class(self):
+        if self._get_next_run()[3]:
+            return StudentVector
         return models.Student
 
+    def _get_clusters_fingerprint(self, clusters):
+        return hashlib.md5(transforms.dumps(
+            [clusters, self.MAX_DISTANCE], sort_keys=True)).hexdigest()
+
+    def _get_next_run(self):
+        """Decides how the next run is done; the result is cached.
+
+        Returns:
+            A tuple (watermark, clusters, clusters_fingerprint, since).
+            'since' is when the last completed run started, or None if all
+            students need to be evaluated.
+        """
+        if self._next_run:
+            return self._next_run
+        with common_utils.Namespace(self._namespace):
+            clusters = [{'id': cluster.id, 'vector': cluster.vector}
+                        for cluster in ClusterDAO.get_all()]
+            fingerprint = self._get_clusters_fingerprint(clusters)
+            job = self.load()
+            watermark = ClusteringWatermarkEntity.get_by_key_name(
+                ClusteringWatermarkEntity.KEY_NAME)
+            if not watermark:
+                watermark = ClusteringWatermarkEntity(
+                    key_name=ClusteringWatermarkEntity.KEY_NAME)
+            elif job and watermark.pending_sequence_num == job.sequence_num:
+                if job.status_code == jobs.STATUS_CODE_COMPLETED:
+                    watermark.results = transforms.dumps(
+                        self.get_statistics(job, watermark))
+                    watermark.until = watermark.pending_until
+                    watermark.clusters_fingerprint = (
+                        watermark.pending_clusters_fingerprint)
+                else:
+                    # StudentClusters may have been partially updated.
+                    watermark.until = None
+        since = None
+        if (not self._full_rebuild and watermark.until and
+            watermark.results is not None and
+            watermark.clusters_fingerprint == fingerprint):
+            since = watermark.until
+        self._next_run = (watermark, clusters, fingerprint, since)
+        return self._next_run
+
+    def _update_watermark(self):
+        """Prepares a new run in the watermark; returns its (since, until).
+
+        The watermark is saved by non_transactional_submit(), along with the
+        sequence number of the run.
+        """
+        watermark, unused_clusters, fingerprint, since = self._get_next_run()
+        watermark.pending_until = db.DateTimeProperty.now()
+        watermark.pending_sequence_num = None
+        watermark.pending_clusters_fingerprint = fingerprint
+        watermark.pending_base_results = None
+        if since:
+            # Students enrolled since the last run have no StudentClusters
+            # yet, whether or not they have a StudentVector.
+            new_students = models.Student.all(keys_only=True).filter(
+                'enrolled_on >=', since).filter(
+                'enrolled_on <', watermark.pending_until).count(limit=None)
+            watermark.pending_base_results = transforms.dumps(merge_statistics(
+                transforms.loads(watermark.results),
+                [['student_count', new_students]]))
+        return since, watermark.pending_until
+
     def build_additional_mapper_params(self, app_context):
-        clusters = [{'id': cluster.id, 'vector': cluster.vector}
-                    for cluster in ClusterDAO.get_all()]
-        return {
-            'clusters': clusters,
-            'max_distance': getattr(self, 'MAX_DISTANCE', 2)
+        since, until = self._update_watermark()
+        params = {
+            'clusters': self._get_next_run()[1],
+            'max_distance': getattr(self, 'MAX_DISTANCE', 2),
+            self.VECTORS_UNTIL_PARAM: until,
         }
+        if since:
+            params[self.VECTORS_SINCE_PARAM] = since
+            params['filters'] = [('updated_on', '>=', since)]
+        return params
+
+    def non_transactional_submit(self):
+        if self.is_active():
+            return -1
+        # Runs in the transaction that creates the new run, so the sequence
+        # number read here is the one it gets.
+        job = self.load()
+        sequence_num = (job.sequence_num if job and job.sequence_num else 0) + 1
+        self.mapper_params[self.SEQUENCE_NUM_PARAM] = sequence_num
+        ret = super(ClusteringGenerator, self).non_transactional_submit()
+        if ret == sequence_num:
+            watermark = self._get_next_run()[0]
+            watermark.pending_sequence_num = sequence_num
+            watermark.put()
+        return ret
+
+    @staticmethod
+    def get_statistics(job, watermark=None):
+        """Returns the statistics over all students as of a completed run.
+
+        The results of an incremental run are the changes to the statistics
+        of the previous run, and are added to them here.  Must be called in
+        the namespace of the course.
+        """
+        results = jobs.MapReduceJob.get_results(job)
+        if watermark is None:
+            watermark = ClusteringWatermarkEntity.get_by_key_name(
+                ClusteringWatermarkEntity.KEY_NAME)
+        if (results is not None and watermark and
+            watermark.pending_sequence_num == job.sequence_num and
+            watermark.pending_base_results is not None):
+            results = merge_statistics(
+                transforms.loads(watermark.pending_base_results), results)
+        return results
+
+    @staticmethod
+    def _get_membership_outputs(user_id, distances, weight):
+        """Yields the map output for the memberships of one student.
+
+        Args:
+            user_id: the id of the student.
+            distances: a list of (cluster_id, distance) pairs, in the order
+                of the clusters in the mapper params.
+            weight: 1 to add the memberships to the statistics, or -1 to
+                remove them.
+        """
+        previous = []
+        for cluster_id, distance in distances:
+            for cluster2_id, distance2 in previous:
+                key = transforms.dumps((cluster2_id, cluster_id))
+                value = (user_id, distance, distance2, weight)
+                yield (key, transforms.dumps(value))
+            previous.append((cluster_id, distance))
+            to_yield = (user_id, distance, weight)
+            yield(cluster_id, transforms.dumps(to_yield))
+
+    @staticmethod
+    def _evaluate_student(user_id, student_vector, previous_clusters=None):
+        """Returns the distances of a student, and saves them.
+
+        The distances are a list of (cluster_id, distance) pairs, in the
+        order of the clusters in the mapper params.  previous_clusters are
+        the memberships counted by the previous run, if any.
+        """
+        map_context = ClusteringMapContext.get()
+        distances = list(map_context.packed_clusters.get_distances(
+            transforms.loads(student_vector.vector), map_context.max_distance))
+        sequence_num = context.get().mapreduce_spec.mapper.params.get(
+            ClusteringGenerator.SEQUENCE_NUM_PARAM)
+        # Written in batches with the other mutations of the slice.
+        context.get().get_pool('mutation_pool').put(StudentClusters(
+            key_name=user_id, clusters=transforms.dumps(dict(distances)),
+            previous_clusters=previous_clusters, sequence_num=sequence_num))
+        return distances
+
+    @staticmethod
+    def _map_updated_vector(student_vector):
+        """Yields the changes to the statistics of an updated StudentVector."""
+        user_id = student_vector.key().name()
+        sequence_num = context.get().mapreduce_spec.mapper.params.get(
+            ClusteringGenerator.SEQUENCE_NUM_PARAM)
+        stored = StudentClusters.get_by_key_name(user_id)
+        previous_clusters = None
+        if stored and stored.sequence_num == sequence_num:
+            # Already evaluated by an earlier attempt of this run.
+            previous_clusters = stored.previous_clusters
+        elif stored:
+            previous_clusters = stored.clusters
+        if previous_clusters:
+            # The cluster ids were converted to strings by JSON.
+            previous_distances = transforms.loads(previous_clusters)
+            distances = [
+                (cluster_id, previous_distances[str(cluster_id)])
+                for cluster_id, _ in (
+                    ClusteringMapContext.get().packed_clusters.clusters)
+                if str(cluster_id) in previous_distances]
+            for output in ClusteringGenerator._get_membership_outputs(
+                user_id, distances, -1):
+                yield output
+        distances = ClusteringGenerator._evaluate_student(
+            user_id, student_vector, previous_clusters)
+        for output in ClusteringGenerator._get_membership_outputs(
+            user_id, distances, 1):
+            yield output
 
     @staticmethod
     def map(item):
@@ -849,37 +1282,38 @@ class ClusteringGenerator(jobs.MapReduceJob):
 
         Yields:
             Pairs (key, value). There are two types of keys:
-                1.  A cluster id: the value is a tuple (student_id, distance).
-                2.  A pair of clusters ids: the value is a 3-uple
-                    (student_id, distance1, distance2)
+                1.  A cluster id: the value is a tuple
+                    (student_id, distance, weight).
+                2.  A pair of clusters ids: the value is a 4-uple
+                    (student_id, distance1, distance2, weight)
                     distance1 is the distance from the student vector to the
                     cluster with the first id of the tuple and distance2 is
                     the distance to the second cluster in the tuple.
                 3.  A string 'student_count' with value 1.
             One result is yielded for every cluster id and pair of clusters
             ids. If (cluster1_id, cluster2_id) is yielded, then
-            (cluster2_id, cluster1_id) won't be yielded.
+            (cluster2_id, cluster1_id) won't be yielded. The weight is 1,
+            or -1 in incremental runs for the memberships a student had
+            before its StudentVector was updated; item is then the
+            StudentVector, and no 'student_count' is yielded.
         """
+        params = context.get().mapreduce_spec.mapper.params
+        if ClusteringGenerator.VECTORS_SINCE_PARAM in params:
+            for output in ClusteringGenerator._map_updated_vector(item):
+                yield output
+            return
+
         student = StudentVector.get_by_key_name(item.user_id)
         if student:
-            mapper_params = context.get().mapreduce_spec.mapper.params
-            max_distance = mapper_params['max_distance']
-            clusters = {}
-            item_vector = transforms.loads(student.vector)
-            for cluster in mapper_params['clusters']:
-                distance = hamming_distance(cluster['vector'], item_vector)
-                if distance > max_distance:
-                    continue
-                for cluster2_id, distance2 in clusters.items():
-                    key = transforms.dumps((cluster2_id, cluster['id']))
-                    value = (item.user_id, distance, distance2)
-                    yield (key, transforms.dumps(value))
-                clusters[cluster['id']] = distance
-                to_yield = (item.user_id, distance)
-                yield(cluster['id'], transforms.dumps(to_yield))
-            clusters = transforms.dumps(clusters)
-            StudentClusters(key_name=item.user_id, clusters=clusters).put()
-        yield ('student_count', 1)
+            distances = ClusteringGenerator._evaluate_student(
+                item.user_id, student)
+            for output in ClusteringGenerator._get_membership_outputs(
+                item.user_id, distances, 1):
+                yield output
+        # Students enrolled later are counted by the next incremental run.
+        if (not item.enrolled_on or item.enrolled_on <
+            params[ClusteringGenerator.VECTORS_UNTIL_PARAM]):
+            yield ('student_count', 1)
 
     @staticmethod
     def combine(key, values, previously_combined_outputs=None):
@@ -907,11 +1341,11 @@ class ClusteringGenerator(jobs.MapReduceJob):
     def reduce(item_id, values):
         """
         This function can take two types of item_id (as json string).
-            A number: the values are 2-uples (student_id, distance) and is
-            used to calculate a count statistic.
+            A number: the values are 3-uples (student_id, distance, weight)
+            and is used to calculate a count statistic.
             A list: the item_id holds the IDs of two clusters and the value
-            corresponds to 3-uple (student_id, distance1, distance2). The
-            value is used to calculate an intersection stats.
+            corresponds to 4-uple (student_id, distance1, distance2, weight).
+            The value is used to calculate an intersection stats.
             A string 'student_count': The values is going to be a list of
             partial sums of numbers.
 
@@ -939,13 +1373,13 @@ class ClusteringGenerator(jobs.MapReduceJob):
                     # and distance 3 to cluster B, then it has a
                     # distance of 3 (the greater) to the intersection
                     intersection_distance = max(value[1], value[2])
-                    distances[intersection_distance] += 1
+                    distances[intersection_distance] += value[3]
                 item_id = tuple(item_id)
             else:
                 stat_name = 'count'
                 for value in values:
                     value = transforms.loads(value)
-                    distances[value[1]] += 1
+                    distances[value[1]] += value[2]
             distances = dict(distances)
             list_distances = [0] * (max([int(k) for k in distances]) + 1)
             for distance, count in distances.items():
@@ -1143,6 +1577,7 @@ class ClusterStatisticsDataSource(data_sources.AbstractSmallRestDataSource):
         # This function is long and complicated, but it is so to send the data
         # as much processed as possible to the javascript in the page.
         # The information is adjusted to fit the graphics easily.
-        results = list(jobs.MapReduceJob.get_results(clustering_generator_job))
+        results = list(ClusteringGenerator.get_statistics(
+            clustering_generator_job))
         # data, page_number
         return ClusterStatisticsDataSource._process_job_result(results), 0
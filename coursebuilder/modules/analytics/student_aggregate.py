@@ -17,7 +17,9 @@
 __author__ = ['Michael Gainer (mgainer@google.com)']
 
 import collections
+import itertools
 import logging
+import uuid
 import zlib
 
 from mapreduce import context
@@ -32,9 +34,18 @@ from models import jobs
 from models import models
 from models import transforms
 
-from google.appengine.api import datastore_types
 from google.appengine.ext import db
 
+# The maximum number of bytes of a compressed aggregate stored per entity.
+MAX_SHARD_SIZE = 1000 * 1000
+
+# Max number of entities storing one compressed field of an aggregate.
+MAX_NUM_SHARDS = 4
+
+# Max number of shard entities written by a single datastore put.
+MAX_SHARDS_PER_PUT = 4
+
+
 class AbstractStudentAggregationComponent(object):
     """Allows modules to contribute to map/reduce on EventEntity by Student.
 
@@ -151,14 +162,229 @@ class StudentAggregateEntity(entities.BaseEntity):
     than write this large volume of data out to, say, BlobStore, we instead
     prefer to write each Student's aggregated data to one record in the DB.
     Doing this permits us to use existing paginated-rest-data-source logic
-    to provide the aggregated student data as a feed to the data pump."""
+    to provide the aggregated student data as a feed to the data pump.
+
+    Compressed fields too large for this entity are split: the first part
+    is kept here and the rest in StudentAggregateShardEntity items, whose
+    number is recorded in the matching '_shards' field.  Each field keeps at
+    most an equal share of MAX_SHARD_SIZE here so that this entity stays
+    below the entity size limit.  Use get_data() and get_event_items()
+    rather than reading the fields directly.
+
+    Each write names its shards after a new 'shards_generation', so shards
+    are never overwritten: putting this entity switches readers from the
+    previous shards to the new ones at once, and the previous shards are
+    deleted afterwards."""
+
+    SHARDED_FIELDS = ('data', 'event_items', 'previous_event_items')
 
     data = db.BlobProperty()
+    data_shards = db.IntegerProperty(indexed=False)
+    shards_generation = db.StringProperty(indexed=False)
+
+    # Zlib-compressed JSON dict of component name to the list of items
+    # produced by the component's process_event() for this Student.  Kept so
+    # that incremental runs can merge the items for new events in and have
+    # the component produce_aggregate() over all of them.
+    event_items = db.BlobProperty()
+    event_items_shards = db.IntegerProperty(indexed=False)
+
+    # The run that wrote this entity and, for incremental runs, the items
+    # the Student had before it.  A retried reduce of the same run merges
+    # the new events into those rather than into the items it saved itself.
+    sequence_num = db.IntegerProperty(indexed=False)
+    previous_event_items = db.BlobProperty()
+    previous_event_items_shards = db.IntegerProperty(indexed=False)
 
     @classmethod
     def safe_key(cls, db_key, transform_fn):
         return db.Key.from_path(cls.kind(), transform_fn(db_key.id_or_name()))
 
+    @classmethod
+    def build(cls, user_id, data, event_items, previous_event_items=None,
+              sequence_num=None):
+        """Makes the entities storing compressed data and items of a Student.
+
+        Args:
+          user_id: The user ID of the Student.
+          data: The compressed aggregate.
+          event_items: The compressed event items, or None.
+          previous_event_items: The compressed event items the Student had
+              before the run, or None.
+          sequence_num: The sequence number of the run.
+        Returns:
+          A list of this entity followed by its StudentAggregateShardEntity
+          items, to be put together.
+        Raises:
+          ValueError: a field needs more than MAX_NUM_SHARDS entities.
+        """
+        entity = cls(
+            key_name=user_id, sequence_num=sequence_num,
+            shards_generation=uuid.uuid4().hex)
+        ret = [entity]
+        head_size = MAX_SHARD_SIZE // len(cls.SHARDED_FIELDS)
+        max_size = head_size + MAX_SHARD_SIZE * (MAX_NUM_SHARDS - 1)
+        values = {
+            'data': data,
+            'event_items': event_items,
+            'previous_event_items': previous_event_items,
+            }
+        for field in cls.SHARDED_FIELDS:
+            value = values[field]
+            if value is None:
+                continue
+            if len(value) > max_size:
+                raise ValueError(
+                    'Compressed %s of student %s is %d bytes; the maximum '
+                    'supported size is %d.' % (
+                        field, user_id, len(value), max_size))
+            chunks = [value[:head_size]] + [
+                value[offset:offset + MAX_SHARD_SIZE]
+                for offset in xrange(head_size, len(value), MAX_SHARD_SIZE)]
+            setattr(entity, field, chunks[0])
+            setattr(entity, field + '_shards', len(chunks) - 1)
+            for index, chunk in enumerate(chunks[1:], 1):
+                ret.append(StudentAggregateShardEntity(
+                    key_name=StudentAggregateShardEntity.make_key_name(
+                        user_id, entity.shards_generation, field, index),
+                    data=chunk))
+        return ret
+
+    def get_shard_key_names(self, field=None):
+        """Names of the shards of a field, or of all fields if not given."""
+        ret = []
+        for name in [field] if field else self.SHARDED_FIELDS:
+            for index in xrange(1, (getattr(self, name + '_shards') or 0) + 1):
+                ret.append(StudentAggregateShardEntity.make_key_name(
+                    self.key().name(), self.shards_generation, name, index))
+        return ret
+
+    @classmethod
+    def load_shards(cls, aggregate_entities, field=None):
+        """Reads the shards of several entities in one batch.
+
+        Args:
+          aggregate_entities: StudentAggregateEntity items.
+          field: The name of the only field to read shards of, if given.
+        Returns:
+          A dict of shard key name to StudentAggregateShardEntity, to pass to
+          get_data() and get_event_items().
+        """
+        key_names = []
+        for entity in aggregate_entities:
+            key_names.extend(entity.get_shard_key_names(field))
+        if not key_names:
+            return {}
+        return dict(
+            (shard.key().name(), shard)
+            for shard in StudentAggregateShardEntity.get_by_key_name(key_names)
+            if shard)
+
+    def _get_field(self, field, shards):
+        value = getattr(self, field)
+        if value is None:
+            return None
+        if shards is None:
+            shards = self.load_shards([self], field)
+        parts = [value]
+        for key_name in self.get_shard_key_names(field):
+            if key_name not in shards:
+                raise ValueError(
+                    'Shard %s of student aggregate is missing.' % key_name)
+            parts.append(shards[key_name].data)
+        try:
+            return transforms.loads(zlib.decompress(''.join(parts)))
+        except zlib.error, ex:
+            raise ValueError(
+                'Compressed %s of student aggregate %s is corrupt: %s' % (
+                    field, self.key().name(), ex))
+
+    def get_data(self, shards=None):
+        """Returns the aggregate dict, reading its shards if not given."""
+        return self._get_field('data', shards)
+
+    def get_event_items(self, shards=None):
+        """Returns the event items dict, or None if they were not kept."""
+        return self._get_field('event_items', shards)
+
+    def get_previous_event_items(self, shards=None):
+        """Returns the items from before the run that wrote this, or None."""
+        return self._get_field('previous_event_items', shards)
+
+
+class StudentAggregateShardEntity(entities.BaseEntity):
+    """Holds a part of an oversized field of a StudentAggregateEntity.
+
+    Key names are "<user_id>:<generation>:<field name>:<shard number>",
+    with shards numbered from 1; the first part stays in the
+    StudentAggregateEntity."""
+
+    data = db.BlobProperty()
+
+    @classmethod
+    def make_key_name(cls, user_id, generation, field, index):
+        return '%s:%s:%s:%d' % (user_id, generation, field, index)
+
+    @classmethod
+    def safe_key(cls, db_key, transform_fn):
+        user_id, suffix = db_key.name().split(':', 1)
+        return db.Key.from_path(
+            cls.kind(), '%s:%s' % (transform_fn(user_id), suffix))
+
+
+class StudentAggregateWatermarkEntity(entities.BaseEntity):
+    """Records which events are included in the StudentAggregateEntity items.
+
+    There is one of these per course.  'until' is set once the run that
+    included all events recorded before that time has completed; the values
+    for the run in progress are kept in the 'pending_' fields until then.
+    'needs_full_rebuild' is set when the event items of some Student could not
+    be kept, so that the next run maps all events again.
+    """
+
+    KEY_NAME = 'watermark'
+
+    until = db.DateTimeProperty(indexed=False)
+    pending_until = db.DateTimeProperty(indexed=False)
+    pending_sequence_num = db.IntegerProperty(indexed=False)
+    needs_full_rebuild = db.BooleanProperty(indexed=False, default=False)
+
+    @classmethod
+    @db.transactional
+    def request_full_rebuild(cls):
+        watermark = cls.get_by_key_name(cls.KEY_NAME)
+        if watermark and not watermark.needs_full_rebuild:
+            watermark.needs_full_rebuild = True
+            watermark.put()
+
+
+class StudentAggregateReduceContext(object):
+    """Course-level objects shared by all reduce() calls of one job run.
+
+    Loading the course is far more expensive than aggregating the data of a
+    single Student, so it is done once per job run in each process rather
+    than once per Student.
+    """
+
+    _current = None
+
+    def __init__(self, mapreduce_id, params):
+        self.mapreduce_id = mapreduce_id
+        self.params = params
+        app_context = sites.get_course_index().get_app_context_for_namespace(
+            params['course_namespace'])
+        self.course = courses.Course(None, app_context=app_context)
+
+    @classmethod
+    def get(cls):
+        mapreduce_spec = context.get().mapreduce_spec
+        current = cls._current
+        if not current or current.mapreduce_id != mapreduce_spec.mapreduce_id:
+            current = cls(
+                mapreduce_spec.mapreduce_id, mapreduce_spec.mapper.params)
+            cls._current = current
+        return current
+
 
 class StudentAggregateGenerator(jobs.MapReduceJob):
     """M/R job to aggregate data by student using registered plug-ins.
@@ -169,8 +395,23 @@ class StudentAggregateGenerator(jobs.MapReduceJob):
     insulated from one another, and are permitted to fail individually without
     compromising the results contributed for a Student by other plugins.
 
+    Once a run has completed, the next run is incremental: it maps only the
+    events recorded since the previous run started.  The items produced for
+    those events are merged with the items saved with each Student's
+    aggregate, and the components produce the aggregate over all of them,
+    exactly as a full run would.  After a failed or canceled run, after a
+    run that could not keep the items of some Student, or when constructed
+    with full_rebuild=True, all events are mapped again.
     """
 
+    EVENTS_SINCE_PARAM = 'student_aggregate_events_since'
+    EVENTS_UNTIL_PARAM = 'student_aggregate_events_until'
+    SEQUENCE_NUM_PARAM = 'student_aggregate_sequence_num'
+
+    def __init__(self, app_context, full_rebuild=False):
+        super(StudentAggregateGenerator, self).__init__(app_context)
+        self._full_rebuild = full_rebuild
+
     @staticmethod
     def get_description():
         return 'student_aggregate'
@@ -179,6 +420,38 @@ class StudentAggregateGenerator(jobs.MapReduceJob):
     def entity_class():
         return models.EventEntity
 
+    def _update_watermark(self):
+        """Starts a new run in the watermark.
+
+        Returns:
+          A (since, until, sequence_num) tuple for the run.  'since' is when
+          the last completed run started, or None if all events need to be
+          mapped.
+        """
+        job = self.load()
+        watermark = StudentAggregateWatermarkEntity.get_by_key_name(
+            StudentAggregateWatermarkEntity.KEY_NAME)
+        if not watermark:
+            watermark = StudentAggregateWatermarkEntity(
+                key_name=StudentAggregateWatermarkEntity.KEY_NAME)
+        elif (job and watermark.pending_sequence_num == job.sequence_num):
+            if job.status_code == jobs.STATUS_CODE_COMPLETED:
+                watermark.until = watermark.pending_until
+            else:
+                # Aggregates may have been partially updated by the run.
+                watermark.until = None
+        since = watermark.until
+        if self._full_rebuild or watermark.needs_full_rebuild:
+            since = None
+            watermark.needs_full_rebuild = False
+
+        watermark.pending_until = db.DateTimeProperty.now()
+        watermark.pending_sequence_num = (
+            job.sequence_num + 1 if job and job.sequence_num else 1)
+        watermark.put()
+        return (since, watermark.pending_until,
+                watermark.pending_sequence_num)
+
     def build_additional_mapper_params(self, app_context):
         schemas = {}
         schema_names = {}
@@ -187,6 +460,14 @@ class StudentAggregateGenerator(jobs.MapReduceJob):
             'schemas': schemas,
             'schema_names': schema_names,
             }
+
+        # Events recorded while the job runs are left to the next run.
+        since, until, sequence_num = self._update_watermark()
+        ret[self.EVENTS_UNTIL_PARAM] = until
+        ret[self.SEQUENCE_NUM_PARAM] = sequence_num
+        if since:
+            ret[self.EVENTS_SINCE_PARAM] = since
+            ret['filters'] = [('recorded_on', '>=', since)]
         for component in StudentAggregateComponentRegistry.get_components():
             component_name = component.get_name()
             static_value = component.build_static_params(app_context)
@@ -203,10 +484,16 @@ class StudentAggregateGenerator(jobs.MapReduceJob):
 
     @staticmethod
     def map(event):
+        params = context.get().mapreduce_spec.mapper.params
+        since = params.get(StudentAggregateGenerator.EVENTS_SINCE_PARAM)
+        if (event.recorded_on >=
+            params[StudentAggregateGenerator.EVENTS_UNTIL_PARAM] or
+            since and event.recorded_on < since):
+            return
+
         for component in (StudentAggregateComponentRegistry.
                           get_components_for_event_source(event.source)):
             component_name = component.get_name()
-            params = context.get().mapreduce_spec.mapper.params
             static_data = params.get(component_name)
             value = None
             try:
@@ -221,8 +508,38 @@ class StudentAggregateGenerator(jobs.MapReduceJob):
                 value_str = '%s:%s' % (component_name, transforms.dumps(value))
                 yield event.user_id, value_str
 
+    @staticmethod
+    def _parse_value(value):
+        """Returns the component name and the list of items in a value.
+
+        Values from map() hold one item as "name:json"; values from
+        combine() hold a list of items as "name::json".
+        """
+        component_name, payload = value.split(':', 1)
+        if payload.startswith(':'):
+            return component_name, transforms.loads(payload[1:])
+        return component_name, [transforms.loads(payload)]
+
+    @staticmethod
+    def combine(unused_user_id, values, previously_combined_values=None):
+        """Merges the values for a Student into one value per component."""
+        event_items = collections.defaultdict(list)
+        for value in itertools.chain(values, previously_combined_values or []):
+            component_name, items = StudentAggregateGenerator._parse_value(
+                value)
+            event_items[component_name].extend(items)
+        for component_name, items in event_items.iteritems():
+            yield '%s::%s' % (component_name, transforms.dumps(items))
+
     @staticmethod
     def reduce(user_id, values):
+        reduce_context = StudentAggregateReduceContext.get()
+        params = reduce_context.params
+
+        # Read the previous aggregate while looking up the Student; its
+        # items are merged in incremental runs, and its shards replaced.
+        previous_future = db.get_async(db.Key.from_path(
+            StudentAggregateEntity.kind(), user_id))
 
         # Convenience for collections: Pre-load Student and Course objects.
         student = None
@@ -236,17 +553,45 @@ class StudentAggregateGenerator(jobs.MapReduceJob):
                 'Student for student aggregation with user ID %s '
                 'was not loaded.  Ignoring records for this student.', user_id)
             return
+        course = reduce_context.course
 
-        params = context.get().mapreduce_spec.mapper.params
-        ns = params['course_namespace']
-        app_context = sites.get_course_index().get_app_context_for_namespace(ns)
-        course = courses.Course(None, app_context=app_context)
-
-        # Bundle items together into lists by collection name
+        # Bundle items together into lists by collection name, after the
+        # items of earlier runs when this run is incremental.
         event_items = collections.defaultdict(list)
+        previous = previous_future.get_result()
+        sequence_num = params.get(StudentAggregateGenerator.SEQUENCE_NUM_PARAM)
+        incremental = StudentAggregateGenerator.EVENTS_SINCE_PARAM in params
+        previous_items = {} if incremental else None
+        if previous and incremental:
+            previous_items = None
+            try:
+                if sequence_num and previous.sequence_num == sequence_num:
+                    # A retry: the aggregate already holds these events.
+                    previous_items = previous.get_previous_event_items()
+                else:
+                    previous_items = previous.get_event_items()
+            # pylint: disable=broad-except
+            except Exception:
+                common_utils.log_exception_origin()
+            if previous_items is None:
+                # Never replace the aggregate with one built from the new
+                # events alone; keep it until the next full run.
+                logging.critical(
+                    'Previous event items of student %s are not available; '
+                    'keeping the previous aggregate until a full run.',
+                    user_id)
+                StudentAggregateWatermarkEntity.request_full_rebuild()
+                return
+            event_items.update(previous_items)
         for value in values:
-            component_name, payload = value.split(':', 1)
-            event_items[component_name].append(transforms.loads(payload))
+            component_name, items = StudentAggregateGenerator._parse_value(
+                value)
+            event_items[component_name].extend(items)
+        items_data = zlib.compress(transforms.dumps(event_items))
+        previous_items_data = None
+        if previous_items is not None:
+            previous_items_data = zlib.compress(
+                transforms.dumps(previous_items))
 
         # Build up per-Student aggregate by calling each component.  Note that
         # we call each component whether or not its mapper produced any
@@ -290,23 +635,50 @@ class StudentAggregateGenerator(jobs.MapReduceJob):
 
             aggregate.update(value)
 
-        # Overwrite any previous value.
-        # TODO(mgainer): Consider putting records into blobstore.  Some
-        # light activity manually producing test data is about 10K unzipped
-        # and 1K zipped.  Unlikely that we'd see 1000x this amount of
-        # activity, but possible eventually.
+        # Overwrite any previous value, putting all the entities together.
         data = zlib.compress(transforms.dumps(aggregate))
-        # pylint: disable=protected-access
-        if len(data) > datastore_types._MAX_RAW_PROPERTY_BYTES:
-            # TODO(mgainer): Add injection and collection of counters to
-            # map/reduce job.  Have overridable method to verify no issues
-            # occurred when job completes.  If critical issues, mark job
-            # as failed, even though M/R completed.
-            logging.critical(
-                'Aggregated compressed student data is over %d bytes; '
-                'cannot store this in one field; ignoring this record!')
-        else:
-            StudentAggregateEntity(key_name=user_id, data=data).put()
+        try:
+            to_put = StudentAggregateEntity.build(
+                user_id, data, items_data, previous_items_data, sequence_num)
+        except ValueError:
+            common_utils.log_exception_origin()
+            try:
+                # The aggregate is still good, but incremental runs cannot
+                # update it without the items; the next run is a full one.
+                to_put = StudentAggregateEntity.build(
+                    user_id, data, None, None, sequence_num)
+                logging.critical(
+                    'Not keeping event items of student %s for incremental '
+                    'runs; they are too large.', user_id)
+                StudentAggregateWatermarkEntity.request_full_rebuild()
+            except ValueError:
+                # TODO(mgainer): Add injection and collection of counters to
+                # map/reduce job.  Have overridable method to verify no
+                # issues occurred when job completes.  If critical issues,
+                # mark job as failed, even though M/R completed.
+                logging.critical(
+                    'Aggregated compressed student data of student %s is too '
+                    'large to store; ignoring this record!', user_id)
+                StudentAggregateWatermarkEntity.request_full_rebuild()
+                return
+
+        # Shards go first, a few at a time to keep each call well below the
+        # datastore request size limit; the entity naming them goes last, so
+        # readers switch to the new shards at once.  The previous shards are
+        # deleted only after that.
+        shards = to_put[1:]
+        for start in xrange(0, len(shards), MAX_SHARDS_PER_PUT):
+            db.put(shards[start:start + MAX_SHARDS_PER_PUT])
+        db.put(to_put[0])
+
+        if previous:
+            stale_key_names = (
+                set(previous.get_shard_key_names()) -
+                set(entity.key().name() for entity in to_put[1:]))
+            if stale_key_names:
+                db.delete([
+                    db.Key.from_path(StudentAggregateShardEntity.kind(), name)
+                    for name in stale_key_names])
 
 
 class StudentAggregateComponentRegistry(
@@ -365,8 +737,13 @@ class StudentAggregateComponentRegistry(
         else:
             transform_fn = cls._build_transform_fn(data_source_context)
         ret = []
+        shards = StudentAggregateEntity.load_shards(rows, 'data')
         for row in rows:
-            item = transforms.loads(zlib.decompress(row.data))
+            try:
+                item = row.get_data(shards)
+            except (ValueError, zlib.error):
+                common_utils.log_exception_origin()
+                continue
             item['user_id'] = transform_fn(row.key().id_or_name())
             ret.append(item)
         return ret
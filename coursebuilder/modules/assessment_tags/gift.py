@@ -498,6 +498,74 @@ class GiftParser(object):
         tree = cls.parse(text)
         return [GiftAdapter().convert_to_question(node) for node in tree]
 
+    @classmethod
+    def split_questions(cls, text):
+        """Splits GIFT text into blank line separated question chunks.
+
+        As in Moodle, a blank line always ends a question, so an unterminated
+        question can't swallow the ones following it. Whole-line comments are
+        blanked out, so that line numbers reported by the parser for a chunk
+        still match the original text.
+
+        Args:
+            text: string. GIFT-formatted questions.
+
+        Returns:
+            A list of (line_number, chunk) tuples, where line_number is the
+            1-based line of the original text the chunk starts on.
+        """
+        chunks = []
+        lines = []
+        start = None
+        for line_number, line in enumerate(text.splitlines(), 1):
+            if not line.strip():
+                if lines and ''.join(lines).strip():
+                    chunks.append((start, '\n'.join(lines)))
+                lines = []
+                continue
+            if not lines:
+                start = line_number
+            if line.strip().startswith('//'):
+                line = ''
+            lines.append(line)
+        if lines and ''.join(lines).strip():
+            chunks.append((start, '\n'.join(lines)))
+        return chunks
+
+    @classmethod
+    def parse_questions_with_errors(cls, text):
+        """Parses GIFT questions one at a time, collecting all the errors.
+
+        Unlike parse_questions(), an invalid question doesn't stop the parser
+        from checking the questions following it. Each chunk produced by
+        split_questions() is parsed on its own, which also keeps the cost of
+        parsing linear in the number of questions.
+
+        Args:
+            text: string. GIFT-formatted questions.
+
+        Returns:
+            A tuple (questions, errors), where questions is a list of question
+            dicts for the chunks that parsed and errors is a list of strings,
+            each prefixed with the line number of the offending question.
+        """
+        questions = []
+        errors = []
+        adapter = GiftAdapter()
+        for line_number, chunk in cls.split_questions(text):
+            try:
+                tree = cls.bnf.parseString(chunk, parseAll=True)
+            except ParseException as e:
+                errors.append('Line %s: %s' % (
+                    line_number + e.lineno - 1, e.msg))
+                continue
+            for node in tree:
+                try:
+                    questions.append(adapter.convert_to_question(node))
+                except (ParseError, ValueError) as e:
+                    errors.append('Line %s: %s' % (line_number, e))
+        return questions, errors
+
 
 class GiftAdapter(object):
     """Converts a GIFT-formatted question to a CB question dict."""
@@ -22,6 +22,7 @@ import os
 import jinja2
 
 import appengine_config
+from common import caching
 from common import jinja_utils
 from common import schema_fields
 from common import tags
@@ -33,6 +34,89 @@ from models import transforms
 RESOURCES_PATH = '/modules/assessment_tags/resources'
 
 
+class QuestionRenderingCache(caching.RequestScopedSingleton):
+    """Questions, question groups and templates used to render a page.
+
+    Question and question group tags prefetch the entities referenced by all
+    the tags of a page with one bulk load per entity type, before any of the
+    tags is rendered. Rendering then reads from this cache; ids not
+    prefetched here are loaded one at a time as before.
+    """
+
+    def __init__(self):
+        self._questions = {}
+        self._question_groups = {}
+        self._templates = {}
+
+    @classmethod
+    def _to_ids(cls, raw_ids):
+        ids = []
+        for raw_id in raw_ids:
+            try:
+                the_id = int(raw_id)
+            except (TypeError, ValueError):
+                continue  # Reported as an invalid question when rendered.
+            if the_id not in ids:
+                ids.append(the_id)
+        return ids
+
+    @classmethod
+    def _bulk_load(cls, dao, loaded, raw_ids):
+        missing = [
+            the_id for the_id in cls._to_ids(raw_ids) if the_id not in loaded]
+        if missing:
+            loaded.update(zip(missing, dao.bulk_load(missing)))
+
+    @classmethod
+    def _load(cls, dao, loaded, raw_id):
+        try:
+            the_id = int(raw_id)
+        except (TypeError, ValueError):
+            the_id = None
+        if the_id in loaded:
+            return loaded[the_id]
+        return dao.load(raw_id)
+
+    @classmethod
+    def prefetch_questions(cls, quids):
+        # pylint: disable=protected-access
+        cls._bulk_load(m_models.QuestionDAO, cls.instance()._questions, quids)
+
+    @classmethod
+    def prefetch_question_groups(cls, qgids):
+        # pylint: disable=protected-access
+        question_groups = cls.instance()._question_groups
+        cls._bulk_load(m_models.QuestionGroupDAO, question_groups, qgids)
+        quids = []
+        for question_group_dto in question_groups.itervalues():
+            if question_group_dto:
+                quids.extend(
+                    item['question']
+                    for item in question_group_dto.dict.get('items', []))
+        cls.prefetch_questions(quids)
+
+    @classmethod
+    def load_question(cls, quid):
+        # pylint: disable=protected-access
+        return cls._load(
+            m_models.QuestionDAO, cls.instance()._questions, quid)
+
+    @classmethod
+    def load_question_group(cls, qgid):
+        # pylint: disable=protected-access
+        return cls._load(
+            m_models.QuestionGroupDAO, cls.instance()._question_groups, qgid)
+
+    @classmethod
+    def get_template(cls, template_file):
+        # pylint: disable=protected-access
+        templates = cls.instance()._templates
+        if template_file not in templates:
+            templates[template_file] = jinja_utils.get_template(
+                template_file, [os.path.dirname(__file__)])
+        return templates[template_file]
+
+
 @appengine_config.timeandlog('render_question', duration_only=True)
 def render_question(
     quid, instanceid, embedded=False, weight=None, progress=None):
@@ -56,7 +140,7 @@ def render_question(
       a Jinja markup string that represents the HTML for the question.
     """
     try:
-        question_dto = m_models.QuestionDAO.load(quid)
+        question_dto = QuestionRenderingCache.load_question(quid)
     except Exception:  # pylint: disable=broad-except
         logging.exception('Invalid question: %s', quid)
         return '[Invalid question]'
@@ -72,7 +156,8 @@ def render_question(
         except ValueError:
             weight = 1.0
 
-    template_values = question_dto.dict
+    # Copied, as the DTO may be shared by several instances of the question.
+    template_values = dict(question_dto.dict)
     template_values['embedded'] = embedded
     template_values['instanceid'] = instanceid
     template_values['resources_path'] = RESOURCES_PATH
@@ -120,8 +205,7 @@ def render_question(
         js_data['weight'] = float(weight)
     template_values['js_data'] = transforms.dumps(js_data)
 
-    template = jinja_utils.get_template(
-        template_file, [os.path.dirname(__file__)])
+    template = QuestionRenderingCache.get_template(template_file)
     return jinja2.utils.Markup(template.render(template_values))
 
 
@@ -141,6 +225,10 @@ class QuestionTag(tags.BaseTag):
     def vendor(cls):
         return 'gcb'
 
+    def prefetch(self, nodes, handler):
+        QuestionRenderingCache.prefetch_questions(
+            [node.attrib.get('quid') for node in nodes])
+
     def render(self, node, handler):
         """Renders a question."""
 
@@ -203,16 +291,20 @@ class QuestionGroupTag(tags.BaseTag):
     def vendor(cls):
         return 'gcb'
 
+    def prefetch(self, nodes, handler):
+        QuestionRenderingCache.prefetch_question_groups(
+            [node.attrib.get('qgid') for node in nodes])
+
     def render(self, node, handler):
         """Renders a question."""
 
         qgid = node.attrib.get('qgid')
         group_instanceid = node.attrib.get('instanceid')
-        question_group_dto = m_models.QuestionGroupDAO.load(qgid)
+        question_group_dto = QuestionRenderingCache.load_question_group(qgid)
         if not question_group_dto:
             return tags.html_string_to_element_tree('[Deleted question group]')
 
-        template_values = question_group_dto.dict
+        template_values = dict(question_group_dto.dict)
         template_values['embedded'] = False
         template_values['instanceid'] = group_instanceid
         template_values['resources_path'] = RESOURCES_PATH
@@ -237,9 +329,8 @@ class QuestionGroupTag(tags.BaseTag):
             js_data[question_instanceid] = item
         template_values['js_data'] = transforms.dumps(js_data)
 
-        template_file = 'templates/question_group.html'
-        template = jinja_utils.get_template(
-            template_file, [os.path.dirname(__file__)])
+        template = QuestionRenderingCache.get_template(
+            'templates/question_group.html')
 
         html_string = template.render(template_values)
         return tags.html_string_to_element_tree(html_string)
@@ -35,6 +35,7 @@ __author__ = [
     'John Orr (jorr@google.com)']
 
 
+import hashlib
 import os
 import StringIO
 
@@ -44,26 +45,200 @@ from reportlab.lib.units import inch
 from reportlab.pdfgen import canvas
 
 import appengine_config
+from common import caching
 from common import safe_dom
 from common import schema_fields
 from common import tags
+from common import utils as common_utils
 from controllers import sites
 from controllers import utils
 from models import analytics
 from models import courses
 from models import custom_modules
+from models import custom_units
 from models import data_sources
+from models import entities
 from models import jobs
 from models import models
+from models import review
+from models import transforms
 from modules.analytics import student_aggregate
 from modules.certificate import custom_criteria
 from modules.dashboard import course_settings
 from modules.dashboard import tabs
 
+from google.appengine.ext import db
+
 CERTIFICATE_HANDLER_PATH = 'certificate'
 CERTIFICATE_PDF_HANDLER_PATH = 'certificate.pdf'
 RESOURCES_PATH = '/modules/certificate/resources'
 
+# Int. Version of the PDF layout drawn by render_certificate_pdf(). Bump it
+# whenever the layout changes so previously rendered PDFs are not served.
+CERTIFICATE_PDF_LAYOUT_VERSION = 1
+
+
+class CertificateBackground(caching.ProcessScopedSingleton):
+    """The certificate background image, read and decoded once per process."""
+
+    def __init__(self):
+        image_path = os.path.join(
+            appengine_config.BUNDLE_ROOT,
+            'modules', 'certificate', 'resources', 'images', 'cert.png')
+        with open(image_path, 'rb') as image_file:
+            self._image = canvas.ImageReader(
+                StringIO.StringIO(image_file.read()))
+        # ImageReader decodes lazily and keeps the decoded pixels; decode now
+        # so that no request pays for it.
+        self._image.getRGBData()
+
+    @property
+    def image(self):
+        return self._image
+
+
+def render_certificate_pdf(gettext, course_title, student_name):
+    """Renders the certificate and returns the PDF document as a string.
+
+    Args:
+        gettext: function. Translates the fixed text of the certificate.
+        course_title: string. The title of the course.
+        student_name: string. The name of the student.
+
+    Returns:
+        String holding the PDF document.
+    """
+    out = StringIO.StringIO()
+    c = canvas.Canvas(out, pagesize=pagesizes.landscape(pagesizes.LETTER))
+    c.setTitle('Course Builder Certificate')
+
+    # Draw the background image
+    c.drawImage(
+        CertificateBackground.instance().image, 0, -1.5 * inch,
+        width=11 * inch, preserveAspectRatio=True)
+
+    text = c.beginText()
+
+    text.setTextOrigin(0.5 * inch, 4.5 * inch)
+    text.setFont('Helvetica', 40)
+    text.setFillColorRGB(75.0 / 255, 162.0 / 255, 65.0 / 255)
+    text.textLine(gettext('Certificate of Completion'))
+
+    text.setTextOrigin(0.5 * inch, 4.0 * inch)
+    text.setFillColorRGB(0.4, 0.4, 0.4)
+    text.setFont('Helvetica', 20)
+    text.textLine(gettext('Presented to'))
+
+    text.setTextOrigin(0.5 * inch, 2.3 * inch)
+    text.textLine(gettext('for successfully completing the'))
+    text.textLine(gettext('%(course)s course') % {'course': course_title})
+
+    c.drawText(text)
+
+    c.setStrokeColorRGB(0.8, 0.8, 0.8)
+    c.setLineWidth(0.1)
+    c.line(0.5 * inch, 3.0 * inch, 10.5 * inch, 3.0 * inch)
+
+    c.setFont('Helvetica', 24)
+    c.setFillColorRGB(0.4, 0.4, 0.4)
+    c.drawCentredString(5.0 * inch, 3.1 * inch, student_name)
+
+    c.showPage()
+    c.save()
+    return out.getvalue()
+
+
+class CertificatePdfEntity(entities.BaseEntity):
+    """A rendered certificate PDF.
+
+    Keyed by 'USER_ID:FINGERPRINT', where the fingerprint covers everything
+    that affects the document: the layout version, the course title, the
+    locale, the certificate criteria and the student name. A PDF is only ever
+    stored for a student who was qualified under the criteria in the
+    fingerprint, so finding one also proves the certificate was earned.
+    """
+
+    data = db.BlobProperty(indexed=False)
+
+    # The document includes the name of the student.
+    _PROPERTY_EXPORT_BLACKLIST = [data]
+
+    @classmethod
+    def safe_key(cls, db_key, transform_fn):
+        user_id, fingerprint = db_key.name().split(':', 1)
+        return db.Key.from_path(
+            cls.kind(), '%s:%s' % (transform_fn(user_id), fingerprint))
+
+
+class CertificatePdfCache(object):
+    """Stores rendered certificate PDFs in memcache and the datastore."""
+
+    @classmethod
+    def get_criteria_version(cls, environ):
+        """Returns a short stamp identifying the certificate criteria."""
+        return hashlib.md5(transforms.dumps(
+            environ.get('certificate_criteria'), sort_keys=True)).hexdigest()
+
+    @classmethod
+    def make_key(cls, student, course_title, locale, criteria_version):
+        fingerprint = hashlib.md5(transforms.dumps([
+            CERTIFICATE_PDF_LAYOUT_VERSION, course_title, locale,
+            criteria_version, student.name])).hexdigest()
+        return '%s:%s' % (student.user_id, fingerprint)
+
+    @classmethod
+    def _memcache_key(cls, key):
+        return 'certificate-pdf:%s' % key
+
+    @classmethod
+    def get(cls, key):
+        """Returns the PDF stored under the key, or None."""
+        data = models.MemcacheManager.get(cls._memcache_key(key))
+        if data is not None:
+            return data
+        entity = CertificatePdfEntity.get_by_key_name(key)
+        if not entity:
+            return None
+        models.MemcacheManager.set(cls._memcache_key(key), entity.data)
+        return entity.data
+
+    @classmethod
+    def put(cls, key, data):
+        CertificatePdfEntity(key_name=key, data=db.Blob(data)).put()
+        models.MemcacheManager.set(cls._memcache_key(key), data)
+
+
+def get_certificate_pdf(course, student, gettext, locale, evaluator=None):
+    """Returns the student's certificate PDF, or None if not yet earned.
+
+    Previously rendered documents are served from the cache without checking
+    the qualification again; otherwise the student is checked and, when
+    qualified, the document is rendered and cached.
+
+    Args:
+        course: models.courses.Course. The course the student is enrolled in.
+        student: models.models.Student. The student to certify.
+        gettext: function. Translates the fixed text of the certificate.
+        locale: string. The locale gettext translates to.
+        evaluator: CertificateCriteriaEvaluator. The compiled criteria of the
+            course, if already at hand.
+
+    Returns:
+        String holding the PDF document, or None.
+    """
+    environ = course.app_context.get_environ()
+    course_title = environ['course']['title']
+    key = CertificatePdfCache.make_key(
+        student, course_title, locale,
+        CertificatePdfCache.get_criteria_version(environ))
+    data = CertificatePdfCache.get(key)
+    if data is None:
+        if not student_is_qualified(student, course, evaluator=evaluator):
+            return None
+        data = render_certificate_pdf(gettext, course_title, student.name)
+        CertificatePdfCache.put(key, data)
+    return data
+
 
 class ShowCertificateHandler(utils.BaseHandler):
     """Handler for student to print course certificate."""
@@ -93,165 +268,216 @@ class ShowCertificateHandler(utils.BaseHandler):
 class ShowCertificatePdfHandler(utils.BaseHandler):
     """Handler for student to print course certificate."""
 
-    def _print_cert(self, out, course, student):
-
-        c = canvas.Canvas(out, pagesize=pagesizes.landscape(pagesizes.LETTER))
-        c.setTitle('Course Builder Certificate')
-
-        # Draw the background image
-        image_path = os.path.join(
-            appengine_config.BUNDLE_ROOT,
-            'modules', 'certificate', 'resources', 'images', 'cert.png')
-        image_data = open(image_path).read()
-        image = canvas.ImageReader(StringIO.StringIO(image_data))
-        c.drawImage(
-            image, 0, -1.5 * inch, width=11 * inch, preserveAspectRatio=True)
-
-        text = c.beginText()
-
-        text.setTextOrigin(0.5 * inch, 4.5 * inch)
-        text.setFont('Helvetica', 40)
-        text.setFillColorRGB(75.0 / 255, 162.0 / 255, 65.0 / 255)
-        text.textLine(self.gettext('Certificate of Completion'))
-
-        text.setTextOrigin(0.5 * inch, 4.0 * inch)
-        text.setFillColorRGB(0.4, 0.4, 0.4)
-        text.setFont('Helvetica', 20)
-        text.textLine(self.gettext('Presented to'))
-
-        text.setTextOrigin(0.5 * inch, 2.3 * inch)
-        text.textLine(self.gettext('for successfully completing the'))
-        text.textLine(self.gettext('%(course)s course') % {'course': course})
-
-        c.drawText(text)
-
-        c.setStrokeColorRGB(0.8, 0.8, 0.8)
-        c.setLineWidth(0.1)
-        c.line(0.5 * inch, 3.0 * inch, 10.5 * inch, 3.0 * inch)
-
-        c.setFont('Helvetica', 24)
-        c.setFillColorRGB(0.4, 0.4, 0.4)
-        c.drawCentredString(5.0 * inch, 3.1 * inch, student.name)
-
-        c.showPage()
-        c.save()
-
     def get(self):
         """Handles GET requests."""
         student = self.personalize_page_and_get_enrolled()
         if not student:
             return
 
-        if not student_is_qualified(student, self.get_course()):
+        # The locale of this request is set up by before_method().
+        data = get_certificate_pdf(
+            self.get_course(), student, self.app_context.gettext,
+            self.app_context.get_current_locale())
+        if data is None:
             self.redirect('/')
             return
 
-        course = courses.Course.get_environ(self.app_context)['course']['title']
-
         self.response.headers['Content-Type'] = 'application/pdf'
         self.response.headers['Content-Disposition'] = (
             'attachment; filename=certificate.pdf')
-        self._print_cert(self.response.out, course, student)
-
-
-def _get_score_by_id(score_list, assessment_id):
-    for score in score_list:
-        if score['id'] == str(assessment_id):
-            return score
-    return None
-
-
-def _prepare_custom_criterion(custom, student, course):
-    assert hasattr(custom_criteria, custom), ((
-        'custom criterion %s is not implemented '
-        'as a function in custom_criteria.py.') % custom)
-    assert (custom in custom_criteria.registration_table), ((
-        'Custom criterion %s is not whitelisted '
-        'in the registration_table in custom_criteria.py.') % custom)
-
-    def _check_custom_criterion():
-        if not getattr(custom_criteria, custom)(student, course):
-            return False
-        return True
-
-    return _check_custom_criterion
-
-
-def _prepare_assessment_criterion(score_list, criterion):
-    score = _get_score_by_id(score_list, criterion['assessment_id'])
-    assert score is not None, (
-        'Invalid assessment id %s.' % criterion['assessment_id'])
-    pass_percent = criterion.get('pass_percent', '')
-    if pass_percent is not '':
-        # Must be machine graded
-        assert not score['human_graded'], (
-            'If pass_percent is provided, '
-            'the assessment must be machine graded.')
-        pass_percent = float(pass_percent)
-        assert (pass_percent >= 0.0) and (pass_percent <= 100.0), (
-            'pass_percent must be between 0 and 100.')
-    else:
-        # Must be peer graded
-        assert score['human_graded'], (
-            'If pass_percent is not provided, '
-            'the assessment must be human graded.')
-
-    def _check_assessment_criterion():
-        if not score['completed']:
-            return False
-        if pass_percent is not '':
-            return score['score'] >= pass_percent
-        return True
+        self.response.out.write(data)
 
-    return _check_assessment_criterion
 
+class CertificateCriteriaEvaluator(object):
+    """The certificate criteria of a course, compiled for many evaluations.
+
+    The criteria are validated and resolved against the course outline once.
+    Students are then evaluated against only the units named in the criteria,
+    using the scores stored on the student entity and progress fetched for a
+    whole batch of students in a single datastore get. Reviews needed by
+    peer-graded criteria are likewise fetched for the whole batch at once.
+    """
 
-def student_is_qualified(student, course):
+    def __init__(self, course):
+        self._course = course
+        self._tracker = course.get_progress_tracker()
+        environ = course.app_context.get_environ()
+        self._has_criteria = bool(environ.get('certificate_criteria'))
+
+        graded_units = {}
+        for unit in course.get_units():
+            if unit.is_custom_unit():
+                cu = custom_units.UnitTypeRegistry.get(unit.custom_unit_type)
+                if not cu or not cu.is_graded:
+                    continue
+            elif not unit.is_assessment():
+                continue
+            graded_units[str(unit.unit_id)] = unit
+
+        self._custom_criteria = []
+        self._assessment_criteria = []
+        # First validate the correctness of _all_ provided criteria
+        for criterion in environ.get('certificate_criteria') or []:
+            assessment_id = criterion.get('assessment_id', '')
+            custom = criterion.get('custom_criteria', '')
+            assert (assessment_id is not '') or (custom is not ''), (
+                'assessment_id and custom_criteria cannot be both empty.')
+            if custom is not '':
+                self._custom_criteria.append(
+                    self._compile_custom_criterion(custom))
+            elif assessment_id is not '':
+                self._assessment_criteria.append(
+                    self._compile_assessment_criterion(
+                        graded_units, criterion))
+            else:
+                assert False, 'Invalid certificate criterion %s.' % criterion
+
+    @classmethod
+    def _compile_custom_criterion(cls, custom):
+        assert hasattr(custom_criteria, custom), ((
+            'custom criterion %s is not implemented '
+            'as a function in custom_criteria.py.') % custom)
+        assert (custom in custom_criteria.registration_table), ((
+            'Custom criterion %s is not whitelisted '
+            'in the registration_table in custom_criteria.py.') % custom)
+        return getattr(custom_criteria, custom)
+
+    def _compile_assessment_criterion(self, graded_units, criterion):
+        unit = graded_units.get(str(criterion['assessment_id']))
+        assert unit is not None, (
+            'Invalid assessment id %s.' % criterion['assessment_id'])
+        human_graded = self._course.needs_human_grader(unit)
+        pass_percent = criterion.get('pass_percent', '')
+        review_min_count = None
+        if pass_percent is not '':
+            # Must be machine graded
+            assert not human_graded, (
+                'If pass_percent is provided, '
+                'the assessment must be machine graded.')
+            pass_percent = float(pass_percent)
+            assert (pass_percent >= 0.0) and (pass_percent <= 100.0), (
+                'pass_percent must be between 0 and 100.')
+        else:
+            # Must be peer graded
+            assert human_graded, (
+                'If pass_percent is not provided, '
+                'the assessment must be human graded.')
+            pass_percent = None
+            review_min_count = unit.workflow.get_review_min_count()
+        return {
+            'unit_id': str(unit.unit_id),
+            'is_assessment': unit.is_assessment(),
+            'pass_percent': pass_percent,
+            'human_graded': human_graded,
+            'review_min_count': review_min_count,
+            }
+
+    def _is_completed(self, progress, criterion):
+        if criterion['is_assessment']:
+            return self._tracker.is_assessment_completed(
+                progress, criterion['unit_id'])
+        return self._tracker.is_custom_unit_completed(
+            progress, criterion['unit_id'])
+
+    def _load_progress(self, students):
+        keys = [
+            db.Key.from_path(
+                models.StudentPropertyEntity.kind(),
+                models.StudentPropertyEntity.create_key(
+                    student.user_id, self._tracker.PROPERTY_KEY))
+            for student in students]
+        progress_list = entities.get(keys)
+        # Students who have not started have no progress entity yet; they are
+        # evaluated against an empty one, which is never stored.
+        return [
+            progress if progress else models.StudentPropertyEntity.create(
+                student, self._tracker.PROPERTY_KEY)
+            for student, progress in zip(students, progress_list)]
+
+    def evaluate(self, students):
+        """Determines which students have met the criteria for a certificate.
+
+        Args:
+            students: [models.models.Student]. The students to test.
+
+        Returns:
+            [bool], one per student, in the order of students.
+        """
+        students = list(students)
+        if not self._has_criteria or not students:
+            return [False] * len(students)
+
+        results = [True] * len(students)
+        progress_list = self._load_progress(students)
+        scores_list = [
+            transforms.loads(student.scores) if student.scores else {}
+            for student in students]
+
+        for criterion in self._assessment_criteria:
+            pending = []
+            for index, progress in enumerate(progress_list):
+                if not results[index]:
+                    continue
+                if not self._is_completed(progress, criterion):
+                    results[index] = False
+                elif criterion['human_graded']:
+                    pending.append(index)
+                elif scores_list[index].get(
+                    criterion['unit_id'], 0) < criterion['pass_percent']:
+                    results[index] = False
+
+            # A completed human-graded assessment also needs its reviews.
+            if pending:
+                steps_list = (
+                    self._course.get_reviews_processor(
+                    ).get_review_steps_by_multi(
+                        criterion['unit_id'],
+                        [students[index].get_key() for index in pending]))
+                for index, steps in zip(pending, steps_list):
+                    if not review.ReviewUtils.has_completed_enough_reviews(
+                        steps, criterion['review_min_count']):
+                        results[index] = False
+
+        for custom_function in self._custom_criteria:
+            for index, student in enumerate(students):
+                if results[index] and not custom_function(
+                    student, self._course):
+                    results[index] = False
+
+        return results
+
+    @property
+    def course(self):
+        return self._course
+
+    def is_qualified(self, student):
+        return self.evaluate([student])[0]
+
+
+def student_is_qualified(student, course, evaluator=None):
     """Determines whether the student has met criteria for a certificate.
 
     Args:
         student: models.models.Student. The student entity to test.
         course: modesl.courses.Course. The course which the student is
             enrolled in.
+        evaluator: CertificateCriteriaEvaluator. The compiled criteria of
+            the course; callers checking many students should pass one to
+            avoid compiling the criteria for each of them.
 
     Returns:
         True if the student is qualified, False otherwise.
     """
-    environ = course.app_context.get_environ()
-    score_list = course.get_all_scores(student)
-
-    if not environ.get('certificate_criteria'):
-        return False
-
-    criteria_functions = []
-    # First validate the correctness of _all_ provided criteria
-    for criterion in environ['certificate_criteria']:
-        assessment_id = criterion.get('assessment_id', '')
-        custom = criterion.get('custom_criteria', '')
-        assert (assessment_id is not '') or (custom is not ''), (
-            'assessment_id and custom_criteria cannot be both empty.')
-        if custom is not '':
-            criteria_functions.append(
-                _prepare_custom_criterion(custom, student, course))
-        elif assessment_id is not '':
-            criteria_functions.append(
-                _prepare_assessment_criterion(score_list, criterion))
-        else:
-            assert False, 'Invalid certificate criterion %s.' % criterion
-
-    # All criteria are valid, now do the checking.
-    for criterion_function in criteria_functions:
-        if not criterion_function():
-            return False
-
-    return True
+    if evaluator is None:
+        evaluator = CertificateCriteriaEvaluator(course)
+    return evaluator.is_qualified(student)
 
 
-def get_certificate_table_entry(handler, student, course):
+def get_certificate_table_entry(handler, student, course, evaluator=None):
     # I18N: Title of section on page showing certificates for course completion.
     title = handler.gettext('Certificate')
 
-    if student_is_qualified(student, course):
+    if student_is_qualified(student, course, evaluator=evaluator):
         nl = safe_dom.NodeList()
         nl.append(
             safe_dom.A(
@@ -336,6 +562,59 @@ TOTAL_CERTIFICATES = 'total_certificates'
 TOTAL_ACTIVE_STUDENTS = 'total_active_students'
 TOTAL_STUDENTS = 'total_students'
 
+# Number of students whose criteria are evaluated together by the map jobs.
+MAPREDUCE_EVALUATION_BATCH_SIZE = 100
+
+
+def _get_mapreduce_evaluator():
+    """Returns the criteria evaluator shared by all map() calls of a slice.
+
+    Loading the course and compiling its criteria is the bulk of the cost of
+    evaluating a student, so it is done once per slice rather than once per
+    student.  The mapper params must hold the 'course_namespace'.
+    """
+    ctx = context.get()
+    evaluator = getattr(ctx, '_certificate_criteria_evaluator', None)
+    if evaluator is None:
+        ns = ctx.mapreduce_spec.mapper.params['course_namespace']
+        app_context = sites.get_course_index().get_app_context_for_namespace(ns)
+        course = courses.Course(None, app_context=app_context)
+        evaluator = CertificateCriteriaEvaluator(course)
+        ctx._certificate_criteria_evaluator = evaluator
+    return evaluator
+
+
+def _is_qualified_in_mapreduce(student):
+    """Determines in a map() call whether the student has a certificate.
+
+    map() sees one student at a time and cannot yield anything once its slice
+    is over, so the students are evaluated in batches read ahead of the map:
+    the first student not yet evaluated and the ones following it in key
+    order are checked with a single evaluate() call, and the results are kept
+    for the rest of the slice.  The mapper params must hold the
+    'course_namespace'.
+    """
+    ctx = context.get()
+    results = getattr(ctx, '_certificate_qualified_students', None)
+    if results is None:
+        results = {}
+        ctx._certificate_qualified_students = results
+    key = str(student.key())
+    if key not in results:
+        # Only the students following this one are read again; the one at
+        # hand is evaluated as map() received it.
+        results.clear()
+        ns = ctx.mapreduce_spec.mapper.params['course_namespace']
+        with common_utils.Namespace(ns):
+            following = models.Student.all().filter(
+                '__key__ >', student.key()).order('__key__').fetch(
+                    MAPREDUCE_EVALUATION_BATCH_SIZE - 1)
+            batch = [student] + following
+            for other, qualified in zip(
+                batch, _get_mapreduce_evaluator().evaluate(batch)):
+                results[str(other.key())] = qualified
+    return results.pop(key)
+
 
 class CertificatesEarnedGenerator(jobs.AbstractCountingMapReduceJob):
 
@@ -352,17 +631,110 @@ class CertificatesEarnedGenerator(jobs.AbstractCountingMapReduceJob):
 
     @staticmethod
     def map(student):
-        params = context.get().mapreduce_spec.mapper.params
-        ns = params['course_namespace']
-        app_context = sites.get_course_index().get_app_context_for_namespace(ns)
-        course = courses.Course(None, app_context=app_context)
-        if student_is_qualified(student, course):
+        if _is_qualified_in_mapreduce(student):
             yield(TOTAL_CERTIFICATES, 1)
         if student.scores:
             yield(TOTAL_ACTIVE_STUDENTS, 1)
         yield(TOTAL_STUDENTS, 1)
 
 
+PDFS_RENDERED = 'pdfs_rendered'
+PDFS_ALREADY_CACHED = 'pdfs_already_cached'
+STUDENTS_NOT_QUALIFIED = 'students_not_qualified'
+
+
+class CertificatePdfGenerator(jobs.AbstractCountingMapReduceJob):
+    """Renders and caches the certificate PDFs of all qualified students.
+
+    Meant to be run when a course ends, so that the rush of downloads is
+    served from the cache. Documents are rendered in the default locale of
+    the course.
+    """
+
+    @staticmethod
+    def get_description():
+        return 'certificate pdfs'
+
+    def build_additional_mapper_params(self, app_context):
+        return {'course_namespace': app_context.get_namespace_name()}
+
+    @staticmethod
+    def entity_class():
+        return models.Student
+
+    @staticmethod
+    def map(student):
+        if not student.is_enrolled:
+            return
+        params = context.get().mapreduce_spec.mapper.params
+        ns = params['course_namespace']
+        app_context = sites.get_course_index().get_app_context_for_namespace(ns)
+        with common_utils.Namespace(ns):
+            old_locale = app_context.get_current_locale()
+            locale = app_context.default_locale
+            app_context.set_current_locale(locale)
+            try:
+                environ = app_context.get_environ()
+                course_title = environ['course']['title']
+                key = CertificatePdfCache.make_key(
+                    student, course_title, locale,
+                    CertificatePdfCache.get_criteria_version(environ))
+                if CertificatePdfCache.get(key) is not None:
+                    yield (PDFS_ALREADY_CACHED, 1)
+                elif _is_qualified_in_mapreduce(student):
+                    CertificatePdfCache.put(key, render_certificate_pdf(
+                        app_context.gettext, course_title, student.name))
+                    yield (PDFS_RENDERED, 1)
+                else:
+                    yield (STUDENTS_NOT_QUALIFIED, 1)
+            finally:
+                app_context.set_current_locale(old_locale)
+
+
+class CertificatePdfsDataSource(data_sources.SynchronousQuery):
+
+    @staticmethod
+    def required_generators():
+        return [CertificatePdfGenerator]
+
+    @classmethod
+    def get_name(cls):
+        return 'certificate_pdfs'
+
+    @classmethod
+    def get_title(cls):
+        return 'Certificate PDFs'
+
+    @classmethod
+    def get_schema(cls, unused_app_context, unused_catch_and_log,
+                   unused_source_context):
+        reg = schema_fields.FieldRegistry(
+            'Certificate PDFs',
+            description='Counts of certificate PDFs prepared ahead of '
+            'downloads.  Only one row will ever be returned from this data '
+            'source.')
+        reg.add_property(schema_fields.SchemaField(
+            PDFS_RENDERED, 'PDFs Rendered', 'integer',
+            description='Number of certificate PDFs rendered by the last run'))
+        reg.add_property(schema_fields.SchemaField(
+            PDFS_ALREADY_CACHED, 'PDFs Already Cached', 'integer',
+            description='Number of certificate PDFs found already rendered'))
+        reg.add_property(schema_fields.SchemaField(
+            STUDENTS_NOT_QUALIFIED, 'Students Not Qualified', 'integer',
+            description='Number of enrolled students without a certificate'))
+        return reg.get_json_schema_dict()['properties']
+
+    @staticmethod
+    def fill_values(app_context, template_values, certificate_pdfs_job):
+        template_values.update({
+            PDFS_RENDERED: 0,
+            PDFS_ALREADY_CACHED: 0,
+            STUDENTS_NOT_QUALIFIED: 0,
+            })
+        template_values.update(
+            jobs.MapReduceJob.get_results(certificate_pdfs_job))
+
+
 class CertificatesEarnedDataSource(data_sources.SynchronousQuery):
 
     @staticmethod
@@ -421,10 +793,22 @@ def register_analytic():
         data_source_classes=[CertificatesEarnedDataSource])
     tabs.Registry.register('analytics', name, title, [certificates_earned])
 
+    data_sources.Registry.register(CertificatePdfsDataSource)
+    name = 'certificate_pdfs'
+    title = 'Certificate PDFs'
+    certificate_pdfs = analytics.Visualization(
+        name, title, 'certificate_pdfs.html',
+        data_source_classes=[CertificatePdfsDataSource])
+    tabs.Registry.register('analytics', name, title, [certificate_pdfs])
+
 
 class CertificateAggregator(
     student_aggregate.AbstractStudentAggregationComponent):
 
+    # The course and the evaluator compiled for it by the last reduce() call;
+    # all calls of a job run get the same course object.
+    _evaluator_for_course = (None, None)
+
     @classmethod
     def get_name(cls):
         return 'certificate'
@@ -441,10 +825,19 @@ class CertificateAggregator(
     def process_event(cls, event, static_params):
         return None
 
+    @classmethod
+    def _get_evaluator(cls, course):
+        cached_course, evaluator = cls._evaluator_for_course
+        if cached_course is not course:
+            evaluator = CertificateCriteriaEvaluator(course)
+            cls._evaluator_for_course = (course, evaluator)
+        return evaluator
+
     @classmethod
     def produce_aggregate(cls, course, student, unused_static_params,
                           unused_event_items):
-        return {'earned_certificate': student_is_qualified(student, course)}
+        return {'earned_certificate': student_is_qualified(
+            student, course, evaluator=cls._get_evaluator(course))}
 
     @classmethod
     def get_schema(cls):
@@ -0,0 +1,157 @@
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Cross-course catalog of the settings shown by the course explorer."""
+
+import hashlib
+import os
+
+import appengine_config
+from controllers import sites
+from models import MemcacheManager
+from models import roles
+from models.counters import PerfCounter
+
+CATALOG_HIT = PerfCounter(
+    'gcb-course-explorer-catalog-hit',
+    'A number of times the course catalog was found in memcache.')
+CATALOG_REBUILD = PerfCounter(
+    'gcb-course-explorer-catalog-rebuild',
+    'A number of times the course catalog was rebuilt from course settings.')
+
+# Course settings (under the 'course' key of the environ) kept in the catalog.
+# Only settings shown to students belong here; access lists can be long and
+# are only named in the catalog by a digest of their text.
+CATALOG_COURSE_KEYS = [
+    'title', 'now_available', 'blurb', 'instructor_details']
+
+# Course settings (under the 'course' key of the environ) deciding who can
+# see a course.
+ACCESS_LIST_KEYS = ['whitelist', roles.KEY_ADMIN_USER_EMAILS]
+
+
+class CourseCatalog(object):
+    """A global index of the per-course settings needed to list courses.
+
+    Listing all courses used to load the settings of every course on every
+    page view. The catalog keeps a copy of the few settings displayed by the
+    explorer for all courses under a single memcache key in the default
+    namespace, so rendering the explorer pages costs one memcache lookup
+    regardless of how many courses there are. The catalog is dropped whenever
+    any course settings are saved and lazily rebuilt on the next read.
+
+    Each entry names the access lists of its course by the digest of their
+    text; the texts are kept under their digests in separate memcache keys,
+    read for all courses together by get_access_lists(). As these keys never
+    go stale, only the catalog itself needs to be dropped on saves.
+    """
+
+    @classmethod
+    def _make_key(cls):
+        return 'course_explorer:catalog:%s' % os.environ.get(
+            'CURRENT_VERSION_ID')
+
+    @classmethod
+    def _make_access_list_key(cls, digest):
+        return 'course_explorer:access_list:%s' % digest
+
+    @classmethod
+    def _get_digest(cls, text):
+        if not text or not text.strip():
+            return None
+        if isinstance(text, unicode):
+            text = text.encode('utf-8')
+        return hashlib.sha1(text).hexdigest()
+
+    @classmethod
+    def _get_access_lists(cls, app_context):
+        course = app_context.get_environ().get('course', {})
+        return dict([(key, course.get(key)) for key in ACCESS_LIST_KEYS])
+
+    @classmethod
+    def make_entry(cls, app_context):
+        environ = app_context.get_environ()
+        course = environ.get('course', {})
+        entry = dict([(key, course.get(key)) for key in CATALOG_COURSE_KEYS])
+        entry['title'] = app_context.get_title()
+        entry['slug'] = app_context.get_slug()
+        entry['access_lists'] = dict([
+            (key, cls._get_digest(text)) for key, text
+            in cls._get_access_lists(app_context).iteritems()])
+        return entry
+
+    @classmethod
+    def _build(cls, all_courses):
+        CATALOG_REBUILD.inc()
+        catalog = {}
+        access_lists = {}
+        for app_context in all_courses:
+            catalog[app_context.get_namespace_name()] = cls.make_entry(
+                app_context)
+            for text in cls._get_access_lists(app_context).itervalues():
+                digest = cls._get_digest(text)
+                if digest:
+                    access_lists[cls._make_access_list_key(digest)] = text
+        MemcacheManager.set_multi(
+            access_lists, namespace=appengine_config.DEFAULT_NAMESPACE_NAME)
+        MemcacheManager.set(
+            cls._make_key(), catalog,
+            namespace=appengine_config.DEFAULT_NAMESPACE_NAME)
+        return catalog
+
+    @classmethod
+    def get_entries(cls, all_courses=None):
+        """Returns a dict of catalog entries keyed by course namespace."""
+        if all_courses is None:
+            all_courses = sites.get_all_courses()
+        catalog = MemcacheManager.get(
+            cls._make_key(), namespace=appengine_config.DEFAULT_NAMESPACE_NAME)
+        if catalog is not None and all(
+            app_context.get_namespace_name() in catalog
+            for app_context in all_courses):
+            CATALOG_HIT.inc()
+            return catalog
+        return cls._build(all_courses)
+
+    @classmethod
+    def get_access_lists(cls, entries):
+        """Reads the access lists named by catalog entries in one batch.
+
+        Args:
+          entries: A list of catalog entries.
+        Returns:
+          A dict of digest to the text of the access list. The texts evicted
+          from memcache are missing; their courses need to be checked against
+          the course settings.
+        """
+        digests = set()
+        for entry in entries:
+            digests.update(
+                digest for digest in entry['access_lists'].itervalues()
+                if digest)
+        if not digests:
+            return {}
+        keys = dict([
+            (cls._make_access_list_key(digest), digest) for digest in digests])
+        texts = MemcacheManager.get_multi(
+            keys.keys(), namespace=appengine_config.DEFAULT_NAMESPACE_NAME)
+        return dict([
+            (keys[key], text) for key, text in texts.iteritems()
+            if text is not None])
+
+    @classmethod
+    def invalidate(cls, unused_course_settings=None):
+        """Drops the catalog; it is rebuilt on the next read."""
+        MemcacheManager.delete(
+            cls._make_key(), namespace=appengine_config.DEFAULT_NAMESPACE_NAME)
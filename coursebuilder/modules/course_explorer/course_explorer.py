@@ -18,9 +18,11 @@ __author__ = 'Rahul Singal (rahulsingal@google.com)'
 
 from common import safe_dom
 from controllers import utils
+from models import courses
 from models import custom_modules
 from models.config import ConfigProperty
 from models.models import StudentProfileDAO
+from modules.course_explorer import catalog
 from modules.course_explorer import student
 
 from google.appengine.api import users
@@ -55,6 +57,11 @@ class ExplorerPageInitializer(utils.PageInitializer):
             template_values.update({'has_global_profile': profile is not None})
 
 
+def notify_module_enabled():
+    courses.Course.COURSE_ENV_POST_SAVE_HOOKS.append(
+        catalog.CourseCatalog.invalidate)
+
+
 def register_module():
     """Registers this module in the registry."""
 
@@ -73,7 +80,8 @@ def register_module():
     custom_module = custom_modules.Module(
         'Course Explorer',
         'A set of pages for delivering an online course.',
-        explorer_routes, [])
+        explorer_routes, [],
+        notify_module_enabled=notify_module_enabled)
     return custom_module
 
 
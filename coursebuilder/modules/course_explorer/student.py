@@ -19,6 +19,7 @@ __author__ = 'Rahul Singal (rahulsingal@google.com)'
 import mimetypes
 import os
 
+import catalog
 import course_explorer
 import webapp2
 
@@ -31,6 +32,7 @@ from controllers.utils import XsrfTokenManager
 from models import courses as Courses
 from models import transforms
 from models.models import StudentProfileDAO
+from models.roles import KEY_ADMIN_USER_EMAILS
 from models.roles import Roles
 
 from google.appengine.api import users
@@ -74,6 +76,7 @@ class BaseStudentHandler(webapp2.RequestHandler):
     def __init__(self, *args, **kwargs):
         super(BaseStudentHandler, self).__init__(*args, **kwargs)
         self.template_values = {}
+        self._catalog = None
         self.initialize_student_state()
 
     def get_locale_for_user(self):
@@ -103,12 +106,43 @@ class BaseStudentHandler(webapp2.RequestHandler):
         if profile.course_info:
             self.courses_progress_dict = transforms.loads(profile.course_info)
 
+    def get_catalog(self):
+        """Returns the catalog entries of all courses, loaded once."""
+        if self._catalog is None:
+            self._catalog = catalog.CourseCatalog.get_entries()
+        return self._catalog
+
+    def get_catalog_entry(self, course):
+        """Returns the catalog entry describing a course."""
+        entry = self.get_catalog().get(course.get_namespace_name())
+        if entry is None:
+            entry = catalog.CourseCatalog.make_entry(course)
+            self._catalog[course.get_namespace_name()] = entry
+        return entry
+
+    def _is_visible(self, course, entry, access_lists):
+        """Checks the access lists of a course named in its catalog entry."""
+        digests = entry['access_lists']
+        if any(digest and digest not in access_lists
+               for digest in digests.itervalues()):
+            # Some list was evicted from memcache; read the course settings.
+            return ((entry['now_available'] and
+                     Roles.is_user_whitelisted(course)) or
+                    Roles.is_course_admin(course))
+        return ((entry['now_available'] and
+                 Roles.is_user_whitelisted_for(
+                     access_lists.get(digests['whitelist']))) or
+                Roles.is_course_admin_for(
+                    access_lists.get(digests[KEY_ADMIN_USER_EMAILS])))
+
     def get_public_courses(self):
         """Get all the public courses."""
+        all_courses = sites.get_all_courses()
+        entries = [self.get_catalog_entry(course) for course in all_courses]
+        access_lists = catalog.CourseCatalog.get_access_lists(entries)
         public_courses = []
-        for course in sites.get_all_courses():
-            if ((course.now_available and Roles.is_user_whitelisted(course))
-                or Roles.is_course_admin(course)):
+        for course, entry in zip(all_courses, entries):
+            if self._is_visible(course, entry, access_lists):
                 public_courses.append(course)
         return public_courses
 
@@ -126,7 +160,7 @@ class BaseStudentHandler(webapp2.RequestHandler):
 
     def get_course_info(self, course):
         """Returns course info required in views."""
-        info = sites.ApplicationContext.get_environ(course)
+        info = {'course': dict(self.get_catalog_entry(course))}
         slug = course.get_slug()
         course_preview_url = slug
         if slug == '/':
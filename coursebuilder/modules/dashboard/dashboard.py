@@ -17,7 +17,6 @@
 __author__ = 'Pavel Simakov (psimakov@google.com)'
 
 import collections
-import copy
 import datetime
 import jinja2
 import logging
@@ -38,7 +37,9 @@ from filer import TextAssetRESTHandler
 from label_editor import LabelManagerAndEditor
 from label_editor import LabelRestHandler
 import messages
+import outline_cache
 from peer_review import AssignmentManager
+import question_index
 from question_editor import GiftQuestionRESTHandler
 from question_editor import McQuestionRESTHandler
 from question_editor import QuestionManagerAndEditor
@@ -79,9 +80,7 @@ from models import roles
 from models import transforms
 from models import vfs
 from models.models import LabelDAO
-from models.models import QuestionDAO
 from models.models import QuestionDTO
-from models.models import QuestionGroupDAO
 from models.models import RoleDAO
 from modules.dashboard import tabs
 from modules.data_source_providers import rest_providers
@@ -123,7 +122,7 @@ class DashboardHandler(
         'edit_question', 'add_question_group', 'edit_question_group',
         'add_label', 'edit_label', 'edit_html_hook', 'question_preview',
         'roles', 'add_role', 'edit_role', 'edit_custom_unit',
-        'import_gift_questions']
+        'import_gift_questions', 'question_list']
     # Requests to these handlers automatically go through an XSRF token check
     # that is implemented in ReflectiveRequestHandler.
     post_actions = [
@@ -501,8 +500,35 @@ class DashboardHandler(
         ret.append(safe_dom.Text(' %s' % text))
         return ret
 
+    # Actions of the XSRF tokens embedded in the rendered course outline.
+    COURSE_OUTLINE_XSRF_TOKEN_ACTIONS = [
+        'course_availability', 'add_lesson', 'set_draft_status',
+        UnitLessonTitleRESTHandler.XSRF_TOKEN]
+
     def _render_course_outline_to_html(self, course):
-        """Renders course outline to HTML."""
+        """Renders course outline to HTML, reusing a cached rendering."""
+        unit_title_template = resources_display.get_unit_title_template(
+            course.app_context)
+        fingerprint = outline_cache.CourseOutlineCache.make_fingerprint(
+            course.title, self.app_context.is_editable_fs(),
+            self.app_context.now_available, unit_title_template,
+            self.app_context.get_current_locale(),
+            self.COURSE_OUTLINE_EXTRA_INFO_TITLES)
+        html = outline_cache.CourseOutlineCache.get(
+            self.app_context, fingerprint)
+        if html is None:
+            html = self._render_course_outline_template(
+                course, unit_title_template)
+            outline_cache.CourseOutlineCache.set(
+                self.app_context, fingerprint, html)
+        return jinja2.Markup(
+            outline_cache.CourseOutlineCache.inject_xsrf_tokens(
+                html, dict(
+                    (action, self.create_xsrf_token(action))
+                    for action in self.COURSE_OUTLINE_XSRF_TOKEN_ACTIONS)))
+
+    def _render_course_outline_template(self, course, unit_title_template):
+        """Renders course outline with placeholders for XSRF tokens."""
 
         units = []
         for unit in course.get_units():
@@ -515,17 +541,18 @@ class DashboardHandler(
             elif unit.type == verify.UNIT_TYPE_UNIT:
                 units.append(self._render_unit_outline(course, unit))
             elif unit.type == verify.UNIT_TYPE_CUSTOM:
-                units.append(self._render_custom_unit_outline(course, unit))
+                units.append(self._render_custom_unit_outline(unit))
             else:
                 raise Exception('Unknown unit type: %s.' % unit.type)
 
+        placeholder = outline_cache.CourseOutlineCache.xsrf_token_placeholder
         template_values = {
             'course': {
                 'title': course.title,
                 'is_editable': self.app_context.is_editable_fs(),
                 'availability': {
                     'url': self.get_action_url('course_availability'),
-                    'xsrf_token': self.create_xsrf_token('course_availability'),
+                    'xsrf_token': placeholder('course_availability'),
                     'param': not self.app_context.now_available,
                     'class': (
                         'reveal-on-hover icon md md-lock-open'
@@ -534,17 +561,15 @@ class DashboardHandler(
                 }
             },
             'units': units,
-            'add_lesson_xsrf_token': self.create_xsrf_token('add_lesson'),
-            'status_xsrf_token': self.create_xsrf_token('set_draft_status'),
-            'unit_lesson_title_xsrf_token': self.create_xsrf_token(
+            'add_lesson_xsrf_token': placeholder('add_lesson'),
+            'status_xsrf_token': placeholder('set_draft_status'),
+            'unit_lesson_title_xsrf_token': placeholder(
                 UnitLessonTitleRESTHandler.XSRF_TOKEN),
-            'unit_title_template': resources_display.get_unit_title_template(
-                course.app_context),
+            'unit_title_template': unit_title_template,
             'extra_info_title': ', '.join(self.COURSE_OUTLINE_EXTRA_INFO_TITLES)
         }
-        return jinja2.Markup(
-            self.get_template(
-                'course_outline.html', []).render(template_values))
+        return self.get_template(
+            'course_outline.html', []).render(template_values)
 
     def _render_status_icon(self, resource, key, component_type):
         if not hasattr(resource, 'now_available'):
@@ -1023,7 +1048,7 @@ class DashboardHandler(
                     safe_dom.Element('blockquote').add_text(caption_if_empty))
         return output
 
-    def _attach_filter_data(self, element):
+    def _attach_filter_data(self, element, index):
         course = courses.Course(self)
         unit_list = []
         assessment_list = []
@@ -1041,13 +1066,15 @@ class DashboardHandler(
         element.add_attribute(
             data_units=transforms.dumps(unit_list + assessment_list),
             data_lessons_map=transforms.dumps(lessons_map),
-            data_questions=transforms.dumps(
-                [(question.id, question.description) for question in sorted(
-                    QuestionDAO.get_all(), key=lambda q: q.description)]
+            data_questions=transforms.dumps(sorted(
+                [(quid, question['description'])
+                 for quid, question in index['questions'].iteritems()],
+                key=lambda q: q[1])
             ),
-            data_groups=transforms.dumps(
-                [(group.id, group.description) for group in sorted(
-                    QuestionGroupDAO.get_all(), key=lambda g: g.description)]
+            data_groups=transforms.dumps(sorted(
+                [(qgid, group['description'])
+                 for qgid, group in index['groups'].iteritems()],
+                key=lambda g: g[1])
             ),
             data_types=transforms.dumps([
                 (QuestionDTO.MULTIPLE_CHOICE, 'Multiple Choice'),
@@ -1181,36 +1208,81 @@ class DashboardHandler(
             'td', colspan=str(colspan), style='text-align: center'
         ).add_text(text)))
 
-    def _get_question_locations(self, quid, location_maps, used_by_groups):
-        """Calculates the locations of a question and its containing groups."""
-        (qulocations_map, qglocations_map) = location_maps
-        locations = qulocations_map.get(quid, None)
-        if locations is None:
-            locations = {'lessons': {}, 'assessments': {}}
-        else:
-            locations = copy.deepcopy(locations)
-        # At this point locations holds counts of the number of times quid
-        # appears in each lesson and assessment. Now adjust the counts by
-        # counting the number of times quid appears in a question group in that
-        # lesson or assessment.
-        lessons = locations['lessons']
-        assessments = locations['assessments']
-        for group in used_by_groups:
-            qglocations = qglocations_map.get(group.id, None)
-            if not qglocations:
-                continue
-            for lesson in qglocations['lessons']:
-                lessons[lesson] = lessons.get(lesson, 0) + 1
-            for assessment in qglocations['assessments']:
-                assessments[assessment] = assessments.get(assessment, 0) + 1
+    def _create_question_rows(self, rows, index):
+        """Creates the <tr> elements of the question table for the rows."""
+        trs = safe_dom.NodeList()
+        for row in rows:
+            tr = safe_dom.Element('tr', data_quid=str(row['id']))
+            # Add description including action icons
+            td = safe_dom.Element('td', className='description')
+            tr.add_child(td)
+            td.add_child(self._create_edit_button(
+                'dashboard?action=edit_question&key=%s' % row['id']))
+            td.add_child(self._create_preview_button())
+            td.add_child(self._create_clone_button(row['id']))
+            td.add_text(row['description'])
+
+            # Add containing question groups
+            cell = safe_dom.Element('td', className='groups')
+            if index['groups']:
+                cell.add_child(self._create_add_to_group_button())
+            cell.add_child(self._create_list(
+                [safe_dom.Text(description) for description in sorted(
+                    index['groups'][qgid]['description']
+                    for qgid in row['group_ids'])]
+            ))
+            tr.add_child(cell)
 
-        return locations
+            # Add locations
+            tr.add_child(self._create_locations_cell(row['locations']))
+
+            # Add last modified timestamp
+            tr.add_child(safe_dom.Element(
+                'td',
+                data_timestamp=str(row['last_modified']),
+                className='timestamp'
+            ))
+
+            # Add question type
+            tr.add_child(safe_dom.Element('td').add_text(
+                'MC' if row['type'] == QuestionDTO.MULTIPLE_CHOICE else (
+                    'SA' if row['type'] == QuestionDTO.SHORT_ANSWER else (
+                    'Unknown Type'))
+            ).add_attribute(style='text-align: center'))
+
+            # Add filter information
+            filter_info = dict(row['filter'])
+            filter_info['description'] = row['description']
+            filter_info['type'] = row['type']
+            filter_info['groups'] = row['group_ids']
+            tr.add_attribute(data_filter=transforms.dumps(filter_info))
+            trs.append(tr)
+        return trs
+
+    def _create_question_pager(self, total):
+        """Creates the paging controls shown when questions span pages."""
+        return safe_dom.Element(
+            'div', className='question-pager', id='question-pager',
+            data_total=str(total),
+            data_page_size=str(question_index.QUESTIONS_PER_PAGE)
+        ).add_child(
+            safe_dom.Element(
+                'button', className='gcb-button prev', disabled='disabled'
+            ).add_text('Previous')
+        ).add_child(
+            safe_dom.Element('span', className='range').add_text(
+                '1 - %s of %s' % (question_index.QUESTIONS_PER_PAGE, total))
+        ).add_child(
+            safe_dom.Element('button', className='gcb-button next').add_text(
+                'Next')
+        )
 
-    def list_questions(self, all_questions, all_question_groups, location_maps):
-        """Prepare a list of the question bank contents."""
+    def list_questions(self, index, location_maps):
+        """Prepare the first page of the question bank contents."""
         if not self.app_context.is_editable_fs():
             return safe_dom.NodeList()
 
+        total, rows = question_index.QuestionIndex.query(index, location_maps)
         output = safe_dom.NodeList().append(
             safe_dom.Element(
                 'a', className='gcb-button gcb-pull-right',
@@ -1229,7 +1301,7 @@ class DashboardHandler(
         ).append(self._create_filter()).append(
             safe_dom.Element('div', style='clear: both; padding-top: 2px;')
         ).append(safe_dom.Element('h3').add_text(
-            'Questions (%s)' % len(all_questions)
+            'Questions (%s)' % total
         ))
 
         # Create questions table
@@ -1238,7 +1310,7 @@ class DashboardHandler(
             ('Description', 25), ('Question Groups', 25),
             ('Course Locations', 25), ('Last Modified', 16), ('Type', 9)]
         )
-        self._attach_filter_data(table)
+        self._attach_filter_data(table, index)
         table.add_attribute(
             data_clone_question_token=self.create_xsrf_token('clone_question'))
         table.add_attribute(
@@ -1247,78 +1319,54 @@ class DashboardHandler(
         table.add_child(tbody)
 
         table.add_child(self._create_empty_footer(
-            'No questions available', 5, all_questions))
-
-        question_to_group = {}
-        for group in all_question_groups:
-            for quid in group.question_ids:
-                question_to_group.setdefault(long(quid), []).append(group)
-
-        for question in all_questions:
-            tr = safe_dom.Element('tr', data_quid=str(question.id))
-            # Add description including action icons
-            td = safe_dom.Element('td', className='description')
-            tr.add_child(td)
-            td.add_child(self._create_edit_button(
-                'dashboard?action=edit_question&key=%s' % question.id))
-            td.add_child(self._create_preview_button())
-            td.add_child(self._create_clone_button(question.id))
-            td.add_text(question.description)
-
-            # Add containing question groups
-            used_by_groups = question_to_group.get(question.id, [])
-            cell = safe_dom.Element('td', className='groups')
-            if all_question_groups:
-                cell.add_child(self._create_add_to_group_button())
-            cell.add_child(self._create_list(
-                [safe_dom.Text(group.description) for group in sorted(
-                    used_by_groups, key=lambda g: g.description)]
-            ))
-            tr.add_child(cell)
+            'No questions available', 5, total))
 
-            # Add locations
-            locations = self._get_question_locations(
-                question.id, location_maps, used_by_groups)
-            tr.add_child(self._create_locations_cell(locations))
-
-            # Add last modified timestamp
-            tr.add_child(safe_dom.Element(
-                'td',
-                data_timestamp=str(question.last_modified),
-                className='timestamp'
-            ))
-
-            # Add question type
-            tr.add_child(safe_dom.Element('td').add_text(
-                'MC' if question.type == QuestionDTO.MULTIPLE_CHOICE else (
-                    'SA' if question.type == QuestionDTO.SHORT_ANSWER else (
-                    'Unknown Type'))
-            ).add_attribute(style='text-align: center'))
+        tbody.add_children(self._create_question_rows(rows, index))
 
-            # Add filter information
-            filter_info = {}
-            filter_info['description'] = question.description
-            filter_info['type'] = question.type
-            filter_info['lessons'] = []
-            unit_ids = set()
-            for (lesson, unit) in locations.get('lessons', ()):
-                unit_ids.add(unit.unit_id)
-                filter_info['lessons'].append(lesson.lesson_id)
-            filter_info['units'] = list(unit_ids) + [
-                a.unit_id for a in  locations.get('assessments', ())]
-            filter_info['groups'] = [qg.id for qg in used_by_groups]
-            filter_info['unused'] = 0 if locations else 1
-            tr.add_attribute(data_filter=transforms.dumps(filter_info))
-            tbody.add_child(tr)
+        # Only a page of questions is rendered when there are many; the rest
+        # is fetched page by page from the question_list action.
+        if total > len(rows):
+            table.add_attribute(
+                data_list_url='dashboard?action=question_list')
+            output.append(self._create_question_pager(total))
 
         return output
 
-    def list_question_groups(
-        self, all_questions, all_question_groups, locations_map):
+    def get_question_list(self):
+        """Returns a filtered page of rows of the question table as JSON."""
+        if not self.app_context.is_editable_fs():
+            transforms.send_json_response(self, 404, 'Read-only course.')
+            return
+
+        def get_int(name):
+            try:
+                return int(self.request.get(name))
+            except ValueError:
+                return None
+
+        index = question_index.QuestionIndex.get()
+        offset = max(get_int('offset') or 0, 0)
+        total, rows = question_index.QuestionIndex.query(
+            index, courses.Course(self).get_component_locations(),
+            description=self.request.get('description'),
+            question_type=get_int('type'),
+            unit_id=get_int('unit'),
+            lesson_id=get_int('lesson'),
+            group_id=get_int('group'),
+            unused=self.request.get('unused') == 'true',
+            offset=offset)
+        transforms.send_json_response(self, 200, 'OK', payload_dict={
+            'total': total,
+            'offset': offset,
+            'rows': self._create_question_rows(rows, index).sanitized})
+
+    def list_question_groups(self, index, locations_map):
         """Prepare a list of question groups."""
         if not self.app_context.is_editable_fs():
             return safe_dom.NodeList()
 
+        all_question_groups = sorted(
+            index['groups'].iteritems(), key=lambda g: g[1]['description'])
         output = safe_dom.NodeList()
         output.append(
             safe_dom.Element(
@@ -1347,32 +1395,32 @@ class DashboardHandler(
             table.add_child(self._create_empty_footer(
                 'No question groups available', 4))
 
-        quid_to_question = {long(qu.id): qu for qu in all_questions}
-        for question_group in all_question_groups:
-            tr = safe_dom.Element('tr', data_qgid=str(question_group.id))
+        all_questions = index['questions']
+        for qgid, question_group in all_question_groups:
+            tr = safe_dom.Element('tr', data_qgid=str(qgid))
             # Add description including action icons
             td = safe_dom.Element('td', className='description')
             tr.add_child(td)
             td.add_child(self._create_edit_button(
-                'dashboard?action=edit_question_group&key=%s' % (
-                question_group.id)))
-            td.add_text(question_group.description)
+                'dashboard?action=edit_question_group&key=%s' % qgid))
+            td.add_text(question_group['description'])
 
             # Add questions
             tr.add_child(self._create_list_cell([
                 safe_dom.Text(descr) for descr in sorted([
-                    quid_to_question[long(quid)].description
-                    for quid in question_group.question_ids])
+                    all_questions[quid]['description']
+                    for quid in question_group['question_ids']
+                    if quid in all_questions])
             ]).add_attribute(className='questions'))
 
             # Add locations
             tr.add_child(self._create_locations_cell(
-                locations_map.get(question_group.id, {})))
+                locations_map.get(qgid, {})))
 
             # Add last modified timestamp
             tr.add_child(safe_dom.Element(
                 'td',
-                data_timestamp=str(question_group.last_modified),
+                data_timestamp=str(question_group['last_modified']),
                 className='timestamp'
             ))
 
@@ -1461,14 +1509,11 @@ class DashboardHandler(
                 items.append(asset_lister(self))
 
     def get_assets_questions(self, items, tab, all_paths):
-        all_questions = QuestionDAO.get_all()
-        all_question_groups = QuestionGroupDAO.get_all()
+        index = question_index.QuestionIndex.get()
         locations = courses.Course(
             self).get_component_locations()
-        items.append(self.list_questions(
-            all_questions, all_question_groups, locations))
-        items.append(self.list_question_groups(
-            all_questions, all_question_groups, locations[1]))
+        items.append(self.list_questions(index, locations))
+        items.append(self.list_question_groups(index, locations[1]))
 
     def get_assets_labels(self, items, tab, all_paths):
         items.append(self.list_labels())
@@ -1629,11 +1674,15 @@ def register_module():
             custom_module, DashboardHandler.permissions_callback)
         ApplicationHandler.RIGHT_LINKS.append(
             DashboardHandler.generate_dashboard_link)
+        question_index.register_hooks()
+        outline_cache.register_hooks()
 
     def on_module_disabled():
         roles.Roles.unregister_permissions(custom_module)
         ApplicationHandler.RIGHT_LINKS.remove(
             DashboardHandler.generate_dashboard_link)
+        question_index.unregister_hooks()
+        outline_cache.unregister_hooks()
 
     data_sources.Registry.register(
         student_answers_analytics.QuestionAnswersDataSource)
@@ -0,0 +1,99 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Cached rendering of the course outline shown on the dashboard."""
+
+import hashlib
+import os
+
+from models import MemcacheManager
+from models import courses
+from models.counters import PerfCounter
+
+OUTLINE_CACHE_HIT = PerfCounter(
+    'gcb-dashboard-outline-cache-hit',
+    'A number of times the rendered course outline was found in memcache.')
+OUTLINE_CACHE_MISS = PerfCounter(
+    'gcb-dashboard-outline-cache-miss',
+    'A number of times the course outline had to be rendered.')
+
+
+class CourseOutlineCache(object):
+    """Keeps the rendered course outline of a course in memcache.
+
+    Rendering the outline walks every unit and lesson of the course and runs
+    all the outline annotators, on every visit to the dashboard. The rendered
+    HTML only changes when the course structure is saved, so it is kept in the
+    course namespace and dropped by a hook on courses.CourseModel13.save().
+
+    The outline also depends on a few course settings and on the deployed
+    version of the application; these are hashed into a fingerprint stored
+    along with the HTML, and a cached copy with a different fingerprint is
+    ignored.
+
+    XSRF tokens are issued per user and must never be shared through the
+    cache. The outline is rendered with placeholders in their place, which
+    are replaced with the tokens of the current user when it is served.
+    """
+
+    MEMCACHE_KEY = 'dashboard:course_outline'
+    XSRF_TOKEN_PLACEHOLDER = '__gcb_outline_xsrf_token_%s__'
+
+    @classmethod
+    def xsrf_token_placeholder(cls, action):
+        return cls.XSRF_TOKEN_PLACEHOLDER % action
+
+    @classmethod
+    def make_fingerprint(cls, *args):
+        """Hashes the values the outline depends on besides the course."""
+        values = (os.environ.get('CURRENT_VERSION_ID'),) + args
+        return hashlib.md5(repr(values)).hexdigest()
+
+    @classmethod
+    def get(cls, app_context, fingerprint):
+        """Returns the cached outline HTML with placeholders, or None."""
+        entry = MemcacheManager.get(
+            cls.MEMCACHE_KEY, namespace=app_context.get_namespace_name())
+        if entry and entry.get('fingerprint') == fingerprint:
+            OUTLINE_CACHE_HIT.inc()
+            return entry['html']
+        OUTLINE_CACHE_MISS.inc()
+        return None
+
+    @classmethod
+    def set(cls, app_context, fingerprint, html):
+        MemcacheManager.set(
+            cls.MEMCACHE_KEY, {'fingerprint': fingerprint, 'html': html},
+            namespace=app_context.get_namespace_name())
+
+    @classmethod
+    def invalidate(cls, app_context=None):
+        """Drops the outline of a course; by default of the current one."""
+        namespace = app_context.get_namespace_name() if app_context else None
+        MemcacheManager.delete(cls.MEMCACHE_KEY, namespace=namespace)
+
+    @classmethod
+    def inject_xsrf_tokens(cls, html, tokens):
+        """Replaces placeholders with tokens from a dict keyed by action."""
+        for action, token in tokens.iteritems():
+            html = html.replace(cls.xsrf_token_placeholder(action), token)
+        return html
+
+
+def register_hooks():
+    courses.CourseModel13.POST_SAVE_HOOKS.append(CourseOutlineCache.invalidate)
+
+
+def unregister_hooks():
+    courses.CourseModel13.POST_SAVE_HOOKS.remove(CourseOutlineCache.invalidate)
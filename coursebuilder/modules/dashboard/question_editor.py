@@ -17,8 +17,11 @@
 __author__ = 'John Orr (jorr@google.com)'
 
 import copy
+import zlib
 
 from common import schema_fields
+from common import utils as common_utils
+from models import entities
 from models import roles
 from models import transforms
 from models import models
@@ -27,6 +30,35 @@ from modules.assessment_tags import gift
 from modules.dashboard import dto_editor
 from modules.dashboard import utils as dashboard_utils
 
+from google.appengine.ext import db
+from google.appengine.ext import deferred
+
+# Int. Imports of more questions than this are saved by a deferred task.
+MAX_QUESTIONS_IMPORTED_INLINE = 100
+
+# Int. Number of questions saved by one QuestionDAO.save_all() call.
+QUESTION_IMPORT_BATCH_SIZE = 100
+
+# Int. Maximum size of the compressed questions of a deferred import; they
+# are kept in a single entity.
+MAX_GIFT_IMPORT_SIZE = 1000 * 1000
+
+
+class GiftImportEntity(entities.BaseEntity):
+    """A large GIFT import in progress, saved by _import_gift_questions().
+
+    The parsed questions are kept once, compressed, along with ids allocated
+    up front for all of them and for their question group. Each task saves
+    one batch of questions under their allocated ids, so a retried task
+    overwrites what it already saved rather than adding copies.
+    """
+
+    description = db.TextProperty(indexed=False)
+    questions = db.BlobProperty()
+    first_question_id = db.IntegerProperty(indexed=False)
+    group_id = db.IntegerProperty(indexed=False)
+    num_saved = db.IntegerProperty(indexed=False, default=0)
+
 
 class QuestionManagerAndEditor(dto_editor.BaseDatastoreAssetEditor):
     """An editor for editing and managing questions."""
@@ -303,7 +335,7 @@ class GiftQuestionRESTHandler(dto_editor.BaseDatastoreRestHandler):
         return gift_questions
 
     def validate_question_descriptions(self, questions, errors):
-        descriptions = [q.description for q in models.QuestionDAO.get_all()]
+        descriptions = set(q.description for q in models.QuestionDAO.get_all())
         for question in questions:
             if question['description'] in descriptions:
                 errors.append(
@@ -321,7 +353,8 @@ class GiftQuestionRESTHandler(dto_editor.BaseDatastoreRestHandler):
             'questions': '',
             'description': ''}
 
-    def convert_to_dtos(self, questions):
+    @classmethod
+    def convert_to_dtos(cls, questions):
         dtos = []
         for question in questions:
             question['version'] = models.QuestionDAO.VERSION
@@ -333,15 +366,20 @@ class GiftQuestionRESTHandler(dto_editor.BaseDatastoreRestHandler):
             dtos.append(dto)
         return dtos
 
-    def create_group(self, description, question_ids):
-        group = {
+    @classmethod
+    def make_group(cls, description, question_ids):
+        return {
             'version': models.QuestionDAO.VERSION,
             'description': description,
             'introduction': '',
             'items': [{
                 'question': str(x),
                 'weight': 1.0} for x in question_ids]}
-        return models.QuestionGroupDAO.create_question_group(group)
+
+    @classmethod
+    def create_group(cls, description, question_ids):
+        return models.QuestionGroupDAO.create_question_group(
+            cls.make_group(description, question_ids))
 
     def put(self):
         """Store a QuestionGroupDTO and QuestionDTO in the datastore."""
@@ -359,28 +397,115 @@ class GiftQuestionRESTHandler(dto_editor.BaseDatastoreRestHandler):
         json_dict = transforms.loads(payload)
 
         errors = []
+        deferred_import = False
         try:
             python_dict = transforms.json_to_dict(
                 json_dict, self.get_schema().get_json_schema_dict())
-            questions = gift.GiftParser.parse_questions(
-                python_dict['questions'])
-            self.validate_question_descriptions(questions, errors)
-            self.validate_group_description(
-                python_dict['description'], errors)
+            questions, errors = gift.GiftParser.parse_questions_with_errors(
+                python_dict['questions'] or '')
+            if not questions and not errors:
+                errors.append('No questions found.')
             if not errors:
-                dtos = self.convert_to_dtos(questions)
-                question_ids = models.QuestionDAO.save_all(dtos)
-                self.create_group(python_dict['description'], question_ids)
+                self.validate_question_descriptions(questions, errors)
+                self.validate_group_description(
+                    python_dict['description'], errors)
+            if not errors:
+                if len(questions) > MAX_QUESTIONS_IMPORTED_INLINE:
+                    _start_gift_import(
+                        self.app_context.get_namespace_name(),
+                        python_dict['description'], questions)
+                    deferred_import = True
+                else:
+                    question_ids = _save_questions(questions)
+                    self.create_group(python_dict['description'], question_ids)
         except ValueError as e:
             errors.append(str(e))
-        except gift.ParseError as e:
-            errors.append(str(e))
         except models.CollisionError as e:
             errors.append(str(e))
         if errors:
             self.validation_error('\n'.join(errors))
             return
 
-        msg = 'Saved: %s.' % python_dict['description']
+        if deferred_import:
+            msg = 'Importing %s questions into: %s.' % (
+                len(questions), python_dict['description'])
+        else:
+            msg = 'Saved: %s.' % python_dict['description']
         transforms.send_json_response(self, 200, msg)
         return
+
+
+def _save_questions(questions):
+    """Saves question dicts in batches; returns the ids of new questions."""
+    question_ids = []
+    for i in xrange(0, len(questions), QUESTION_IMPORT_BATCH_SIZE):
+        dtos = GiftQuestionRESTHandler.convert_to_dtos(
+            questions[i:i + QUESTION_IMPORT_BATCH_SIZE])
+        question_ids.extend(models.QuestionDAO.save_all(dtos))
+    return question_ids
+
+
+def _allocate_ids(entity_class, count):
+    first_id, _ = db.allocate_ids(db.Key.from_path(entity_class.kind(), 1),
+                                  count)
+    return first_id
+
+
+def _start_gift_import(namespace, description, questions):
+    """Saves a large GIFT import and queues the task importing it."""
+    data = zlib.compress(transforms.dumps(questions))
+    if len(data) > MAX_GIFT_IMPORT_SIZE:
+        raise ValueError(
+            'Too many questions to import at once; please split them into '
+            'several imports.')
+    with common_utils.Namespace(namespace):
+        gift_import = GiftImportEntity(
+            description=description, questions=data,
+            first_question_id=_allocate_ids(
+                models.QuestionEntity, len(questions)),
+            group_id=_allocate_ids(models.QuestionGroupEntity, 1))
+        gift_import.put()
+    deferred.defer(_import_gift_questions, namespace, gift_import.key().id())
+
+
+def _import_gift_questions(namespace, import_id):
+    """Deferred task saving a large GIFT import one batch at a time.
+
+    Each task saves a single batch, under ids allocated when the import was
+    started, and then records its progress together with queueing the task
+    for the next batch, so no task runs into the request deadline and a
+    retried task only overwrites its own batch. The last task creates the
+    question group, also under an allocated id, and deletes the import.
+    """
+    with common_utils.Namespace(namespace):
+        gift_import = GiftImportEntity.get_by_id(import_id)
+        if not gift_import:
+            return
+        questions = transforms.loads(zlib.decompress(gift_import.questions))
+        start = gift_import.num_saved
+        if start < len(questions):
+            end = start + QUESTION_IMPORT_BATCH_SIZE
+            dtos = GiftQuestionRESTHandler.convert_to_dtos(
+                questions[start:end])
+            for index, dto in enumerate(dtos, start):
+                dto.id = gift_import.first_question_id + index
+            models.QuestionDAO.save_all(dtos)
+            db.run_in_transaction(
+                _record_gift_import_progress, import_id, end, namespace)
+        else:
+            question_ids = range(
+                gift_import.first_question_id,
+                gift_import.first_question_id + len(questions))
+            models.QuestionGroupDAO.save(models.QuestionGroupDTO(
+                gift_import.group_id,
+                GiftQuestionRESTHandler.make_group(
+                    gift_import.description, question_ids)))
+            gift_import.delete()
+
+
+def _record_gift_import_progress(import_id, num_saved, namespace):
+    gift_import = GiftImportEntity.get_by_id(import_id)
+    gift_import.num_saved = num_saved
+    gift_import.put()
+    deferred.defer(_import_gift_questions, namespace, import_id,
+                   _transactional=True)
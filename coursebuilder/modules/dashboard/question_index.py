@@ -0,0 +1,239 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Cached summary of the question bank used by the dashboard listings."""
+
+import copy
+
+from models import MemcacheManager
+from models import models
+from models.counters import PerfCounter
+
+# Int. Number of questions shown on one page of the question bank listing.
+QUESTIONS_PER_PAGE = 50
+
+QUESTION_INDEX_HIT = PerfCounter(
+    'gcb-dashboard-question-index-hit',
+    'A number of times the question index was found in memcache.')
+QUESTION_INDEX_REBUILD = PerfCounter(
+    'gcb-dashboard-question-index-rebuild',
+    'A number of times the question index was rebuilt from the datastore.')
+
+
+class QuestionIndex(object):
+    """A compact per-course summary of all questions and question groups.
+
+    Listing the question bank used to deserialize every question and every
+    group on each page view. The index keeps only the fields needed to list,
+    filter and sort questions under a single memcache key in the course
+    namespace. DAO hooks drop it whenever questions or groups are saved or
+    deleted, and it is rebuilt from the datastore on the next read. Updating
+    the cached copy in place instead would let concurrent saves overwrite
+    each other's changes.
+
+    The index is a dict with two entries:
+        'questions': maps question id to a dict with 'description', 'type'
+            and 'last_modified'.
+        'groups': maps question group id to a dict with 'description',
+            'question_ids' and 'last_modified'.
+
+    Locations of questions depend on the content of units and lessons rather
+    than on the question bank, so they are joined in at query time from
+    courses.Course.get_component_locations().
+    """
+
+    MEMCACHE_KEY = 'dashboard:question_index'
+
+    @classmethod
+    def _question_entry(cls, question):
+        return {
+            'description': question.description,
+            'type': question.type,
+            'last_modified': question.last_modified}
+
+    @classmethod
+    def _group_entry(cls, group):
+        return {
+            'description': group.description,
+            'question_ids': [long(quid) for quid in group.question_ids],
+            'last_modified': group.last_modified}
+
+    @classmethod
+    def _build(cls):
+        QUESTION_INDEX_REBUILD.inc()
+        return {
+            'questions': dict(
+                (question.id, cls._question_entry(question))
+                for question in models.QuestionDAO.get_all()),
+            'groups': dict(
+                (group.id, cls._group_entry(group))
+                for group in models.QuestionGroupDAO.get_all())}
+
+    @classmethod
+    def get(cls):
+        """Returns the index of the current course, building it if needed."""
+        index = MemcacheManager.get(cls.MEMCACHE_KEY)
+        if index is not None:
+            QUESTION_INDEX_HIT.inc()
+            return index
+        index = cls._build()
+        MemcacheManager.set(cls.MEMCACHE_KEY, index)
+        return index
+
+    @classmethod
+    def invalidate(cls, unused_dtos=None):
+        """Drops the index of the current course; it is rebuilt on read."""
+        MemcacheManager.delete(cls.MEMCACHE_KEY)
+
+    @classmethod
+    def get_groups_by_question(cls, index):
+        """Returns a dict mapping question ids to the ids of their groups."""
+        groups_by_question = {}
+        for group_id, group in index['groups'].iteritems():
+            for quid in group['question_ids']:
+                groups_by_question.setdefault(quid, []).append(group_id)
+        return groups_by_question
+
+    @classmethod
+    def query(cls, index, location_maps, description='', question_type=None,
+              unit_id=None, lesson_id=None, group_id=None, unused=False,
+              offset=0, limit=None):
+        """Filters, sorts and pages through the questions of an index.
+
+        Args:
+            index: dict. The index returned by get().
+            location_maps: tuple. The maps returned by
+                courses.Course.get_component_locations().
+            description: string. Only questions with a description containing
+                this text, ignoring case, are returned.
+            question_type: int. If set, the type of questions to return.
+            unit_id: int. If set, only questions used in this unit or
+                assessment are returned.
+            lesson_id: int. If set, only questions used in this lesson are
+                returned.
+            group_id: int. If set, only questions in this group are returned.
+            unused: boolean. If set, only questions not used anywhere in the
+                course are returned.
+            offset: int. The number of matching questions to skip.
+            limit: int. The maximum number of questions to return; defaults
+                to QUESTIONS_PER_PAGE.
+
+        Returns:
+            A tuple (total, rows) where total is the number of questions
+            matching the filters and rows is a list of the requested page of
+            them, sorted by description. Each row is a dict holding the fields
+            of the index entry plus 'id', 'group_ids', 'locations' and
+            'filter', which are described in make_row().
+        """
+        description = (description or '').lower()
+        limit = limit or QUESTIONS_PER_PAGE
+        groups_by_question = cls.get_groups_by_question(index)
+        rows = []
+        for quid, question in index['questions'].iteritems():
+            if description not in question['description'].lower():
+                continue
+            if question_type is not None and question['type'] != question_type:
+                continue
+            group_ids = groups_by_question.get(quid, [])
+            if group_id is not None and group_id not in group_ids:
+                continue
+            row = cls.make_row(quid, question, group_ids, location_maps)
+            row_filter = row['filter']
+            if unused and not row_filter['unused']:
+                continue
+            if unit_id is not None and unit_id not in row_filter['units']:
+                continue
+            if lesson_id is not None and lesson_id not in row_filter['lessons']:
+                continue
+            rows.append(row)
+        rows.sort(key=lambda row: (row['description'].lower(), row['id']))
+        return len(rows), rows[offset:offset + limit]
+
+    @classmethod
+    def make_row(cls, quid, question, group_ids, location_maps):
+        """Joins an index entry with the locations of the question.
+
+        Args:
+            quid: int. The id of the question.
+            question: dict. The entry of the question in the index.
+            group_ids: list of int. The ids of groups containing the question.
+            location_maps: tuple. The maps returned by
+                courses.Course.get_component_locations().
+
+        Returns:
+            A copy of the entry with the following fields added:
+                id: the id of the question.
+                group_ids: the ids of groups containing the question.
+                locations: a dict of the lessons and assessments using the
+                    question, directly or through a group, as described in
+                    courses.Course.get_component_locations().
+                filter: a dict of the 'units' and 'lessons' ids using the
+                    question and the 'unused' flag, as used by the filter.
+        """
+        locations = get_question_locations(quid, location_maps, group_ids)
+        row = dict(question)
+        row['id'] = quid
+        row['group_ids'] = group_ids
+        row['locations'] = locations
+
+        lesson_ids = []
+        unit_ids = set()
+        for (lesson, unit) in locations.get('lessons', ()):
+            unit_ids.add(unit.unit_id)
+            lesson_ids.append(lesson.lesson_id)
+        row['filter'] = {
+            'units': list(unit_ids) + [
+                a.unit_id for a in locations.get('assessments', ())],
+            'lessons': lesson_ids,
+            'unused': 0 if (
+                locations['lessons'] or locations['assessments']) else 1}
+        return row
+
+
+def get_question_locations(quid, location_maps, group_ids):
+    """Calculates the locations of a question and its containing groups."""
+    (qulocations_map, qglocations_map) = location_maps
+    locations = qulocations_map.get(quid, None)
+    if locations is None:
+        locations = {'lessons': {}, 'assessments': {}}
+    else:
+        locations = copy.deepcopy(locations)
+    # At this point locations holds counts of the number of times quid
+    # appears in each lesson and assessment. Now adjust the counts by
+    # counting the number of times quid appears in a question group in that
+    # lesson or assessment.
+    lessons = locations['lessons']
+    assessments = locations['assessments']
+    for group_id in group_ids:
+        qglocations = qglocations_map.get(group_id, None)
+        if not qglocations:
+            continue
+        for lesson in qglocations['lessons']:
+            lessons[lesson] = lessons.get(lesson, 0) + 1
+        for assessment in qglocations['assessments']:
+            assessments[assessment] = assessments.get(assessment, 0) + 1
+
+    return locations
+
+
+def register_hooks():
+    for dao in (models.QuestionDAO, models.QuestionGroupDAO):
+        dao.POST_SAVE_HOOKS.append(QuestionIndex.invalidate)
+        dao.POST_DELETE_HOOKS.append(QuestionIndex.invalidate)
+
+
+def unregister_hooks():
+    for dao in (models.QuestionDAO, models.QuestionGroupDAO):
+        dao.POST_SAVE_HOOKS.remove(QuestionIndex.invalidate)
+        dao.POST_DELETE_HOOKS.remove(QuestionIndex.invalidate)
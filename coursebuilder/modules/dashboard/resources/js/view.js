@@ -231,10 +231,10 @@ function setUpCloneQuestion() {
 }
 
 /**
- * Fills in local times using data-timestamp attribute.
+ * Fills in local times of the elements using data-timestamp attribute.
  */
-function setUpLocalTimes() {
-  $(".assets-table tbody .timestamp").each(function() {
+function formatLocalTimes(elements) {
+  elements.each(function() {
     if ($(this).data("timestamp")) {
       $(this).html((new Date(
         parseFloat($(this).data("timestamp"))*1000)).toLocaleString());
@@ -242,6 +242,10 @@ function setUpLocalTimes() {
   });
 }
 
+function setUpLocalTimes() {
+  formatLocalTimes($(".assets-table tbody .timestamp"));
+}
+
 /**
  * Sets up handlers for modal window.
  */
@@ -253,30 +257,44 @@ function setUpModalWindow() {
   $("#modal-container > div").hide();
 }
 
+function onQuestionPreviewClick(e) {
+  openModal();
+  var params = {
+      action: "question_preview",
+      quid: $(this).closest("tr").data("quid")
+  };
+  $("#question-preview").html($("<iframe />").attr(
+    {id: "question-preview", src: "dashboard?" + $.param(params)})).show();
+}
+
+function onAddToGroupClick(e) {
+  openModal();
+  var popup = $("#add-to-group");
+  var row = $(this).closest("tr");
+  popup.find(".description").text(row.find(".description").text());
+  popup.find(".question").val(row.data("quid"));
+  popup.show();
+}
+
+/**
+ * Binds the handlers of the action icons of rows of the question table.
+ */
+function bindQuestionRowHandlers(rows) {
+  rows.find(".md-content-copy").on("click", onCloneQuestionClick);
+  rows.find(".md-visibility").on("click", onQuestionPreviewClick);
+  rows.find(".md-add-circle").on("click", onAddToGroupClick);
+  formatLocalTimes(rows.find(".timestamp"));
+}
+
 function setUpQuestionPreview() {
   // Bind preview button to show question preview
-  $("table.assets-table .md-visibility").on("click", function(e) {
-    openModal();
-    var params = {
-        action: "question_preview",
-        quid: $(this).closest("tr").data("quid")
-    };
-    $("#question-preview").html($("<iframe />").attr(
-      {id: "question-preview", src: "dashboard?" + $.param(params)})).show();
-  });
+  $("table.assets-table .md-visibility").on("click", onQuestionPreviewClick);
 }
 
 function setUpAddToGroup() {
 
   function addBindings() {
-    $(".md-add-circle").on("click", function(e) {
-      openModal();
-      var popup = $("#add-to-group");
-      var row = $(this).closest("tr");
-      popup.find(".description").text(row.find(".description").text());
-      popup.find(".question").val(row.data("quid"));
-      popup.show();
-    });
+    $(".md-add-circle").on("click", onAddToGroupClick);
 
     $("#add-to-group .submit").on("click", function(e) {
       e.preventDefault();
@@ -356,7 +374,60 @@ function setUpFiltering() {
     onUnitFieldChange(form, lessonsMap);
   }
 
+  function getFilterParams(form) {
+    return {
+      description: form.find(".description").val(),
+      type: form.find(".type").val(),
+      unit: form.find(".unit").val(),
+      lesson: form.find(".lesson").val(),
+      group: form.find(".group").val(),
+      unused: form.find(".unused").prop("checked")
+    };
+  }
+
+  function showQuestionPage(data) {
+    var response = parseJson(data);
+    if (response.status != 200) {
+      cbShowAlert("Error: " + response.message);
+      return;
+    }
+    var payload = parseJson(response.payload);
+    var table = $("#question-table");
+    var tbody = table.find("tbody").html(payload.rows);
+    bindQuestionRowHandlers(tbody);
+    table.find("th").each(function() {
+      updateSortTable($(this));
+    });
+    table.find("tfoot").toggle(payload.total == 0);
+
+    var pager = $("#question-pager");
+    var pageSize = pager.data("page-size");
+    var last = Math.min(payload.offset + pageSize, payload.total);
+    pager.data("offset", payload.offset);
+    pager.find(".range").text(
+      (payload.total ? payload.offset + 1 : 0) + " - " + last + " of " +
+      payload.total);
+    pager.find(".prev").prop("disabled", payload.offset == 0);
+    pager.find(".next").prop("disabled", last >= payload.total);
+  }
+
+  /**
+   * Fetches a page of the question table from the server. Used in place of
+   * filtering rows in the browser when the course has too many questions to
+   * render all of them at once.
+   */
+  function fetchQuestionPage(form, offset) {
+    var params = getFilterParams(form);
+    params.offset = offset;
+    $.get($("#question-table").data("list-url"), params, showQuestionPage,
+        "text");
+  }
+
   function filterQuestions(form) {
+    if ($("#question-table").data("list-url")) {
+      fetchQuestionPage(form, 0);
+      return;
+    }
     // Get values from filter form
     var descriptionFilter = form.find(".description").val().toLowerCase();
     var typeFilter = form.find(".type").val();
@@ -488,6 +559,17 @@ function setUpFiltering() {
     form.on("submit", function(e) {
       e.preventDefault();
     });
+
+    // Bind the paging buttons shown when questions are paginated
+    var pager = $("#question-pager");
+    pager.data("offset", 0);
+    pager.find(".prev").on("click", function(e) {
+      fetchQuestionPage(form, Math.max(
+        pager.data("offset") - pager.data("page-size"), 0));
+    });
+    pager.find(".next").on("click", function(e) {
+      fetchQuestionPage(form, pager.data("offset") + pager.data("page-size"));
+    });
   }
 
   function setUpFilterBindings() {
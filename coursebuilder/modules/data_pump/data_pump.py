@@ -22,10 +22,14 @@ import base64
 import collections
 import copy
 import datetime
+import hashlib
 import logging
 import os
+import Queue
 import random
 import re
+import sys
+import threading
 import time
 import urllib
 
@@ -45,6 +49,7 @@ from models import analytics
 from models import courses
 from models import custom_modules
 from models import data_sources
+from models import entities
 from models import jobs
 from models import roles
 from models import transforms
@@ -78,6 +83,25 @@ BIGQUERY_UI_URL_PREFIX = 'https://bigquery.cloud.google.com/table/'
 MAX_CONSECUTIVE_FAILURES = 10
 MAX_RETRY_BACKOFF_SECONDS = 600
 
+# Number of pages sent to BigQuery by each deferred task.  Pages are always
+# sent in order, as the resumable upload protocol requires; sending more
+# than one per task saves the re-queueing and upload status check otherwise
+# done between pages.
+DEFAULT_PAGES_PER_TASK = 1
+MAX_PAGES_PER_TASK = 20
+
+# Number of pages of a task read ahead of the one being sent, by a worker
+# thread, so that reading the data overlaps with sending it.  Pages are read
+# in order, one at a time, as each continues from the cursor left by the
+# previous one; this bounds how many wait in memory to be sent.  With 0,
+# pages are read only between uploads.
+DEFAULT_PAGES_FETCHED_AHEAD = 1
+MAX_PAGES_FETCHED_AHEAD = 5
+
+# Items added this recently are left to the next export of data sources
+# with a watermark column, as they may not be visible to queries yet.
+WATERMARK_LAG_SECONDS = 60
+
 # Config for secret
 PII_SECRET_LENGTH = 20
 PII_SECRET_DEFAULT_LIFETIME = '30 days'
@@ -92,6 +116,9 @@ CONSECUTIVE_FAILURES = 'consecutive_failures'
 FAILURE_REASON = 'failure_reason'
 ITEMS_UPLOADED = 'items_uploaded'
 PII_SECRET = 'pii_secret'
+WATERMARK_SINCE = 'watermark_since'
+WATERMARK_UNTIL = 'watermark_until'
+WATERMARK_FINGERPRINT = 'watermark_fingerprint'
 
 # Constants for items within course settings schema
 DATA_PUMP_SETTINGS_SCHEMA_SECTION = 'data_pump'
@@ -99,6 +126,8 @@ PROJECT_ID = 'project_id'
 DATASET_NAME = 'dataset_name'
 JSON_KEY = 'json_key'
 TABLE_LIFETIME = 'table_lifetime'
+PAGES_PER_TASK = 'pages_per_task'
+PAGES_FETCHED_AHEAD = 'pages_fetched_ahead'
 PII_ENCRYPTION_TOKEN = 'pii_encryption_token'
 
 # Discovery service lookup retries constants
@@ -118,6 +147,100 @@ def _get_data_source_class_by_name(name):
     return None
 
 
+class DataPumpWatermarkEntity(entities.BaseEntity):
+    """Records how far the items of a data source have been exported.
+
+    There is one of these per course and data source with a watermark
+    column, keyed by the name of the data source class.  'until' is the
+    value of the watermark column, as exported to JSON, up to which (and
+    not including) items were sent by the last completed export.
+    'fingerprint' identifies the schema and PII secret of the exported
+    items; items exported with a different one cannot be appended to the
+    same table.
+    """
+
+    until = db.StringProperty(indexed=False)
+    fingerprint = db.StringProperty(indexed=False)
+
+
+class _PageFetcher(object):
+    """Reads the pages of a task in order, ahead of their upload if allowed.
+
+    With max_pages_ahead above 0, a worker thread reads up to num_pages
+    pages from first_page on, stopping after the last page of the data, and
+    queues them; get() returns them in order.  Errors raised by the worker
+    are raised again by get().  The data source context is only updated
+    while holding 'lock', which callers also hold to read it.  close() must
+    be called when done, to stop and wait for the worker.
+    """
+
+    _POLL_SECONDS = 0.1
+
+    def __init__(self, fetch_fn, is_last_fn, namespace, first_page, num_pages,
+                 max_pages_ahead):
+        self.lock = threading.Lock()
+        self._fetch_fn = fetch_fn
+        self._next_page = first_page
+        self._thread = None
+        if max_pages_ahead:
+            self._queue = Queue.Queue(maxsize=max_pages_ahead)
+            self._closed = threading.Event()
+            self._thread = threading.Thread(
+                target=self._fetch_pages,
+                args=(is_last_fn, namespace, first_page, num_pages))
+            self._thread.start()
+
+    def _put(self, item):
+        while not self._closed.is_set():
+            try:
+                self._queue.put(item, timeout=self._POLL_SECONDS)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def _fetch_pages(self, is_last_fn, namespace, first_page, num_pages):
+        with common_utils.Namespace(namespace):
+            for page in xrange(first_page, first_page + num_pages):
+                try:
+                    with self.lock:
+                        data, actual_page = self._fetch_fn(page)
+                # pylint: disable=broad-except
+                except Exception:
+                    self._put((None, None, sys.exc_info()))
+                    return
+                if (not self._put((data, actual_page, None)) or
+                    not data or actual_page != page or is_last_fn(data)):
+                    return
+
+    def get(self):
+        """Returns the next page as a (data, actual page number) tuple."""
+        if not self._thread:
+            with self.lock:
+                page = self._next_page
+                self._next_page += 1
+                return self._fetch_fn(page)
+        while True:
+            try:
+                data, actual_page, exc_info = self._queue.get(
+                    timeout=self._POLL_SECONDS)
+                break
+            except Queue.Empty:
+                if not self._thread.is_alive() and self._queue.empty():
+                    raise Exception(
+                        'Internal error - page %d was not read.' %
+                        self._next_page)
+        self._next_page += 1
+        if exc_info:
+            raise exc_info[0], exc_info[1], exc_info[2]
+        return data, actual_page
+
+    def close(self):
+        if self._thread:
+            self._closed.set()
+            self._thread.join()
+
+
 class DataPumpJob(jobs.DurableJobBase):
 
     @staticmethod
@@ -139,7 +262,8 @@ class DataPumpJob(jobs.DurableJobBase):
         """
 
     def __init__(self, app_context, data_source_class_name,
-                 no_expiration_date=False, send_uncensored_pii_data=False):
+                 no_expiration_date=False, send_uncensored_pii_data=False,
+                 incremental=False):
         if not _get_data_source_class_by_name(data_source_class_name):
             raise ValueError(
               'No such data source "%s", or data source is not marked '
@@ -151,6 +275,7 @@ class DataPumpJob(jobs.DurableJobBase):
                                                  self._namespace)
         self._no_expiration_date = no_expiration_date
         self._send_uncensored_pii_data = send_uncensored_pii_data
+        self._incremental = incremental
 
     def non_transactional_submit(self):
         """Callback used when UI gesture indicates this job should start."""
@@ -199,6 +324,9 @@ class DataPumpJob(jobs.DurableJobBase):
             FAILURE_REASON: '',
             ITEMS_UPLOADED: 0,
             PII_SECRET: pii_secret,
+            WATERMARK_SINCE: None,
+            WATERMARK_UNTIL: None,
+            WATERMARK_FINGERPRINT: None,
             }
         return job_context
 
@@ -374,7 +502,9 @@ class DataPumpJob(jobs.DurableJobBase):
           and dataset_id members.  The first three are required to connect
           to BigQuery, and the last is the dataset within BigQuery to
           which the data pump will restrict itself for insert/write/delete
-          operations.
+          operations.  The table_lifetime_seconds, pages_per_task and
+          pages_fetched_ahead members are always set, falling back to their
+          defaults.
         Raises:
           ValueError: if any expected element is missing or malformed.
         """
@@ -410,11 +540,19 @@ class DataPumpJob(jobs.DurableJobBase):
         table_lifetime_seconds = common_utils.parse_timedelta_string(
             pump_settings.get(TABLE_LIFETIME) or PII_SECRET_DEFAULT_LIFETIME
             ).total_seconds()
+        pages_per_task = min(MAX_PAGES_PER_TASK, max(1, int(
+            pump_settings.get(PAGES_PER_TASK) or DEFAULT_PAGES_PER_TASK)))
+        pages_fetched_ahead = pump_settings.get(PAGES_FETCHED_AHEAD)
+        if pages_fetched_ahead is None or pages_fetched_ahead == '':
+            pages_fetched_ahead = DEFAULT_PAGES_FETCHED_AHEAD
+        pages_fetched_ahead = min(
+            MAX_PAGES_FETCHED_AHEAD, max(0, int(pages_fetched_ahead)))
         Settings = collections.namedtuple('Settings', [
             'private_key', 'client_email', PROJECT_ID, 'dataset_id',
-            'table_lifetime_seconds'])
+            'table_lifetime_seconds', PAGES_PER_TASK, PAGES_FETCHED_AHEAD])
         return Settings(json_key['private_key'], json_key['client_email'],
-                        project_id, dataset_id, table_lifetime_seconds)
+                        project_id, dataset_id, table_lifetime_seconds,
+                        pages_per_task, pages_fetched_ahead)
 
     def _get_bigquery_service(self, bigquery_settings):
         """Get BigQuery API client plus HTTP client with auth credentials."""
@@ -565,12 +703,16 @@ class DataPumpJob(jobs.DurableJobBase):
             datasetId=bigquery_settings.dataset_id,
             body=request).execute()
 
-    def _create_upload_job(self, http, bigquery_settings, data_source_class):
+    def _create_upload_job(self, http, bigquery_settings, data_source_class,
+                           append=False):
         """Before uploading, we must create a job to handle the upload.
 
         Args:
           http: An HTTP client object configured to send our auth token
           bigquery_settings: Configs for talking to bigquery.
+          data_source_class: The data source whose table is loaded.
+          append: Whether the items are added to the items already in the
+            table, rather than loaded into a table just created.
         Returns:
           URL specific to this upload job.  Subsequent PUT requests to send
           pages of data must be sent to this URL.
@@ -585,7 +727,7 @@ class DataPumpJob(jobs.DurableJobBase):
             'X-Upload-Content-Type': 'application/octet-stream',
             }
         table_name = data_source_class.get_name()
-        body = transforms.dumps({
+        body = {
             'kind': 'bigquery#job',
             'configuration': {
                 'load': {
@@ -599,7 +741,10 @@ class DataPumpJob(jobs.DurableJobBase):
                     'sourceFormat': 'NEWLINE_DELIMITED_JSON',
                     }
                 }
-            })
+            }
+        if append:
+            body['configuration']['load']['writeDisposition'] = 'WRITE_APPEND'
+        body = transforms.dumps(body)
         response, content = http.request(uri, method='POST',
                                          body=body, headers=headers)
         if int(response.get('status', 0)) != 200:
@@ -614,8 +759,12 @@ class DataPumpJob(jobs.DurableJobBase):
         return location
 
     def _initiate_upload_job(self, bigquery_service, bigquery_settings, http,
-                             app_context, data_source_context):
-        """Coordinate table cleanup, setup, and initiation of upload job."""
+                             app_context, data_source_context, append=False):
+        """Coordinate table cleanup, setup, and initiation of upload job.
+
+        When appending, the existing table is kept and the upload job adds
+        the items sent to it.
+        """
         data_source_class = _get_data_source_class_by_name(
             self._data_source_class_name)
         catch_and_log_ = catch_and_log.CatchAndLog()
@@ -625,14 +774,107 @@ class DataPumpJob(jobs.DurableJobBase):
         tables = bigquery_service.tables()
 
         self._maybe_create_course_dataset(bigquery_service, bigquery_settings)
-        self._maybe_delete_previous_table(tables, bigquery_settings,
-                                          data_source_class)
-        self._create_data_table(tables, bigquery_settings, schema,
-                                data_source_class)
+        if not append:
+            self._maybe_delete_previous_table(tables, bigquery_settings,
+                                              data_source_class)
+            self._create_data_table(tables, bigquery_settings, schema,
+                                    data_source_class)
         upload_url = self._create_upload_job(http, bigquery_settings,
-                                             data_source_class)
+                                             data_source_class, append)
         return upload_url
 
+    def _table_exists(self, tables, bigquery_settings, data_source_class):
+        try:
+            tables.get(projectId=bigquery_settings.project_id,
+                       datasetId=bigquery_settings.dataset_id,
+                       tableId=data_source_class.get_name()).execute()
+        except apiclient.errors.HttpError, ex:
+            if ex.resp.status != 404:
+                raise
+            return False
+        return True
+
+    def _get_watermark_fingerprint(self, app_context, data_source_context,
+                                   pii_secret):
+        data_source_class = _get_data_source_class_by_name(
+            self._data_source_class_name)
+        schema = data_source_class.get_schema(
+            app_context, catch_and_log.CatchAndLog(), data_source_context)
+        return hashlib.md5(transforms.dumps(
+            [schema, pii_secret, self._send_uncensored_pii_data],
+            sort_keys=True)).hexdigest()
+
+    def _start_watermark_range(self, bigquery_service, bigquery_settings,
+                               app_context, data_source_context, pii_secret):
+        """Limit the items to export to a range of the watermark column.
+
+        For data sources with a watermark column, an incremental export only
+        sends the items added since the end of the range of the last
+        completed export, and before now (less WATERMARK_LAG_SECONDS).  It
+        falls back to a full export if there is no such export, if the
+        schema or the handling of PII have changed since, or if the table is
+        gone from BigQuery.  Full exports record a range ending now (less
+        WATERMARK_LAG_SECONDS) too, and leave the items added since out of
+        the pages they send; see _bound_full_export().  Items without a
+        value in the column are only ever sent by full exports.
+
+        Returns:
+          A 3-tuple of the start and end of the range and a fingerprint of
+          the schema and PII handling, to be recorded in the job context.
+          The start is None for a full export; all are None if the data
+          source has no watermark column.
+        """
+        data_source_class = _get_data_source_class_by_name(
+            self._data_source_class_name)
+        column = data_source_class.get_watermark_column()
+        if not column or not hasattr(data_source_context, 'filters'):
+            return None, None, None
+
+        fingerprint = self._get_watermark_fingerprint(
+            app_context, data_source_context, pii_secret)
+        until = (datetime.datetime.now() - datetime.timedelta(
+            seconds=WATERMARK_LAG_SECONDS)).strftime(
+                transforms.ISO_8601_DATETIME_FORMAT)
+        since = None
+        if self._incremental:
+            watermark = DataPumpWatermarkEntity.get_by_key_name(
+                self._data_source_class_name)
+            if (watermark and watermark.fingerprint == fingerprint and
+                self._table_exists(bigquery_service.tables(),
+                                   bigquery_settings, data_source_class)):
+                since = watermark.until
+
+        if since:
+            data_source_context.filters = [
+                '%s>=%s' % (column, since), '%s<%s' % (column, until)]
+            data_source_context.orderings = [column]
+        return since, until, fingerprint
+
+    def _bound_full_export(self, data, job_context):
+        """Drop the items of a page added after the range of a full export.
+
+        Full exports cannot filter on the watermark column, as that would
+        leave out the items without a value in it; the items added after the
+        end of the range are instead removed from each page, to be sent by
+        the next incremental export.
+        """
+        until = job_context.get(WATERMARK_UNTIL)
+        if not until or job_context.get(WATERMARK_SINCE):
+            return data
+        column = _get_data_source_class_by_name(
+            self._data_source_class_name).get_watermark_column()
+        return [item for item in data
+                if not item.get(column) or item[column] < until]
+
+    def _record_watermark(self, job_context):
+        """Note the end of the range of items sent by a completed export."""
+        if not job_context.get(WATERMARK_UNTIL):
+            return
+        DataPumpWatermarkEntity(
+            key_name=self._data_source_class_name,
+            until=job_context[WATERMARK_UNTIL],
+            fingerprint=job_context[WATERMARK_FINGERPRINT]).put()
+
     def _note_retryable_failure(self, message, job_context):
         """Log a timestamped message into the job context object."""
         timestamp = datetime.datetime.now().strftime(
@@ -691,7 +933,7 @@ class DataPumpJob(jobs.DurableJobBase):
         padding_amount = 0
         if not is_last_chunk:
             round_to = 256 * 1024
-            if total_len % round_to:
+            if total_len % round_to or not total_len:
                 padding_amount = round_to - (total_len % round_to)
                 lines.append(' ' * padding_amount)
         payload = ''.join(lines)
@@ -831,21 +1073,25 @@ class DataPumpJob(jobs.DurableJobBase):
                 (status, str(response)))
         return next_page, next_status
 
-    def _fetch_page_data(self, app_context, data_source_context, next_page):
-        """Get the next page of data from the data source."""
+    def _fetch_page(self, app_context, data_source_context, page):
+        """Get a page of data from the data source, checking its schema.
 
+        Returns:
+          A 2-tuple of the list of items and the number of the page the
+          data source actually returned; when asked for a page past the end,
+          data sources return the last page instead.
+        """
         data_source_class = _get_data_source_class_by_name(
             self._data_source_class_name)
         catch_and_log_ = catch_and_log.CatchAndLog()
-        is_last_page = False
         with catch_and_log_.propagate_exceptions('Loading page of data'):
             schema = data_source_class.get_schema(app_context, catch_and_log_,
                                                   data_source_context)
             required_jobs = data_sources.utils.get_required_jobs(
                 data_source_class, app_context, catch_and_log_)
-            data, _ = data_source_class.fetch_values(
+            data, actual_page = data_source_class.fetch_values(
                 app_context, data_source_context, schema, catch_and_log_,
-                next_page, *required_jobs)
+                page, *required_jobs)
 
             # BigQuery has a somewhat unfortunate design: It does not attempt
             # to parse/validate the data we send until all data has been
@@ -861,31 +1107,101 @@ class DataPumpJob(jobs.DurableJobBase):
                     raise ValueError(
                         'Data in item to pump does not match schema!  ' +
                         'Item is item number %d ' % index +
-                        'on data page %d. ' % next_page +
+                        'on data page %d. ' % page +
                         'Problems for this item are:\n' +
                         '\n'.join(complaints))
+            return data, actual_page
 
-            if (data_source_class.get_default_chunk_size() == 0 or
+    def _is_short_page(self, data_source_context, data):
+        """Whether a page is known to be the last one just from its size."""
+        data_source_class = _get_data_source_class_by_name(
+            self._data_source_class_name)
+        return (data_source_class.get_default_chunk_size() == 0 or
                 not hasattr(data_source_context, 'chunk_size') or
-                len(data) < data_source_context.chunk_size):
-                is_last_page = True
-            else:
-                # Here, we may have read to the end of the table and just
-                # happened to end up on an even chunk boundary.  Attempt to
-                # read one more row so that we can discern whether we really
-                # are at the end.
-
-                # Don't use the normal data_source_context; we don't want it
-                # to cache a cursor for the next page that will only retrieve
-                # one row.
-                throwaway_context = copy.deepcopy(data_source_context)
-                throwaway_context.chunk_size = 1
-                next_data, actual_page = data_source_class.fetch_values(
-                    app_context, throwaway_context, schema, catch_and_log_,
-                    next_page + 1, *required_jobs)
-                if not next_data or actual_page == next_page:
-                    is_last_page = True
-            return data, is_last_page
+                len(data) < data_source_context.chunk_size)
+
+    def _is_last_page(self, app_context, data_source_context, page):
+        """Probe whether a full page is the last one by reading one more row.
+
+        We may have read to the end of the table and just happened to end up
+        on an even chunk boundary.  Attempt to read one more row so that we
+        can discern whether we really are at the end.
+        """
+        # Don't use the normal data_source_context; we don't want it to
+        # cache a cursor for the next page that will only retrieve one row.
+        throwaway_context = copy.deepcopy(data_source_context)
+        throwaway_context.chunk_size = 1
+        next_data, actual_page = self._fetch_page(
+            app_context, throwaway_context, page + 1)
+        return not next_data or actual_page == page
+
+    def _fetch_page_data(self, app_context, data_source_context, next_page):
+        """Get the next page of data from the data source."""
+
+        data, _ = self._fetch_page(app_context, data_source_context, next_page)
+        is_last_page = (
+            self._is_short_page(data_source_context, data) or
+            self._is_last_page(app_context, data_source_context, next_page))
+        return data, is_last_page
+
+    def _send_pages(self, app_context, data_source_context, next_page,
+                    pages_per_task, pages_fetched_ahead, http, job,
+                    sequence_num, job_context):
+        """Send up to pages_per_task pages of data, starting at next_page.
+
+        Pages are sent one after the other, as the upload protocol requires.
+        Unless pages_fetched_ahead is 0, they are read by a _PageFetcher
+        worker thread while the pages before them are being sent.  The next
+        page of the batch is needed before the current one is sent anyway,
+        since its content tells whether the current page is the last one;
+        this spares the one-row probe done by _fetch_page_data.  Only the
+        last page of the batch needs that probe.
+
+        Sending stops at the first response other than a full
+        acknowledgement of the page.  The remaining pages are left to the
+        next deferred task, which re-checks the upload state and backs off
+        as for any other failure.  State is saved after each acknowledged
+        page, so that an interrupted task never leaves the saved state more
+        than one page behind the upload.
+
+        Returns:
+          The next jobs.STATUS_CODE_<X> to transition to.
+        """
+        fetcher = _PageFetcher(
+            lambda page: self._fetch_page(
+                app_context, data_source_context, page),
+            lambda data: self._is_short_page(data_source_context, data),
+            self._namespace, next_page, pages_per_task, pages_fetched_ahead)
+        try:
+            page = next_page
+            data, _ = fetcher.get()
+            while True:
+                pages_per_task -= 1
+                next_data = None
+                is_last_chunk = self._is_short_page(data_source_context, data)
+                if not is_last_chunk and pages_per_task:
+                    next_data, actual_page = fetcher.get()
+                    is_last_chunk = not next_data or actual_page == page
+                elif not is_last_chunk:
+                    with fetcher.lock:
+                        is_last_chunk = self._is_last_page(
+                            app_context, data_source_context, page)
+
+                next_state = self._send_data_page_to_bigquery(
+                    self._bound_full_export(data, job_context), is_last_chunk,
+                    page, http, job, sequence_num, job_context,
+                    data_source_context)
+                if (is_last_chunk or not pages_per_task or
+                    next_state != jobs.STATUS_CODE_STARTED or
+                    job_context[CONSECUTIVE_FAILURES]):
+                    return next_state
+                with fetcher.lock:
+                    self._save_state(next_state, job, sequence_num,
+                                     job_context, data_source_context)
+                page += 1
+                data = next_data
+        finally:
+            fetcher.close()
 
     def _send_next_page(self, sequence_num, job):
         """Coordinate table setup, job setup, sending pages of data."""
@@ -902,10 +1218,16 @@ class DataPumpJob(jobs.DurableJobBase):
         # Otherwise, re-load context objects from saved version in job.output
         if job.status_code == jobs.STATUS_CODE_QUEUED:
             data_source_context = self._build_data_source_context()
+            since, until, fingerprint = self._start_watermark_range(
+                bigquery_service, bigquery_settings, app_context,
+                data_source_context, pii_secret)
             upload_url = self._initiate_upload_job(
                 bigquery_service, bigquery_settings, http, app_context,
-                data_source_context)
+                data_source_context, append=bool(since))
             job_context = self._build_job_context(upload_url, pii_secret)
+            job_context[WATERMARK_SINCE] = since
+            job_context[WATERMARK_UNTIL] = until
+            job_context[WATERMARK_FINGERPRINT] = fingerprint
         else:
             job_context, data_source_context = self._load_state(
                 job, sequence_num)
@@ -921,13 +1243,15 @@ class DataPumpJob(jobs.DurableJobBase):
         # able to send a page now.
         next_page, next_state = self._check_upload_state(http, job_context)
         if next_page is not None:
-            data, is_last_chunk = self._fetch_page_data(
-                app_context, data_source_context, next_page)
-            next_state = self._send_data_page_to_bigquery(
-                data, is_last_chunk, next_page,
-                http, job, sequence_num, job_context, data_source_context)
+            next_state = self._send_pages(
+                app_context, data_source_context, next_page,
+                bigquery_settings.pages_per_task,
+                bigquery_settings.pages_fetched_ahead, http, job, sequence_num,
+                job_context)
         self._save_state(next_state, job, sequence_num, job_context,
                          data_source_context)
+        if next_state == jobs.STATUS_CODE_COMPLETED:
+            self._record_watermark(job_context)
 
         # If we are not done, enqueue another to-do item on the deferred queue.
         if len(job_context[CONSECUTIVE_FAILURES]) >= MAX_CONSECUTIVE_FAILURES:
@@ -981,7 +1305,14 @@ class DataPumpJob(jobs.DurableJobBase):
             'title': data_source_class.get_title(),
             'status': 'Has Never Run',
             'active': False,
+            'incremental': bool(data_source_class.get_watermark_column()),
             }
+        if ret['incremental']:
+            with common_utils.Namespace(self._namespace):
+                watermark = DataPumpWatermarkEntity.get_by_key_name(
+                    self._data_source_class_name)
+            if watermark:
+                ret['exported_until'] = watermark.until
 
         job = self.load()
         if job:
@@ -1143,7 +1474,8 @@ class DashboardExtension(object):
             data_pump_job = DataPumpJob(
                 self.handler.app_context, source_name,
                 self.handler.request.get('no_expiration_date') == 'True',
-                self.handler.request.get('send_uncensored_pii_data') == 'True')
+                self.handler.request.get('send_uncensored_pii_data') == 'True',
+                self.handler.request.get('incremental') == 'True')
             if action == 'start_pump':
                 data_pump_job.submit()
             elif action == 'cancel_pump':
@@ -1245,6 +1577,47 @@ def register_module():
         'and commas may be used or omitted.  E.g., both of the following '
         'are equivalent: "3w1d7h", "3 weeks, 1 day, 7 hours"')
 
+    def validate_pages_per_task(value, errors):
+        if not value:
+            return
+        if not 1 <= value <= MAX_PAGES_PER_TASK:
+            errors.append(
+                'The number of pages to send per task must be between 1 '
+                'and %d.' % MAX_PAGES_PER_TASK)
+
+    pages_per_task = schema_fields.SchemaField(
+        DATA_PUMP_SETTINGS_SCHEMA_SECTION + ':' + PAGES_PER_TASK,
+        'Pages Per Task', 'integer',
+        optional=True, i18n=False,
+        validator=validate_pages_per_task,
+        description='Number of pages of data sent to BigQuery by each step '
+        'of a data pump job, between 1 and %d.  ' % MAX_PAGES_PER_TASK +
+        'Sending several pages per step makes large tables upload faster, '
+        'since the job does not have to be re-queued and re-check the state '
+        'of the upload between pages.  Leaving this field blank will send '
+        '%d page(s) per step.' % DEFAULT_PAGES_PER_TASK)
+
+    def validate_pages_fetched_ahead(value, errors):
+        if value is None or value == '':
+            return
+        if not 0 <= value <= MAX_PAGES_FETCHED_AHEAD:
+            errors.append(
+                'The number of pages to read ahead must be between 0 and '
+                '%d.' % MAX_PAGES_FETCHED_AHEAD)
+
+    pages_fetched_ahead = schema_fields.SchemaField(
+        DATA_PUMP_SETTINGS_SCHEMA_SECTION + ':' + PAGES_FETCHED_AHEAD,
+        'Pages Fetched Ahead', 'integer',
+        optional=True, i18n=False,
+        validator=validate_pages_fetched_ahead,
+        description='Number of pages of data read from the course while the '
+        'pages before them are sent to BigQuery, between 0 and %d.  ' %
+        MAX_PAGES_FETCHED_AHEAD +
+        'Reading ahead makes each step of a data pump job faster when it '
+        'sends several pages, at the cost of holding these pages in memory.  '
+        'With 0, pages are only read between uploads.  Leaving this field '
+        'blank will read %d page(s) ahead.' % DEFAULT_PAGES_FETCHED_AHEAD)
+
     pii_encryption_token = schema_fields.SchemaField(
         DATA_PUMP_SETTINGS_SCHEMA_SECTION + ':' + PII_ENCRYPTION_TOKEN,
         'PII Encryption Token', 'string',
@@ -1263,6 +1636,8 @@ def register_module():
         lambda c: json_key,
         lambda c: dataset_name,
         lambda c: table_lifetime,
+        lambda c: pages_per_task,
+        lambda c: pages_fetched_ahead,
         lambda c: pii_encryption_token,
         )
 
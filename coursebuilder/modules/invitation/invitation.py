@@ -47,6 +47,7 @@ from common import crypto
 from common import safe_dom
 from common import schema_fields
 from common import tags
+from common import utils as common_utils
 from controllers import utils
 from models import courses
 from models import custom_modules
@@ -56,6 +57,7 @@ from modules.dashboard import course_settings
 from modules.notifications import notifications
 from modules.unsubscribe import unsubscribe
 
+from google.appengine.ext import deferred
 
 # The intent recorded for the emails sent by the notifications module
 INVITATION_INTENT = 'course_invitation'
@@ -122,15 +124,73 @@ class InvitationEmail(object):
     def body(self):
         return self._render(self.body_template, self.email_vars)
 
-    def send(self):
-        notifications.Manager.send_async(
-            self.recipient_email,
-            self.sender_email,
-            INVITATION_INTENT,
-            self.body,
-            self.subject,
-            audit_trail=self.email_vars
-        )
+
+def _send_invitations(
+    namespace, sender_email, sender_name, subject_template, body_template,
+    recipients):
+    """Deferred task sending invitations from one student to many people.
+
+    The templates are compiled once and then rendered for each recipient;
+    only the unsubscribe URL differs between the messages.
+
+    Args:
+      namespace: string. The namespace of the course.
+      sender_email: string. The address shown as the sender of the emails.
+      sender_name: string. The name of the student sending the invitations.
+      subject_template: unicode. The Jinja template of the subject line.
+      body_template: unicode. The Jinja template of the body.
+      recipients: list of (email, unsubscribe_url) pairs.
+    """
+    subject_template = jinja2.Template(subject_template)
+    body_template = jinja2.Template(body_template)
+    with common_utils.Namespace(namespace):
+        for recipient_email, unsubscribe_url in recipients:
+            email_vars = {
+                'sender_name': sender_name,
+                'unsubscribe_url': unsubscribe_url
+            }
+            try:
+                notifications.Manager.send_async(
+                    recipient_email,
+                    sender_email,
+                    INVITATION_INTENT,
+                    body_template.render(email_vars),
+                    subject_template.render(email_vars),
+                    audit_trail=email_vars
+                )
+            # Don't fail the task: a retry would send the earlier messages
+            # again.
+            except Exception:  # pylint: disable=broad-except
+                logging.exception('Failed to send invitation email')
+
+
+def send_invitations(handler, recipient_emails, sender_name):
+    """Queues invitation emails from the current student to many people.
+
+    Args:
+      handler: controllers.utils.ApplicationHandler. The current request
+          handler.
+      recipient_emails: iterable of string. Addresses to invite. These must
+          already have been checked for unsubscribed and registered users.
+      sender_name: string. The name of the student sending the invitations.
+    """
+    recipients = [
+        (email, unsubscribe.get_unsubscribe_url(handler, email))
+        for email in recipient_emails]
+    if not recipients:
+        return
+    env = handler.app_context.get_environ()
+    email_env = env['course'].get(INVITATION_EMAIL_KEY)
+    # Coerce templates to unicode in case they are LazyTranslators; they are
+    # translated in the locale of the current request.
+    deferred.defer(
+        _send_invitations,
+        handler.app_context.get_namespace_name(),
+        email_env[SENDER_EMAIL_KEY],
+        sender_name,
+        unicode(email_env[SUBJECT_TEMPLATE_KEY]),
+        unicode(email_env[BODY_TEMPLATE_KEY]),
+        recipients)
 
 
 class InvitationStudentProperty(models.StudentPropertyEntity):
@@ -292,6 +352,7 @@ class InvitationRESTHandler(utils.BaseRESTHandler):
             return
 
         messages = []
+        candidates = []
         for email in email_set:
             if not is_email_valid(email):
                 # I18N: Error indicating an email addresses is not well-formed.
@@ -302,14 +363,22 @@ class InvitationRESTHandler(utils.BaseRESTHandler):
                 messages.append(self.gettext(
                     'Error: You have already sent an invitation email to "%s"'
                     % email))
-            elif unsubscribe.has_unsubscribed(email):
+            else:
+                candidates.append(email)
+
+        unsubscribed = unsubscribe.has_unsubscribed_multi(candidates)
+        registered = models.Student.get_enrolled_students_by_email(candidates)
+        recipients = []
+        for email in candidates:
+            if unsubscribed[email]:
                 # No message to the user, for privacy reasons
                 logging.info('Declined to send email to unsubscribed user')
-            elif models.Student.get_enrolled_student_by_email(email):
+            elif email in registered:
                 # No message to the user, for privacy reasons
                 logging.info('Declined to send email to registered user')
             else:
-                InvitationEmail(self, email, student.name).send()
+                recipients.append(email)
+        send_invitations(self, recipients, student.name)
 
         invitation_data.append_to_invited_list(email_set)
         invitation_data.put()
@@ -217,7 +217,10 @@ class CronMapreduceCleanupHandler(utils.BaseHandler):
                         job = job_class(course_context)
                         pipe_id = jobs.MapReduceJob.get_root_pipeline_id(
                             job.load())
-                        jobs_by_pipeline_id[pipe_id] = job
+                        # Jobs run together by a CompositeMapReduceJob
+                        # share one pipeline.
+                        jobs_by_pipeline_id.setdefault(pipe_id, []).append(
+                            job)
 
                 # Clean up pipelines
                 for state in pipeline.get_root_list()['pipelines']:
@@ -238,8 +241,8 @@ class CronMapreduceCleanupHandler(utils.BaseHandler):
                         # that there's no realistic possibility that there
                         # might be a race condition between this and the
                         # job actually completing.
-                        if pipeline_id in jobs_by_pipeline_id:
-                            jobs_by_pipeline_id[pipeline_id].mark_cleaned_up()
+                        for job in jobs_by_pipeline_id.get(pipeline_id, []):
+                            job.mark_cleaned_up()
 
                         p = pipeline.Pipeline.from_id(pipeline_id)
                         if p:
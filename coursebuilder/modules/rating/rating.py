@@ -177,6 +177,10 @@ class RatingEventDataSource(data_sources.AbstractDbTableRestDataSource):
     def exportable(cls):
         return True
 
+    @classmethod
+    def get_watermark_column(cls):
+        return 'recorded_on'
+
     @classmethod
     def get_schema(cls, unused_app_context, unused_catch_and_log,
                    unused_source_context):
@@ -19,6 +19,7 @@ __author__ = [
 ]
 
 import logging
+import time
 
 from controllers import sites
 from controllers import utils
@@ -30,6 +31,10 @@ _LOG = logging.getLogger('modules.reviews.cron')
 logging.basicConfig()
 
 
+def _get_rate(count, seconds):
+    return count / seconds if seconds > 0 else 0.0
+
+
 class ExpireOldAssignedReviewsHandler(utils.BaseHandler):
     """Iterates through all units in all courses, expiring old review steps.
 
@@ -39,6 +44,10 @@ class ExpireOldAssignedReviewsHandler(utils.BaseHandler):
 
     Write operations done by this handler must be atomic since admins may visit
     this page at any time, kicking off any number of runs.
+
+    Review steps are expired in batches, one transaction per review summary;
+    the time taken and the number of steps expired per second are logged for
+    each unit and for the whole run.
     """
 
     def get(self):
@@ -64,6 +73,7 @@ class ExpireOldAssignedReviewsHandler(utils.BaseHandler):
             total_count = 0
             total_expired_count = 0
             total_exception_count = 0
+            total_start = time.time()
             _LOG.info('Begin expire_old_assigned_reviews cron')
 
             for namespace, units in namespace_to_units.iteritems():
@@ -78,30 +88,39 @@ class ExpireOldAssignedReviewsHandler(utils.BaseHandler):
                     _LOG.info(begin_unit_message)
 
                     namespace_manager.set_namespace(namespace)
+                    unit_start = time.time()
                     expired_keys, exception_keys = (
-                        review.Manager.expire_old_reviews_for_unit(
+                        review.Manager.expire_old_reviews_for_unit_in_batches(
                             unit['review_window_mins'], unit['id']))
+                    unit_seconds = time.time() - unit_start
 
                     unit_expired_count = len(expired_keys)
                     unit_exception_count = len(exception_keys)
                     unit_total_count = unit_expired_count + unit_exception_count
                     total_expired_count += unit_expired_count
-                    total_exception_count += total_exception_count
+                    total_exception_count += unit_exception_count
                     total_count += unit_total_count
 
                     end_unit_message = (
                         'End processing unit %s. Expired: %s, Exceptions: %s, '
-                        'Total: %s' % (
+                        'Total: %s, Seconds: %.2f, Expired per second: '
+                        '%.1f' % (
                             unit['id'], unit_expired_count,
-                            unit_exception_count, unit_total_count))
+                            unit_exception_count, unit_total_count,
+                            unit_seconds,
+                            _get_rate(unit_expired_count, unit_seconds)))
                     _LOG.info(end_unit_message)
 
                 _LOG.info('Done processing namespace "%s"', namespace)
 
+            total_seconds = time.time() - total_start
             end_message = (
                 ('End expire_old_assigned_reviews cron. Expired: %s, '
-                 'Exceptions : %s, Total: %s') % (
-                     total_expired_count, total_exception_count, total_count))
+                 'Exceptions : %s, Total: %s, Seconds: %.2f, Expired per '
+                 'second: %.1f') % (
+                     total_expired_count, total_exception_count, total_count,
+                     total_seconds,
+                     _get_rate(total_expired_count, total_seconds)))
             _LOG.info(end_message)
             self.response.write('OK\n')
         except:  # Hide all errors. pylint: disable=bare-except
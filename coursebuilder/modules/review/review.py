@@ -123,6 +123,23 @@ COUNTER_EXPIRE_OLD_REVIEWS_FOR_UNIT_SUCCESS = counters.PerfCounter(
     'gcb-pr-expire-old-reviews-for-unit-success',
     'number of times expire_old_reviews_for_unit() completed successfully')
 
+COUNTER_EXPIRE_REVIEWS_FOR_SUMMARY_EXPIRE = counters.PerfCounter(
+    'gcb-pr-expire-reviews-for-summary-expire',
+    'number of records expire_reviews_for_summary() has expired')
+COUNTER_EXPIRE_REVIEWS_FOR_SUMMARY_FAILED = counters.PerfCounter(
+    'gcb-pr-expire-reviews-for-summary-failed',
+    'number of times expire_reviews_for_summary() had a fatal error')
+COUNTER_EXPIRE_REVIEWS_FOR_SUMMARY_SKIP = counters.PerfCounter(
+    'gcb-pr-expire-reviews-for-summary-skip',
+    ('number of records expire_reviews_for_summary() skipped because they '
+     'could not be expired'))
+COUNTER_EXPIRE_REVIEWS_FOR_SUMMARY_START = counters.PerfCounter(
+    'gcb-pr-expire-reviews-for-summary-start',
+    'number of times expire_reviews_for_summary() has started processing')
+COUNTER_EXPIRE_REVIEWS_FOR_SUMMARY_SUCCESS = counters.PerfCounter(
+    'gcb-pr-expire-reviews-for-summary-success',
+    'number of times expire_reviews_for_summary() completed successfully')
+
 COUNTER_EXPIRY_QUERY_KEYS_RETURNED = counters.PerfCounter(
     'gcb-pr-expiry-query-keys-returned',
     'number of keys returned by the query returned by get_expiry_query()')
@@ -243,6 +260,15 @@ COUNTER_WRITE_REVIEW_UPDATED_EXISTING_REVIEW = counters.PerfCounter(
 # ceiling, but for now let's allow as many removed results as unremoved.
 _REVIEW_STEP_QUERY_LIMIT = 2 * domain.MAX_UNREMOVED_REVIEW_STEPS
 
+# Number of expiring review steps read at once and grouped by review summary
+# by expire_old_reviews_for_unit_in_batches().
+_EXPIRY_BATCH_SIZE = 100
+
+# Maximum number of review steps expired in one transaction. Review steps and
+# summaries are each in their own entity group, and a cross-group transaction
+# may span at most 25 entity groups, one of which is the summary.
+_EXPIRY_MAX_STEPS_PER_TRANSACTION = 24
+
 
 class Manager(object):
     """Object that manages the review subsystem."""
@@ -538,6 +564,163 @@ class Manager(object):
         COUNTER_EXPIRE_OLD_REVIEWS_FOR_UNIT_SUCCESS.inc()
         return expired_keys, exception_keys
 
+    @classmethod
+    def expire_old_reviews_for_unit_in_batches(cls, review_window_mins,
+                                               unit_id):
+        """Finds and expires all old review steps for a single unit in bulk.
+
+        Does the same as expire_old_reviews_for_unit(), but rather than
+        running one transaction per review step, reads the steps returned by
+        the expiry query in batches, groups them by review summary, and
+        expires all steps of a summary in a single transaction with
+        expire_reviews_for_summary(). Summaries are usually shared by the
+        steps of all reviewers of a submission, so this writes each summary
+        once instead of once per step and holds it for fewer transactions
+        that could collide with live review assignment.
+
+        Args:
+            review_window_mins: int. Number of minutes before we expire reviews
+                assigned by domain.ASSIGNER_KIND_AUTO.
+            unit_id: string. Id of the unit to restrict the query to.
+
+        Returns:
+            2-tuple of list of db.Key of peer.ReviewStep. 0th element is keys
+            that were written successfully; 1st element is keys that we failed
+            to update.
+        """
+        query = cls.get_expiry_query(review_window_mins, unit_id)
+        mapper = utils.QueryMapper(
+            query, batch_size=_EXPIRY_BATCH_SIZE,
+            counter=COUNTER_EXPIRY_QUERY_KEYS_RETURNED, report_every=0)
+        pending_keys = []
+        expired_keys = []
+        exception_keys = []
+
+        def map_fn(review_step_key, pending_keys, expired_keys,
+                   exception_keys):
+            pending_keys.append(review_step_key)
+            if len(pending_keys) >= _EXPIRY_BATCH_SIZE:
+                cls._expire_review_batch(
+                    pending_keys, expired_keys, exception_keys)
+                del pending_keys[:]
+
+        COUNTER_EXPIRE_OLD_REVIEWS_FOR_UNIT_START.inc()
+
+        mapper.run(map_fn, pending_keys, expired_keys, exception_keys)
+        cls._expire_review_batch(pending_keys, expired_keys, exception_keys)
+        COUNTER_EXPIRE_OLD_REVIEWS_FOR_UNIT_EXPIRE.inc(
+            increment=len(expired_keys))
+        COUNTER_EXPIRE_OLD_REVIEWS_FOR_UNIT_SUCCESS.inc()
+        return expired_keys, exception_keys
+
+    @classmethod
+    def _expire_review_batch(cls, review_step_keys, expired_keys,
+                             exception_keys):
+        if not review_step_keys:
+            return
+
+        # Steps are read outside of any transaction only to find their
+        # summaries; they are read again when expired.
+        steps_by_summary_key = {}
+        for key, step in zip(
+                review_step_keys, entities.get(review_step_keys)):
+            if not step:
+                COUNTER_EXPIRE_OLD_REVIEWS_FOR_UNIT_SKIP.inc()
+                exception_keys.append(key)
+                continue
+            steps_by_summary_key.setdefault(
+                step.review_summary_key, []).append(key)
+
+        for summary_key, step_keys in steps_by_summary_key.iteritems():
+            for start in xrange(
+                    0, len(step_keys), _EXPIRY_MAX_STEPS_PER_TRANSACTION):
+                chunk = step_keys[
+                    start:start + _EXPIRY_MAX_STEPS_PER_TRANSACTION]
+                try:
+                    expired, skipped = cls.expire_reviews_for_summary(
+                        summary_key, chunk)
+                except:  # All errors are the same. pylint: disable=bare-except
+                    # Skip. Either the summary is gone or we ran into a
+                    # transient datastore error, meaning we'll expire these
+                    # steps next time.
+                    expired, skipped = [], chunk
+                expired_keys.extend(expired)
+                exception_keys.extend(skipped)
+                COUNTER_EXPIRE_OLD_REVIEWS_FOR_UNIT_SKIP.inc(
+                    increment=len(skipped))
+
+    @classmethod
+    def expire_reviews_for_summary(cls, review_summary_key, review_step_keys):
+        """Puts review steps of one summary in state REVIEW_STATE_EXPIRED.
+
+        All steps are expired, and the counts of the summary adjusted, in a
+        single transaction. Unlike expire_review(), steps that cannot be
+        expired do not raise: they are left unchanged and returned.
+
+        Args:
+            review_summary_key: db.Key of peer.ReviewSummary. The summary of
+                all the review steps.
+            review_step_keys: list of db.Key of peer.ReviewStep. The review
+                steps to expire; at most _EXPIRY_MAX_STEPS_PER_TRANSACTION.
+
+        Raises:
+            KeyError: if there is no review summary with the given key.
+
+        Returns:
+            2-tuple of list of db.Key of peer.ReviewStep. 0th element is keys
+            of the steps expired; 1st element is keys of steps that are
+            missing, removed, already in REVIEW_STATE_COMPLETED or
+            REVIEW_STATE_EXPIRED, or do not belong to the summary.
+        """
+        try:
+            COUNTER_EXPIRE_REVIEWS_FOR_SUMMARY_START.inc()
+            expired_keys, skipped_keys = cls._transition_states_to_expired(
+                review_summary_key, review_step_keys)
+            COUNTER_EXPIRE_REVIEWS_FOR_SUMMARY_EXPIRE.inc(
+                increment=len(expired_keys))
+            COUNTER_EXPIRE_REVIEWS_FOR_SUMMARY_SKIP.inc(
+                increment=len(skipped_keys))
+            COUNTER_EXPIRE_REVIEWS_FOR_SUMMARY_SUCCESS.inc()
+            return expired_keys, skipped_keys
+        except Exception as e:
+            COUNTER_EXPIRE_REVIEWS_FOR_SUMMARY_FAILED.inc()
+            raise e
+
+    @classmethod
+    @db.transactional(xg=True)
+    def _transition_states_to_expired(cls, review_summary_key,
+                                      review_step_keys):
+        results = entities.get([review_summary_key] + review_step_keys)
+        summary, steps = results[0], results[1:]
+
+        if not summary:
+            COUNTER_EXPIRE_REVIEW_SUMMARY_MISS.inc()
+            raise KeyError(
+                'No review summary found with key %s' % repr(
+                    review_summary_key))
+
+        expired_steps = []
+        skipped_keys = []
+        for key, step in zip(review_step_keys, steps):
+            if not step:
+                COUNTER_EXPIRE_REVIEW_STEP_MISS.inc()
+                skipped_keys.append(key)
+            elif (step.removed or
+                  step.review_summary_key != review_summary_key or
+                  step.state in (domain.REVIEW_STATE_COMPLETED,
+                                 domain.REVIEW_STATE_EXPIRED)):
+                COUNTER_EXPIRE_REVIEW_CANNOT_TRANSITION.inc()
+                skipped_keys.append(key)
+            else:
+                summary.decrement_count(step.state)
+                step.state = domain.REVIEW_STATE_EXPIRED
+                summary.increment_count(step.state)
+                expired_steps.append(step)
+
+        if not expired_steps:
+            return [], skipped_keys
+        return entities.put(expired_steps + [summary])[:-1], skipped_keys
+
     @classmethod
     def get_assignment_candidates_query(cls, unit_id):
         """Gets query that returns candidates for new review assignment.
@@ -767,6 +950,48 @@ class Manager(object):
         COUNTER_GET_REVIEW_STEP_KEYS_BY_KEYS_RETURNED.inc(increment=len(keys))
         return keys
 
+    @classmethod
+    def get_review_step_keys_by_multi(cls, unit_id, reviewer_keys):
+        """Gets the keys of all review steps in a unit for several reviewers.
+
+        The per-reviewer queries are all issued before any of their results
+        are read, so they run concurrently.
+
+        Args:
+            unit_id: string. Id of the unit to restrict the queries to.
+            reviewer_keys: [db.Key of models.models.Student]. The authors of
+                the requested reviews.
+
+        Returns:
+            [[db.Key of peer.ReviewStep]], one list per reviewer key, in the
+            order of reviewer_keys.
+        """
+        COUNTER_GET_REVIEW_STEP_KEYS_BY_START.inc(increment=len(reviewer_keys))
+
+        try:
+            runs = []
+            for reviewer_key in reviewer_keys:
+                query = peer.ReviewStep.all(keys_only=True).filter(
+                    peer.ReviewStep.reviewer_key.name, reviewer_key
+                ).filter(
+                    peer.ReviewStep.unit_id.name, unit_id
+                ).order(
+                    peer.ReviewStep.create_date.name,
+                )
+                runs.append(query.run(limit=_REVIEW_STEP_QUERY_LIMIT))
+
+            keys_list = [[key for key in run] for run in runs]
+
+        except Exception as e:
+            COUNTER_GET_REVIEW_STEP_KEYS_BY_FAILED.inc()
+            raise e
+
+        COUNTER_GET_REVIEW_STEP_KEYS_BY_SUCCESS.inc(
+            increment=len(reviewer_keys))
+        COUNTER_GET_REVIEW_STEP_KEYS_BY_KEYS_RETURNED.inc(
+            increment=sum(len(keys) for keys in keys_list))
+        return keys_list
+
     @classmethod
     def get_review_steps_by_keys(cls, keys):
         """Gets review steps by their keys.
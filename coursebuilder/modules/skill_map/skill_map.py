@@ -16,6 +16,7 @@
 
 __author__ = 'John Orr (jorr@google.com)'
 
+import copy
 import json
 import jinja2
 import logging
@@ -45,9 +46,11 @@ from models import progress
 from models import resources_display
 from models import roles
 from models import transforms
+from models.counters import PerfCounter
 from modules.admin.admin import WelcomeHandler
 from modules import courses as courses_module
 from modules.dashboard import dashboard
+from modules.dashboard import outline_cache
 from modules.dashboard import tabs
 from modules.dashboard.unit_lesson_editor import LessonRESTHandler
 from modules.i18n_dashboard import i18n_dashboard
@@ -68,6 +71,21 @@ RESOURCES_URI = '/modules/skill_map/resources'
 # Key for storing list of skill id's in the properties table of a Lesson
 LESSON_SKILL_LIST_KEY = 'modules.skill_map.skill_list'
 
+# Int. Number of courses whose skills each process keeps in memory.
+MAX_CACHED_SKILL_GRAPHS = 100
+
+# Int. Skills are loaded with a query, which may not see the changes saved
+# during the last few seconds; skills loaded that soon after a change are
+# not kept in memory.
+SKILL_GRAPH_CACHE_DELAY_SEC = 10
+
+SKILL_GRAPH_CACHE_HIT = PerfCounter(
+    'gcb-skill-graph-cache-hit',
+    'A number of times the skills of a course were found in process memory.')
+SKILL_GRAPH_CACHE_MISS = PerfCounter(
+    'gcb-skill-graph-cache-miss',
+    'A number of times the skills of a course were loaded from the datastore.')
+
 
 def _assert(condition, message, errors):
     """Assert a condition and either log exceptions or raise AssertionError."""
@@ -145,12 +163,19 @@ class Skill(object):
 
 
 def _on_skills_changed(skills):
+    _on_skills_deleted(skills)
     if not i18n_dashboard.I18nProgressDeferredUpdater.is_translatable_course():
         return
     key_list = [resource.Key(ResourceSkill.TYPE, skill.id) for skill in skills]
     i18n_dashboard.I18nProgressDeferredUpdater.update_resource_list(key_list)
 
 
+def _on_skills_deleted(unused_skills):
+    SkillMapVersionStamp.bump()
+    # Skill names are shown next to lessons in the cached course outline.
+    outline_cache.CourseOutlineCache.invalidate()
+
+
 def _translate_skill(skills_generator):
     if not i18n_dashboard.is_translation_required():
         return
@@ -174,6 +199,7 @@ class _SkillDao(models.LastModfiedJsonDao):
     # future changes that extend the DAO API.
     POST_LOAD_HOOKS = [_translate_skill]
     POST_SAVE_HOOKS = [_on_skills_changed]
+    POST_DELETE_HOOKS = [_on_skills_deleted]
 
 
 class ResourceSkill(resource.AbstractResourceHandler):
@@ -249,25 +275,121 @@ class TranslatableResourceSkill(
         return ret
 
 
+class SkillMapVersionStamp(object):
+    """A version stamp of the skills and lessons of a course.
+
+    The stamp is the time in milliseconds of the last change to the skills,
+    or to the course structure, which holds the skills of each lesson. It is
+    kept in memcache in the namespace of the course; when evicted, a new one
+    is started from the current time.
+    """
+
+    MEMCACHE_KEY = 'skill_map:version'
+
+    @classmethod
+    def now(cls):
+        return int(time.time() * 1000)
+
+    @classmethod
+    def get(cls):
+        """Returns the stamp of the current course, or None if unknown."""
+        version = models.MemcacheManager.get(cls.MEMCACHE_KEY)
+        if version is None:
+            version = models.MemcacheManager.incr(
+                cls.MEMCACHE_KEY, 0, initial_value=cls.now())
+        return version
+
+    @classmethod
+    def bump(cls, app_context=None):
+        """Records a change to the current course, or to the given one."""
+        namespace = app_context.get_namespace_name() if app_context else None
+        version = cls.now()
+        current = models.MemcacheManager.get(
+            cls.MEMCACHE_KEY, namespace=namespace)
+        if current is not None and current >= version:
+            # Several changes within the same millisecond.
+            version = current + 1
+        models.MemcacheManager.set(
+            cls.MEMCACHE_KEY, version, ttl=0, namespace=namespace)
+
+
+def _build_successors(skills):
+    """Maps skill ids to the list of skills which have them as prerequisite."""
+    successors = {}
+    for other in skills.values():
+        for pid in other.prerequisite_ids:
+            successors.setdefault(pid, []).append(other)
+    return successors
+
+
+class ProcessScopedSkillGraphCache(caching.ProcessScopedSingleton):
+    """Skills of recently used courses, indexed and kept in process memory.
+
+    Every request showing skills used to load all the skills of the course
+    and index them again. The skills are kept here along with the version
+    stamp of the course they were loaded for, and used while the stamp is
+    unchanged. Skills translated for the current request are not kept.
+    """
+
+    def __init__(self):
+        self.cache = caching.LRUCache(max_item_count=MAX_CACHED_SKILL_GRAPHS)
+
+    @classmethod
+    def get_skills(cls):
+        """Returns the skills of the current course and their successors.
+
+        Returns:
+            A tuple of a dict mapping skill ids to skills, and a dict mapping
+            skill ids to the list of their successor skills. Neither the
+            dicts nor the skills may be modified, since they are shared by
+            all requests.
+        """
+        version = SkillMapVersionStamp.get()
+        if version is None or i18n_dashboard.is_translation_required():
+            skills = _SkillDao.get_all_mapped()
+            return skills, _build_successors(skills)
+
+        key = 'skill_graph:%s' % namespace_manager.get_namespace()
+        cache = cls.instance().cache
+        found, entry = cache.get(key)
+        if found and entry[0] == version:
+            SKILL_GRAPH_CACHE_HIT.inc()
+            return entry[1], entry[2]
+
+        SKILL_GRAPH_CACHE_MISS.inc()
+        skills = _SkillDao.get_all_mapped()
+        successors = _build_successors(skills)
+        if (SkillMapVersionStamp.now() - version >
+            SKILL_GRAPH_CACHE_DELAY_SEC * 1000):
+            cache.put(key, (version, skills, successors))
+        return skills, successors
+
+
 class SkillGraph(caching.RequestScopedSingleton):
     """Facade to handle the CRUD lifecycle of the skill dependency graph."""
 
     def __init__(self):
-        # dict mapping skill id to skill
-        self._skills = _SkillDao.get_all_mapped()
+        skills, successors = ProcessScopedSkillGraphCache.get_skills()
+        # dict mapping skill id to skill; the skills may be shared with other
+        # requests, so they are copied before being changed
+        self._skills = dict(skills)
         # dict mapping skill id to list of successor SkillDTO's
-        self._successors = None
-        self._rebuild()
+        self._successors = successors
+        SkillMap.clear_all()
 
     def _rebuild(self):
         self.build_successors()
         SkillMap.clear_all()
 
     def build_successors(self):
-        self._successors = {}
-        for other in self._skills.values():
-            for pid in other.prerequisite_ids:
-                self._successors.setdefault(pid, []).append(other)
+        self._successors = _build_successors(self._skills)
+
+    def _get_for_update(self, skill_id):
+        """Replaces a skill with a copy that can be changed and returns it."""
+        skill = self._skills[skill_id]
+        skill = Skill(skill.id, copy.deepcopy(skill.dict))
+        self._skills[skill_id] = skill
+        return skill
 
     @classmethod
     def load(cls):
@@ -335,7 +457,9 @@ class SkillGraph(caching.RequestScopedSingleton):
             skill_id in self._skills,
             'Skill is not present in the skill map', errors)
 
-        successors = self.successors(skill_id)
+        successors = [
+            self._get_for_update(successor.id)
+            for successor in self.successors(skill_id)]
         for successor in successors:
             prerequisite_ids = successor.prerequisite_ids
             prerequisite_ids.remove(skill_id)
@@ -384,7 +508,7 @@ class SkillGraph(caching.RequestScopedSingleton):
     def add_prerequisite(self, skill_id, prerequisite_skill_id, errors=None):
         self._validate_prerequisite(skill_id, prerequisite_skill_id, errors)
 
-        skill = self._skills.get(skill_id)
+        skill = self._get_for_update(skill_id)
         prerequisite_skills = skill.prerequisite_ids
         _assert(
             prerequisite_skill_id not in prerequisite_skills,
@@ -403,7 +527,7 @@ class SkillGraph(caching.RequestScopedSingleton):
             prerequisite_skill_id in self._skills,
             'Prerequisite does not exist', errors)
 
-        skill = self._skills[skill_id]
+        skill = self._get_for_update(skill_id)
         prerequisite_skills = skill.prerequisite_ids
         _assert(
             prerequisite_skill_id in prerequisite_skills,
@@ -591,34 +715,43 @@ class SkillMap(caching.RequestScopedSingleton):
         return successors
 
     def _topo_sort(self):
-        """Returns topologically sorted co-sets."""
+        """Returns topologically sorted co-sets, or None if there is a cycle.
+
+        Each co-set holds the skills whose prerequisites are all in earlier
+        co-sets. Uses Kahn's algorithm, which visits every skill and every
+        prerequisite once.
+        """
         successors = self.build_successors()
+        in_degree = dict.fromkeys(successors, 0)
+        for dst in successors.itervalues():
+            for sid in dst:
+                in_degree[sid] += 1
         ret = []
-        co_set = set(
-            successors.keys()) - reduce(
-            set.union, successors.values())  # Skills with no prerequisites.
-        while True:
-            if not co_set:
-                break
+        visited = 0
+        co_set = set(  # Skills with no prerequisites.
+            sid for sid, degree in in_degree.iteritems() if not degree)
+        while co_set:
             ret.append(co_set)
-            for x in co_set:
-                del successors[x]
-            for src, dst in successors.items():
-                successors[src] = dst - co_set
-            co_set = set(successors.keys()) - reduce(
-                set.union, successors.values(), set())
-        if successors:  # There is unvisited nodes -> there is a cycle.
+            visited += len(co_set)
+            next_co_set = set()
+            for src in co_set:
+                for dst in successors[src]:
+                    in_degree[dst] -= 1
+                    if not in_degree[dst]:
+                        next_co_set.add(dst)
+            co_set = next_co_set
+        if visited < len(successors):  # Skills left unvisited are in a cycle.
             return None
-        else:
-            return ret
+        return ret
 
     def _set_topological_sort_index(self):
-        chain = []
-        for x in self._topo_sort():
-            chain.extend(list(x))
+        index = {}
+        for co_set in self._topo_sort() or []:
+            for sid in co_set:
+                index[sid] = len(index)
         for skill in self._skill_graph.skills:
             self._skill_infos[skill.id].set_topo_sort_index(
-                chain.index(skill.id))
+                index.get(skill.id))
 
     @classmethod
     def load(cls, course):
@@ -1232,12 +1365,18 @@ class SkillCompletionTracker(object):
             skill progress.
             skill_id: the id of the skill to modify.
             state: a valid progress state for the skill.
+
+        Returns:
+            True if progress_value was modified, False otherwise.
         """
         skill_progress = progress_value.get(str(skill_id))
         if not skill_progress:
             progress_value[str(skill_id)] = {state: time.time()}
         elif not state in skill_progress:
             progress_value[str(skill_id)][state] = time.time()
+        else:
+            return False
+        return True
 
     def recalculate_progress(self, lprogress_tracker, lprogress, skill):
         """Calculates the progress of the skill from the linear progress.
@@ -1273,40 +1412,70 @@ class SkillCompletionTracker(object):
             return self.IN_PROGRESS
         return self.NOT_ATTEMPTED
 
-    def update_skills(self, student, lprogress, lesson_id):
-        """Recalculates and saves the progress of all skills mapped to lesson.
+    def recalculate_skills(self, student, lprogress, lesson_id):
+        """Recalculates the progress of all skills mapped to lesson.
 
-        If self does not have a valid skill_map instance (was initialized
-        with no arguments) then this method does not perform any action.
+        The progress is not saved, so the caller can put it together with
+        the linear progress.
 
         Args:
             student: an instance of StudentEntity.
             lprogress: an instance of StudentPropertyEntity with the linear
             progress of student.
             lesson_id: the id of the lesson.
+
+        Returns:
+            The StudentPropertyEntity with the updated skill progress, or None
+            if the progress did not change or self does not have a valid
+            skill_map instance (was initialized with no arguments).
         """
         # TODO(milit): Add process for lesson None.
         if not self._skill_map:
-            return
+            return None
+        skills = self._skill_map.get_skills_for_lesson(lesson_id)
+        if not skills:
+            return None
         lprogress_tracker = progress.UnitLessonCompletionTracker(self.course)
 
         sprogress = self._get_or_create_progress(student)
         progress_value = {}
         if sprogress.value:
             progress_value = transforms.loads(sprogress.value)
-        skills = self._skill_map.get_skills_for_lesson(lesson_id)
+        changed = False
         for skill in skills:
             new_progress = self.recalculate_progress(
                 lprogress_tracker, lprogress, skill)
-            self.update_skill_progress(progress_value, skill.id, new_progress)
+            changed |= self.update_skill_progress(
+                progress_value, skill.id, new_progress)
+        if not changed:
+            return None
 
         sprogress.value = transforms.dumps(progress_value)
-        sprogress.put()
+        return sprogress
+
+    def update_skills(self, student, lprogress, lesson_id):
+        """Recalculates and saves the progress of all skills mapped to lesson.
+
+        If self does not have a valid skill_map instance (was initialized
+        with no arguments) then this method does not perform any action.
+
+        Args:
+            student: an instance of StudentEntity.
+            lprogress: an instance of StudentPropertyEntity with the linear
+            progress of student.
+            lesson_id: the id of the lesson.
+        """
+        sprogress = self.recalculate_skills(student, lprogress, lesson_id)
+        if sprogress:
+            sprogress.put()
 
 
 def post_update_progress(course, student, lprogress, event_entity, event_key):
     """Updates the skill progress after the update of the linear progress.
 
+    The skill progress is not saved here; it is returned so that
+    UnitLessonCompletionTracker puts it in the same batch as lprogress.
+
     Args:
         course: the current course.
         student: an instance of StudentEntity.
@@ -1322,9 +1491,13 @@ def post_update_progress(course, student, lprogress, event_entity, event_key):
         progress.UnitLessonCompletionTracker.get_elements_from_key. If,
         for example, event_entity is 'lesson', the event key could be
         the key of the lesson or the key of any subentities of the lesson.
+
+    Returns:
+        A list with the StudentPropertyEntity holding the updated skill
+        progress, or None if there is nothing to save.
     """
     if event_entity not in SkillCompletionTracker.PROGRESS_DEPENDENCIES:
-        return
+        return None
 
     key_elements = progress.UnitLessonCompletionTracker.get_elements_from_key(
         event_key)
@@ -1332,12 +1505,13 @@ def post_update_progress(course, student, lprogress, event_entity, event_key):
     unit_id = key_elements.get('unit')
     if not (lesson_id and unit_id and
             course.version == courses.CourseModel13.VERSION):
-        return
+        return None
     if not isinstance(course.find_lesson_by_id(unit_id, lesson_id),
                       courses.Lesson13):
-        return
-    SkillCompletionTracker(course).update_skills(
+        return None
+    sprogress = SkillCompletionTracker(course).recalculate_skills(
         student, lprogress, lesson_id)
+    return [sprogress] if sprogress else None
 
 
 def register_tabs():
@@ -1578,6 +1752,7 @@ def notify_module_enabled():
 
     progress.UnitLessonCompletionTracker.POST_UPDATE_PROGRESS_HOOK.append(
         post_update_progress)
+    courses.CourseModel13.POST_SAVE_HOOKS.append(SkillMapVersionStamp.bump)
 
     data_sources.Registry.register(SkillMapDataSource)
 
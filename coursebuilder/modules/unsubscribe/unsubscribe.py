@@ -25,6 +25,7 @@ from common import crypto
 from controllers import utils
 from models import custom_modules
 from models import entities
+from models import models
 from models import services
 
 from google.appengine.api import users
@@ -34,6 +35,9 @@ from google.appengine.ext import db
 TEMPLATES_DIR = os.path.join(
     appengine_config.BUNDLE_ROOT, 'modules', 'unsubscribe', 'templates')
 
+# Maximum number of email addresses looked up in one memcache or datastore call.
+MAX_EMAILS_PER_BATCH = 500
+
 
 def get_unsubscribe_url(handler, email):
     """Create an individualized unsubscribe link for a user.
@@ -76,6 +80,10 @@ def get_resubscribe_url(handler, email):
     return '%s?%s' % (abs_url, query)
 
 
+def _memcache_key(email):
+    return 'unsubscribe:has_unsubscribed:%s' % email
+
+
 def has_unsubscribed(email):
     """Check whether the user has requested to be unsubscribed.
 
@@ -85,8 +93,44 @@ def has_unsubscribed(email):
     Returns:
       bool. True if the user has requested to be unsubscribed.
     """
-    model = SubscriptionStateEntity.get_by_key_name(email)
-    return (model is not None) and not model.is_subscribed
+    return has_unsubscribed_multi([email])[email]
+
+
+def has_unsubscribed_multi(emails):
+    """Check which of several users have requested to be unsubscribed.
+
+    The subscription states are read from memcache, and those not found there
+    are fetched from the datastore with batched key gets.
+
+    Args:
+      emails: iterable of string. The email addresses of the users.
+
+    Returns:
+      dict of string to bool. Maps each email address to True if the user
+      has requested to be unsubscribed.
+    """
+    emails = list(set(emails))
+    result = {}
+    for start in xrange(0, len(emails), MAX_EMAILS_PER_BATCH):
+        batch = emails[start:start + MAX_EMAILS_PER_BATCH]
+        cached = models.MemcacheManager.get_multi(
+            [_memcache_key(email) for email in batch])
+        missing = []
+        for email in batch:
+            if _memcache_key(email) in cached:
+                result[email] = cached[_memcache_key(email)]
+            else:
+                missing.append(email)
+        if not missing:
+            continue
+
+        memcache_update = {}
+        for email, model in zip(
+            missing, SubscriptionStateEntity.get_by_key_name(missing)):
+            result[email] = (model is not None) and not model.is_subscribed
+            memcache_update[_memcache_key(email)] = result[email]
+        models.MemcacheManager.set_multi(memcache_update)
+    return result
 
 
 def set_subscribed(email, is_subscribed):
@@ -101,12 +145,9 @@ def set_subscribed(email, is_subscribed):
     Returns:
       None.
     """
-    model = SubscriptionStateEntity.get_by_key_name(email)
-    if model is None:
-        model = SubscriptionStateEntity(key_name=email)
-
-    model.is_subscribed = is_subscribed
-    model.put()
+    # The entity holds nothing but the state, so it is overwritten blindly.
+    SubscriptionStateEntity(key_name=email, is_subscribed=is_subscribed).put()
+    models.MemcacheManager.set(_memcache_key(email), not is_subscribed)
 
 
 class UnsubscribeHandler(utils.BaseHandler):
@@ -202,6 +243,9 @@ def register_module():
         def  has_unsubscribed(self, email):
             return has_unsubscribed(email)
 
+        def has_unsubscribed_multi(self, emails):
+            return has_unsubscribed_multi(emails)
+
         def set_subscribed(self, email, is_subscribed):
             return set_subscribed(email, is_subscribed)
 
@@ -45,6 +45,7 @@ ALL_TEST_CLASSES = {
     'tests.functional.common_crypto.GenCryptoKeyFromHmac': 2,
     'tests.functional.common_crypto.GetExternalUserIdTests': 4,
     'tests.functional.explorer_module.CourseExplorerTest': 3,
+    'tests.functional.explorer_module.CourseCatalogTest': 4,
     'tests.functional.explorer_module.CourseExplorerDisabledTest': 3,
     'tests.functional.explorer_module.GlobalProfileTest': 1,
     'tests.functional.controllers_review.PeerReviewControllerTest': 7,
@@ -53,6 +54,7 @@ ALL_TEST_CLASSES = {
     'tests.functional.i18n.I18NCourseSettingsTests': 7,
     'tests.functional.i18n.I18NMultipleChoiceQuestionTests': 6,
     'tests.functional.model_analytics.AnalyticsTabsWithNoJobs': 8,
+    'tests.functional.model_analytics.CompositeMapReduceTest': 4,
     'tests.functional.model_analytics.CronCleanupTest': 14,
     'tests.functional.model_analytics.MapReduceSimpleTest': 1,
     'tests.functional.model_analytics.ProgressAnalyticsTest': 8,
@@ -68,6 +70,7 @@ ALL_TEST_CLASSES = {
     'tests.functional.model_models.ContentChunkTestCase': 15,
     'tests.functional.model_models.EventEntityTestCase': 1,
     'tests.functional.model_models.MemcacheManagerTestCase': 4,
+    'tests.functional.model_models.PerfCounterAggregationTestCase': 4,
     'tests.functional.model_models.PersonalProfileTestCase': 1,
     'tests.functional.model_models.QuestionDAOTestCase': 3,
     'tests.functional.model_models.StudentAnswersEntityTestCase': 1,
@@ -78,19 +81,25 @@ ALL_TEST_CLASSES = {
     'tests.functional.model_student_work.ReviewTest': 3,
     'tests.functional.model_student_work.SubmissionTest': 3,
     'tests.functional.model_utils.QueryMapperTest': 4,
+    'tests.functional.model_vfs.VfsCacheInvalidationTest': 4,
     'tests.functional.model_vfs.VfsLargeFileSupportTest': 6,
+    'tests.functional.model_vfs.VfsManifestTest': 5,
     'tests.functional.module_config_test.ManipulateAppYamlFileTest': 8,
     'tests.functional.module_config_test.ModuleIncorporationTest': 8,
     'tests.functional.module_config_test.ModuleManifestTest': 7,
     'tests.functional.modules_admin.AdminDashboardTabTests': 4,
+    'tests.functional.modules_analytics.ClusteringGeneratorTests': 12,
+    'tests.functional.modules_analytics.StudentAggregateIncrementalTest': 4,
+    'tests.functional.modules_analytics.StudentAggregateReduceTest': 6,
     'tests.functional.modules_analytics.StudentAggregateTest': 6,
+    'tests.functional.modules_assessment_tags.QuestionPrefetchTest': 3,
     'tests.functional.modules_balancer.ExternalTaskTest': 3,
     'tests.functional.modules_balancer.ManagerTest': 10,
     'tests.functional.modules_balancer.ProjectRestHandlerTest': 5,
     'tests.functional.modules_balancer.TaskRestHandlerTest': 20,
     'tests.functional.modules_balancer.WorkerPoolTest': 2,
-    'tests.functional.modules_certificate.CertificateHandlerTestCase': 5,
-    'tests.functional.modules_certificate.CertificateCriteriaTestCase': 6,
+    'tests.functional.modules_certificate.CertificateHandlerTestCase': 7,
+    'tests.functional.modules_certificate.CertificateCriteriaTestCase': 9,
     'tests.functional.modules_code_tags.CodeTagTests': 4,
     'tests.functional.modules_core_tags.GoogleDriveRESTHandlerTest': 8,
     'tests.functional.modules_core_tags.GoogleDriveTagRendererTest': 6,
@@ -98,14 +107,16 @@ ALL_TEST_CLASSES = {
     'tests.functional.modules_core_tags.TagsInclude': 8,
     'tests.functional.modules_core_tags.TagsMarkdown': 1,
     'tests.functional.modules_courses.AccessDraftsTestCase': 2,
-    'tests.functional.modules_dashboard.CourseOutlineTestCase': 1,
+    'tests.functional.modules_dashboard.CourseOutlineTestCase': 3,
     'tests.functional.modules_dashboard.DashboardAccessTestCase': 3,
-    'tests.functional.modules_dashboard.QuestionDashboardTestCase': 9,
+    'tests.functional.modules_dashboard.QuestionDashboardTestCase': 11,
     'tests.functional.modules_dashboard.RoleEditorTestCase': 3,
     'tests.functional.modules_data_pump.SchemaConversionTests': 1,
     'tests.functional.modules_data_pump.StudentSchemaValidationTests': 2,
     'tests.functional.modules_data_pump.PiiTests': 7,
     'tests.functional.modules_data_pump.BigQueryInteractionTests': 36,
+    'tests.functional.modules_data_pump.IncrementalExportTests': 6,
+    'tests.functional.modules_data_pump.BatchedUploadTests': 8,
     'tests.functional.modules_data_pump.UserInteractionTests': 4,
     'tests.functional.modules_data_source_providers.CourseElementsTest': 11,
     'tests.functional.modules_data_source_providers.StudentScoresTest': 6,
@@ -133,7 +144,7 @@ ALL_TEST_CLASSES = {
     'tests.functional.modules_i18n_dashboard_jobs'
         '.TranslateToReversedCaseTest': 1,
     'tests.functional.modules_i18n_dashboard_jobs.UploadTranslationsTest': 5,
-    'tests.functional.modules_invitation.InvitationHandlerTests': 16,
+    'tests.functional.modules_invitation.InvitationHandlerTests': 17,
     'tests.functional.modules_invitation.ProfileViewInvitationTests': 5,
     'tests.functional.modules_invitation.SantitationTests': 1,
     'tests.functional.modules_manual_progress.ManualProgressTest': 24,
@@ -155,17 +166,18 @@ ALL_TEST_CLASSES = {
     'tests.functional.modules_skill_map.CountSkillCompletionsTests': 3,
     'tests.functional.modules_skill_map.LocationListRestHandlerTests': 2,
     'tests.functional.modules_skill_map.SkillAggregateRestHandlerTests': 6,
-    'tests.functional.modules_skill_map.SkillCompletionTrackerTests': 6,
+    'tests.functional.modules_skill_map.SkillCompletionTrackerTests': 7,
+    'tests.functional.modules_skill_map.SkillGraphCacheTests': 2,
     'tests.functional.modules_skill_map.SkillGraphTests': 11,
     'tests.functional.modules_skill_map.SkillI18nTests': 5,
     'tests.functional.modules_skill_map.SkillMapAnalyticsTabTests': 2,
     'tests.functional.modules_skill_map.SkillMapHandlerTests': 4,
     'tests.functional.modules_skill_map.SkillMapMetricTests': 10,
-    'tests.functional.modules_skill_map.SkillMapTests': 4,
+    'tests.functional.modules_skill_map.SkillMapTests': 5,
     'tests.functional.modules_skill_map.SkillRestHandlerTests': 12,
     'tests.functional.modules_skill_map.StudentSkillViewWidgetTests': 6,
     'tests.functional.modules_unsubscribe.GetUnsubscribeUrlTests': 1,
-    'tests.functional.modules_unsubscribe.SubscribeAndUnsubscribeTests': 4,
+    'tests.functional.modules_unsubscribe.SubscribeAndUnsubscribeTests': 6,
     'tests.functional.modules_unsubscribe.UnsubscribeHandlerTests': 4,
     'tests.functional.modules_usage_reporting.ConsentBannerTests': 4,
     'tests.functional.modules_usage_reporting.ConsentBannerRestHandlerTests': 3,
@@ -176,7 +188,7 @@ ALL_TEST_CLASSES = {
     'tests.functional.modules_usage_reporting.MessagingTests': 8,
     'tests.functional.modules_usage_reporting.UsageReportingTests': 3,
     'tests.functional.progress_percent.ProgressPercent': 4,
-    'tests.functional.review_module.ManagerTest': 55,
+    'tests.functional.review_module.ManagerTest': 59,
     'tests.functional.review_peer.ReviewStepTest': 3,
     'tests.functional.review_peer.ReviewSummaryTest': 5,
     'tests.functional.student_answers.StudentAnswersAnalyticsTest': 1,
@@ -197,7 +209,7 @@ ALL_TEST_CLASSES = {
     'tests.functional.test_classes.DatastoreBackedSampleCourseTest': 44,
     'tests.functional.test_classes.EtlMainTestCase': 42,
     'tests.functional.test_classes.EtlRemoteEnvironmentTestCase': 0,
-    'tests.functional.test_classes.InfrastructureTest': 21,
+    'tests.functional.test_classes.InfrastructureTest': 23,
     'tests.functional.test_classes.I18NTest': 2,
     'tests.functional.test_classes.LessonComponentsTest': 2,
     'tests.functional.test_classes.MemcacheTest': 65,
@@ -211,12 +223,13 @@ ALL_TEST_CLASSES = {
     'tests.functional.test_classes.VirtualFileSystemTest': 44,
     'tests.functional.test_classes.ImportActivityTests': 7,
     'tests.functional.test_classes.ImportAssessmentTests': 3,
-    'tests.functional.test_classes.ImportGiftQuestionsTests': 1,
+    'tests.functional.test_classes.ImportGiftQuestionsTests': 4,
     'tests.functional.unit_assessment.UnitPrePostAssessmentTest': 17,
     'tests.functional.unit_description.UnitDescriptionsTest': 1,
     'tests.functional.unit_header_footer.UnitHeaderFooterTest': 11,
     'tests.functional.unit_on_one_page.UnitOnOnePageTest': 3,
-    'tests.functional.whitelist.WhitelistTest': 12,
+    'tests.functional.whitelist.WhitelistTest': 15,
+    'tests.functional.whitelist.AccessControlListTest': 3,
     'tests.integration.test_classes': 19,
     'tests.unit.etl_mapreduce.HistogramTests': 5,
     'tests.unit.etl_mapreduce.FlattenJsonTests': 4,
@@ -257,7 +270,8 @@ ALL_TEST_CLASSES = {
     'tests.unit.gift_parser_tests.TestMultiChoiceMultipleSelectionQuestion': 3,
     'tests.unit.gift_parser_tests.TestHead': 2,
     'tests.unit.gift_parser_tests.TestMultiChoiceQuestion': 5,
-    'tests.unit.gift_parser_tests.TestCreateManyGiftQuestion': 1
+    'tests.unit.gift_parser_tests.TestCreateManyGiftQuestion': 1,
+    'tests.unit.gift_parser_tests.TestParseQuestionsWithErrors': 3
 }
 EXPENSIVE_TESTS = ['tests.integration.test_classes']
 
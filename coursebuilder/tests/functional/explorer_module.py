@@ -24,8 +24,10 @@ from actions import assert_equals
 from controllers import sites
 from models import config
 from models import models
+from models import roles
 from models import transforms
 from models.models import PersonalProfile
+from modules.course_explorer import catalog
 from modules.course_explorer import course_explorer
 from modules.course_explorer import student
 
@@ -154,6 +156,102 @@ class CourseExplorerTest(BaseExplorerTest):
         sites.reset_courses()
 
 
+class CourseCatalogTest(BaseExplorerTest):
+    """Tests the cross-course catalog used by the explorer pages."""
+
+    COURSE_NAME = 'catalog_course'
+    ADMIN_EMAIL = 'admin@example.com'
+    STUDENT_EMAIL = 'student@example.com'
+
+    def setUp(self):
+        super(CourseCatalogTest, self).setUp()
+        config.Registry.test_overrides[models.CAN_USE_MEMCACHE.name] = True
+
+    def tearDown(self):
+        sites.reset_courses()
+        super(CourseCatalogTest, self).tearDown()
+
+    def test_catalog_refreshed_when_settings_saved(self):
+        actions.simple_add_course(
+            self.COURSE_NAME, self.ADMIN_EMAIL, 'Catalog Course Original')
+        actions.login(self.STUDENT_EMAIL)
+
+        response = self.get('/explorer')
+        assert_contains('Catalog Course Original', response.body)
+        assert_equals(
+            'Catalog Course Original',
+            catalog.CourseCatalog.get_entries()[
+                'ns_%s' % self.COURSE_NAME]['title'])
+
+        actions.update_course_config(
+            self.COURSE_NAME, {'course': {'title': 'Catalog Course Renamed'}})
+        response = self.get('/explorer')
+        assert_contains('Catalog Course Renamed', response.body)
+        assert_does_not_contain('Catalog Course Original', response.body)
+
+        actions.update_course_config(
+            self.COURSE_NAME, {'course': {'now_available': False}})
+        response = self.get('/explorer')
+        assert_does_not_contain('Catalog Course Renamed', response.body)
+
+    def test_course_admin_sees_unavailable_course(self):
+        actions.simple_add_course(
+            self.COURSE_NAME, self.ADMIN_EMAIL, 'Catalog Course Hidden')
+        actions.update_course_config(
+            self.COURSE_NAME, {'course': {'now_available': False}})
+
+        actions.login(self.STUDENT_EMAIL)
+        response = self.get('/explorer')
+        assert_does_not_contain('Catalog Course Hidden', response.body)
+
+        actions.logout()
+        actions.login(self.ADMIN_EMAIL)
+        response = self.get('/explorer')
+        assert_contains('Catalog Course Hidden', response.body)
+
+    def test_whitelist_checked_against_course_settings(self):
+        actions.simple_add_course(
+            self.COURSE_NAME, self.ADMIN_EMAIL, 'Catalog Course Listed')
+        actions.update_course_config(
+            self.COURSE_NAME, {'course': {'whitelist': self.ADMIN_EMAIL}})
+
+        actions.login(self.STUDENT_EMAIL)
+        response = self.get('/explorer')
+        assert_does_not_contain('Catalog Course Listed', response.body)
+        entry = catalog.CourseCatalog.get_entries()['ns_%s' % self.COURSE_NAME]
+        assert_equals(
+            set(catalog.CATALOG_COURSE_KEYS + ['slug', 'access_lists']),
+            set(entry.keys()))
+        assert_does_not_contain(self.ADMIN_EMAIL, str(entry))
+
+        actions.update_course_config(
+            self.COURSE_NAME, {'course': {'whitelist': self.STUDENT_EMAIL}})
+        response = self.get('/explorer')
+        assert_contains('Catalog Course Listed', response.body)
+
+    def test_access_checked_without_loading_course_settings(self):
+        actions.simple_add_course(
+            self.COURSE_NAME, self.ADMIN_EMAIL, 'Catalog Course Listed')
+        actions.update_course_config(
+            self.COURSE_NAME, {'course': {'whitelist': self.STUDENT_EMAIL}})
+        actions.login(self.STUDENT_EMAIL)
+        response = self.get('/explorer')
+        assert_contains('Catalog Course Listed', response.body)
+
+        def fail(unused_cls, unused_app_context):
+            raise AssertionError('Course settings should not be loaded.')
+
+        self.swap(roles.Roles, 'is_user_whitelisted', classmethod(fail))
+        self.swap(roles.Roles, 'is_course_admin', classmethod(fail))
+        response = self.get('/explorer')
+        assert_contains('Catalog Course Listed', response.body)
+
+        actions.logout()
+        actions.login('other@example.com')
+        response = self.get('/explorer')
+        assert_does_not_contain('Catalog Course Listed', response.body)
+
+
 class CourseExplorerDisabledTest(actions.TestBase):
     """Tests when course explorer is disabled."""
 
@@ -32,8 +32,10 @@ import appengine_config
 from common import utils as common_utils
 from controllers import sites
 from controllers import utils
+from models import analytics
 from models import config
 from models import courses
+from models import data_sources
 from models import entities
 from models import jobs
 from models import models
@@ -945,3 +947,149 @@ class MapReduceSimpleTest(actions.TestBase):
                 self.assertEquals(
                     DummyEntity.NUM_ENTITIES / DummyMapReduceJob.NUM_SHARDS,
                     value)
+
+
+class DummyCountingMapReduceJob(jobs.AbstractCountingMapReduceJob):
+
+    COUNT_KEY = 'count'
+
+    def entity_class(self):
+        return DummyEntity
+
+    @staticmethod
+    def map(item):
+        yield DummyCountingMapReduceJob.COUNT_KEY, 1
+
+
+class DummyStudentMapReduceJob(jobs.AbstractCountingMapReduceJob):
+
+    def entity_class(self):
+        return models.Student
+
+    @staticmethod
+    def map(unused_item):
+        yield 'students', 1
+
+
+class DummyJsonMapReduceJob(jobs.MapReduceJob):
+
+    def entity_class(self):
+        return DummyEntity
+
+    @staticmethod
+    def map(item):
+        yield item.key().id() % 2, 1
+
+    @staticmethod
+    def reduce(key, values):
+        yield transforms.dumps([key, len(values)])
+
+
+class CompositeMapReduceTest(actions.TestBase):
+
+    def setUp(self):
+        super(CompositeMapReduceTest, self).setUp()
+        admin_email = 'admin@foo.com'
+        self.context = actions.simple_add_course(
+            'composite_mr_test', admin_email, 'Test')
+        actions.login(admin_email, is_admin=True)
+        with common_utils.Namespace('ns_composite_mr_test'):
+            for key in range(1, DummyEntity.NUM_ENTITIES + 1):
+                DummyDAO.upsert(key, {})
+
+    def test_jobs_share_one_pass(self):
+        jobs.CompositeMapReduceJob.submit_jobs(
+            self.context, [DummyMapReduceJob, DummyCountingMapReduceJob])
+        self.execute_all_deferred_tasks()
+
+        # Each component has its own status and results...
+        dummy_job = DummyMapReduceJob(self.context).load()
+        counting_job = DummyCountingMapReduceJob(self.context).load()
+        self.assertEquals(jobs.STATUS_CODE_COMPLETED, dummy_job.status_code)
+        self.assertEquals(jobs.STATUS_CODE_COMPLETED, counting_job.status_code)
+        self.assertEquals(
+            [[DummyCountingMapReduceJob.COUNT_KEY, DummyEntity.NUM_ENTITIES]],
+            jobs.MapReduceJob.get_results(counting_job))
+        results = jobs.MapReduceJob.get_results(dummy_job)
+        self.assertEquals(DummyMapReduceJob.NUM_SHARDS + 1, len(results))
+        for key, value in results:
+            if key == DummyMapReduceJob.TOTAL_AGGREGATION_KEY:
+                self.assertEquals(
+                    DummyEntity.NUM_ENTITIES +
+                    DummyMapReduceJob.BOGUS_VALUE_ADDED_IN_COMBINE_STEP,
+                    value)
+            else:
+                self.assertEquals(
+                    DummyEntity.NUM_ENTITIES / DummyMapReduceJob.NUM_SHARDS,
+                    value)
+
+        # ...but both were produced by the same map/reduce pipeline.
+        self.assertEquals(
+            jobs.MapReduceJob.get_root_pipeline_id(dummy_job),
+            jobs.MapReduceJob.get_root_pipeline_id(counting_job))
+        composite = jobs.CompositeMapReduceJob(
+            self.context, [DummyMapReduceJob, DummyCountingMapReduceJob])
+        self.assertEquals(
+            jobs.STATUS_CODE_COMPLETED, composite.load().status_code)
+
+    def test_results_are_stored_as_when_run_alone(self):
+        job = DummyJsonMapReduceJob(self.context)
+        job.submit()
+        self.execute_all_deferred_tasks()
+        results_alone = sorted(jobs.MapReduceJob.get_results(job.load()))
+        self.assertEquals(
+            [[0, DummyEntity.NUM_ENTITIES / 2],
+             [1, DummyEntity.NUM_ENTITIES / 2]], results_alone)
+
+        jobs.CompositeMapReduceJob.submit_jobs(
+            self.context, [DummyJsonMapReduceJob, DummyCountingMapReduceJob])
+        self.execute_all_deferred_tasks()
+        self.assertEquals(
+            results_alone,
+            sorted(jobs.MapReduceJob.get_results(job.load())))
+
+    def test_cron_submits_generators_of_all_data_sources(self):
+        submitted = []
+
+        def submit_jobs(unused_cls, app_context, job_classes):
+            submitted.append(
+                (app_context.get_namespace_name(), set(job_classes)))
+
+        self.swap(jobs.CompositeMapReduceJob, 'submit_jobs',
+                  classmethod(submit_jobs))
+        response = self.get(analytics.UpdateAllAnalyticsHandler.URL,
+                            headers={'X-AppEngine-Cron': 'True'})
+        self.assertEquals(200, response.status_int)
+        self.assertEquals('Disabled.', response.body)
+        self.assertEquals([], submitted)
+
+        with actions.OverriddenConfig(
+            analytics.CAN_UPDATE_ALL_ANALYTICS.name, True):
+            response = self.get(analytics.UpdateAllAnalyticsHandler.URL,
+                                expect_errors=True)
+            self.assertEquals(403, response.status_int)
+            self.assertEquals([], submitted)
+
+            response = self.get(analytics.UpdateAllAnalyticsHandler.URL,
+                                headers={'X-AppEngine-Cron': 'True'})
+            self.assertEquals(200, response.status_int)
+        self.assertIn(
+            ('ns_composite_mr_test',
+             data_sources.Registry.get_generator_classes()), submitted)
+
+    def test_jobs_over_different_kinds_are_run_separately(self):
+        with self.assertRaises(ValueError):
+            jobs.CompositeMapReduceJob(
+                self.context, [DummyCountingMapReduceJob,
+                               DummyStudentMapReduceJob])
+
+        jobs.CompositeMapReduceJob.submit_jobs(
+            self.context, [DummyCountingMapReduceJob, DummyStudentMapReduceJob])
+        self.execute_all_deferred_tasks()
+        counting_job = DummyCountingMapReduceJob(self.context).load()
+        student_job = DummyStudentMapReduceJob(self.context).load()
+        self.assertEquals(jobs.STATUS_CODE_COMPLETED, counting_job.status_code)
+        self.assertEquals(jobs.STATUS_CODE_COMPLETED, student_job.status_code)
+        self.assertNotEquals(
+            jobs.MapReduceJob.get_root_pipeline_id(counting_job),
+            jobs.MapReduceJob.get_root_pipeline_id(student_job))
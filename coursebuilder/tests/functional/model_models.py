@@ -19,8 +19,11 @@ __author__ = [
 ]
 
 import datetime
+import time
 
+from controllers import sites
 from models import config
+from models import counters
 from models import entities
 from models import models
 from models import services
@@ -339,6 +342,69 @@ class MemcacheManagerTestCase(actions.TestBase):
         self.assertEquals(0, len(data.keys()))
 
 
+class PerfCounterAggregationTestCase(actions.TestBase):
+
+    def setUp(self):
+        super(PerfCounterAggregationTestCase, self).setUp()
+        config.Registry.test_overrides = {
+            models.CAN_USE_MEMCACHE.name: True,
+            models.CAN_AGGREGATE_COUNTERS.name: True}
+        counters.Registry.flush_global_values()
+        self.hits = counters.PerfCounter('gcb-test-hits', '')
+        self.misses = counters.PerfCounter('gcb-test-misses', '')
+
+        self.offset_multi_calls = []
+        old_offset_multi = models.MemcacheManager.offset_multi.im_func
+
+        def offset_multi(cls, mapping, *args, **kwargs):
+            self.offset_multi_calls.append(mapping)
+            return old_offset_multi(cls, mapping, *args, **kwargs)
+
+        self.swap(
+            models.MemcacheManager, 'offset_multi', classmethod(offset_multi))
+
+    def tearDown(self):
+        config.Registry.test_overrides = {}
+        del counters.Registry.registered[self.hits.name]
+        del counters.Registry.registered[self.misses.name]
+        super(PerfCounterAggregationTestCase, self).tearDown()
+
+    def test_increments_are_flushed_in_one_call(self):
+        for _ in xrange(100):
+            self.hits.inc()
+            self.misses.inc(increment=2)
+        self.assertEquals(100, self.hits.value)
+        self.assertEquals(None, self.hits.global_value)
+        self.assertEquals([], self.offset_multi_calls)
+
+        counters.Registry.flush_global_values()
+        self.assertEquals(1, len(self.offset_multi_calls))
+        self.assertEquals(100, self.hits.global_value)
+        self.assertEquals(200, self.misses.global_value)
+
+    def test_increments_are_flushed_after_interval(self):
+        self.hits.inc()
+        self.assertEquals(None, self.hits.global_value)
+
+        counters.Registry.last_flush_time = (
+            time.time() - counters.GLOBAL_VALUE_FLUSH_INTERVAL_SEC)
+        self.hits.inc()
+        self.assertEquals(2, self.hits.global_value)
+
+    def test_increments_are_flushed_at_request_end(self):
+        sites.set_path_info('/')
+        self.hits.inc()
+        self.assertEquals(None, self.hits.global_value)
+        sites.unset_path_info()
+        self.assertEquals(1, self.hits.global_value)
+
+    def test_increments_are_dropped_when_aggregation_is_off(self):
+        del config.Registry.test_overrides[models.CAN_AGGREGATE_COUNTERS.name]
+        self.hits.inc()
+        counters.Registry.flush_global_values()
+        self.assertEquals([], self.offset_multi_calls)
+
+
 class TestEntity(entities.BaseEntity):
     data = db.TextProperty(indexed=False)
 
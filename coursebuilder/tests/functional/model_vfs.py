@@ -18,14 +18,18 @@ __author__ = [
     'mgainer@google.com (Mike Gainer)',
 ]
 
+import datetime
 import os
 import random
 import StringIO
 import tempfile
 
+from common import caching
 from common import utils as common_utils
-from models import vfs
+from models import config
 from models import courses
+from models import models
+from models import vfs
 from tests.functional import actions
 from tools.etl import etl
 
@@ -199,3 +203,243 @@ class VfsLargeFileSupportTest(actions.TestBase):
         # from AppEngine about cross-group transaction having too many
         # entities involved.
         self.course.save()
+
+
+class VfsManifestTest(actions.TestBase):
+
+    NAMESPACE = 'ns_foo'
+
+    def setUp(self):
+        super(VfsManifestTest, self).setUp()
+        self.fs = vfs.DatastoreBackedFileSystem(self.NAMESPACE, '/')
+        vfs.ProcessScopedVfsManifestCache.instance().clear()
+        caching.RequestScopedSingleton.clear_all()
+
+    def tearDown(self):
+        config.Registry.test_overrides.pop(models.CAN_USE_MEMCACHE.name, None)
+        vfs.ProcessScopedVfsManifestCache.instance().clear()
+        super(VfsManifestTest, self).tearDown()
+
+    def _put_many(self, filenames):
+        for start in xrange(0, len(filenames), 500):
+            self.fs.put_multi_async([
+                (filename, StringIO.StringIO(filename))
+                for filename in filenames[start:start + 500]])()
+
+    def _check_listing(self, many_files):
+        self.assertEquals(many_files, self.fs.list('/assets/many/'))
+        self.assertEquals(
+            many_files + ['/assets/many_more.txt'], self.fs.list('/assets/man'))
+        self.assertEquals(
+            ['/assets/img/a.png'], self.fs.list('/assets/img'))
+        self.assertEquals(len(many_files) + 3, len(self.fs.list('/')))
+        self.assertEquals([], self.fs.list('/nothing/'))
+        self.assertTrue(self.fs.isfile('/assets/many/%04d.txt' % 1000))
+        self.assertTrue(self.fs.isfile('/data/course.json'))
+        self.assertFalse(self.fs.isfile('/assets/many'))
+        self.assertFalse(self.fs.isfile('/assets/many/missing.txt'))
+
+    def _test_listing(self):
+        many_files = ['/assets/many/%04d.txt' % i for i in xrange(1100)]
+        self._put_many(many_files + [
+            '/assets/many_more.txt', '/assets/img/a.png', '/data/course.json'])
+        self._check_listing(many_files)
+
+    def test_listing_without_manifest(self):
+        self._test_listing()
+
+    def test_listing_with_manifest(self):
+        config.Registry.test_overrides[models.CAN_USE_MEMCACHE.name] = True
+        self._test_listing()
+
+    def test_manifest_is_maintained_on_put_and_delete(self):
+        config.Registry.test_overrides[models.CAN_USE_MEMCACHE.name] = True
+        builds = []
+        old_build = vfs.VfsManifest._build.im_func
+
+        def build(cls):
+            builds.append(True)
+            return old_build(cls)
+
+        self.swap(vfs.VfsManifest, '_build', classmethod(build))
+
+        self.fs.put('/assets/a/one.txt', StringIO.StringIO('one'))
+        self.assertEquals(['/assets/a/one.txt'], self.fs.list('/assets/'))
+        self.assertEquals(1, len(builds))
+
+        self.fs.put('/assets/a/b/two.txt', StringIO.StringIO('two'))
+        self.fs.non_transactional_put('/assets/three.txt', 'three')
+        self.assertEquals(
+            ['/assets/a/b/two.txt', '/assets/a/one.txt', '/assets/three.txt'],
+            self.fs.list('/assets/'))
+        self.assertTrue(self.fs.isfile('/assets/a/b/two.txt'))
+
+        self.fs.delete('/assets/a/b/two.txt')
+        self.assertFalse(self.fs.isfile('/assets/a/b/two.txt'))
+        self.assertEquals([], self.fs.list('/assets/a/b'))
+        self.assertEquals(
+            ['/assets/a/one.txt', '/assets/three.txt'],
+            self.fs.list('/assets/'))
+        self.assertEquals(1, len(builds))
+
+        # A copy of the manifest held by another instance is refreshed from
+        # memcache when it changes.
+        self.fs.put('/assets/four.txt', StringIO.StringIO('four'))
+        vfs.ProcessScopedVfsManifestCache.instance().clear()
+        self.assertTrue(self.fs.isfile('/assets/four.txt'))
+        self.assertEquals(1, len(builds))
+
+        # An evicted manifest is rebuilt, and so is one that can't be brought
+        # up to date because logged changes were evicted.
+        with common_utils.Namespace(self.NAMESPACE):
+            models.MemcacheManager.delete(vfs.VfsManifest.MEMCACHE_KEY)
+        vfs.ProcessScopedVfsManifestCache.instance().clear()
+        self.assertEquals(
+            ['/assets/a/one.txt', '/assets/four.txt', '/assets/three.txt'],
+            self.fs.list('/assets/'))
+        self.assertEquals(2, len(builds))
+
+        self.fs.put('/assets/five.txt', StringIO.StringIO('five'))
+        with common_utils.Namespace(self.NAMESPACE):
+            generation = vfs.VfsChangeLog.get_generation(self.NAMESPACE)
+            models.MemcacheManager.delete(
+                vfs.VfsChangeLog.CHANGES_KEY % generation)
+        self.assertTrue(self.fs.isfile('/assets/five.txt'))
+        self.assertEquals(3, len(builds))
+
+    def test_file_missing_from_built_manifest_is_found(self):
+        config.Registry.test_overrides[models.CAN_USE_MEMCACHE.name] = True
+        self.fs.put('/assets/one.txt', StringIO.StringIO('one'))
+        self.fs.put('/assets/two.txt', StringIO.StringIO('two'))
+        old_build = vfs.VfsManifest._build.im_func
+
+        def build(cls):
+            tree = old_build(cls)
+            cls._remove(tree, '/assets/two.txt')
+            return tree
+
+        # A manifest built by a query which doesn't see the latest write yet.
+        self.swap(vfs.VfsManifest, '_build', classmethod(build))
+        with common_utils.Namespace(self.NAMESPACE):
+            models.MemcacheManager.delete(vfs.VfsManifest.MEMCACHE_KEY)
+        vfs.ProcessScopedVfsManifestCache.instance().clear()
+        self.assertEquals(['/assets/one.txt'], self.fs.list('/assets/'))
+        self.assertTrue(self.fs.isfile('/assets/two.txt'))
+        self.assertFalse(self.fs.isfile('/assets/three.txt'))
+
+    def test_file_deleted_after_query_is_not_in_built_manifest(self):
+        config.Registry.test_overrides[models.CAN_USE_MEMCACHE.name] = True
+        self.fs.put('/assets/one.txt', StringIO.StringIO('one'))
+        self.fs.put('/assets/two.txt', StringIO.StringIO('two'))
+        with common_utils.Namespace(self.NAMESPACE):
+            deleted_key = vfs.FileMetadataEntity.get_by_key_name(
+                '/assets/two.txt').key()
+        self.fs.delete('/assets/two.txt')
+        old_iter_all = caching.iter_all
+
+        def iter_all(query, *args, **kwargs):
+            for result in old_iter_all(query, *args, **kwargs):
+                yield result
+            if query.is_keys_only():
+                yield deleted_key
+
+        # A manifest built by a query which still lists the deleted file.
+        self.swap(caching, 'iter_all', iter_all)
+        with common_utils.Namespace(self.NAMESPACE):
+            models.MemcacheManager.delete(vfs.VfsManifest.MEMCACHE_KEY)
+        vfs.ProcessScopedVfsManifestCache.instance().clear()
+        self.assertEquals(['/assets/one.txt'], self.fs.list('/assets/'))
+        self.assertFalse(self.fs.isfile('/assets/two.txt'))
+
+
+class VfsCacheInvalidationTest(actions.TestBase):
+
+    NAMESPACE = 'ns_foo'
+    FILENAME = '/assets/a.txt'
+
+    def setUp(self):
+        super(VfsCacheInvalidationTest, self).setUp()
+        caching.RequestScopedSingleton.clear_all()
+        self.fs = vfs.DatastoreBackedFileSystem(self.NAMESPACE, '/')
+        self.fs.put(self.FILENAME, StringIO.StringIO('a'))
+        self.assertEquals('a', self.fs.get(self.FILENAME).read())
+        self.assertTrue(self.fs.cache.get(self.FILENAME)[0])
+
+    def tearDown(self):
+        config.Registry.test_overrides.pop(models.CAN_USE_MEMCACHE.name, None)
+        super(VfsCacheInvalidationTest, self).tearDown()
+
+    def _delete_on_other_instance(self, filename):
+        # Deletes the file without evicting it from the cache of this process.
+        with common_utils.Namespace(self.NAMESPACE):
+            vfs.FileMetadataEntity.get_by_key_name(filename).delete()
+            vfs.FileDataEntity.get_by_key_name(filename).delete()
+            vfs.FileTombstoneEntity(
+                key_name=filename,
+                deleted_on=datetime.datetime.utcnow()).put()
+            vfs.VfsChangeLog.record(self.NAMESPACE, [(filename, None)])
+
+    def _create_on_other_instance(self, filename, content):
+        # Writes the file without updating the cache of this process.
+        with common_utils.Namespace(self.NAMESPACE):
+            metadata = self.fs._put(filename, content)
+            vfs.VfsChangeLog.record(self.NAMESPACE, [
+                (filename, (metadata.size, metadata.updated_on))])
+
+    def _start_new_request(self):
+        caching.RequestScopedSingleton.clear_all()
+
+    def test_generation_is_read_again_once_too_old(self):
+        config.Registry.test_overrides[models.CAN_USE_MEMCACHE.name] = True
+        self._start_new_request()
+        self.assertEquals('a', self.fs.get(self.FILENAME).read())
+
+        # A task not bound to a request keeps the generation it has read...
+        generations = vfs.RequestScopedVfsGenerations.instance().generations
+        held = dict(generations)
+        self._delete_on_other_instance(self.FILENAME)
+        generations.clear()
+        generations.update(held)
+        self.assertEquals('a', self.fs.get(self.FILENAME).read())
+
+        # ...until it is too old.
+        self.swap(vfs, 'MAX_VFS_GENERATION_AGE_SECONDS', -1)
+        self.assertIsNone(self.fs.get(self.FILENAME))
+
+    def test_deletion_is_seen_through_change_log(self):
+        config.Registry.test_overrides[models.CAN_USE_MEMCACHE.name] = True
+        self.fs.put('/assets/b.txt', StringIO.StringIO('b'))
+        self.assertEquals('b', self.fs.get('/assets/b.txt').read())
+        self._start_new_request()
+
+        self._delete_on_other_instance(self.FILENAME)
+        self._start_new_request()
+        old_evict_count = vfs.VfsCacheConnection.CACHE_EVICT.value
+        self.assertIsNone(self.fs.get(self.FILENAME))
+        self.assertEquals(
+            1, vfs.VfsCacheConnection.CACHE_EVICT.value - old_evict_count)
+
+        # Other files stay cached.
+        self.assertTrue(self.fs.cache.get('/assets/b.txt')[0])
+
+    def test_creation_after_cached_miss_is_seen_through_change_log(self):
+        config.Registry.test_overrides[models.CAN_USE_MEMCACHE.name] = True
+        self.assertIsNone(self.fs.get('/assets/c.txt'))
+        self.assertEquals((True, None), self.fs.cache.get('/assets/c.txt'))
+        self._start_new_request()
+
+        self._create_on_other_instance('/assets/c.txt', 'c')
+        self._start_new_request()
+        self.assertEquals('c', self.fs.get('/assets/c.txt').read())
+
+        # Other files stay cached.
+        self.assertTrue(self.fs.cache.get(self.FILENAME)[0])
+
+    def test_deletion_is_seen_through_tombstones(self):
+        new_fs = vfs.DatastoreBackedFileSystem(self.NAMESPACE, '/')
+        self._delete_on_other_instance(self.FILENAME)
+
+        # Without memcache, caches are synchronized from the datastore when a
+        # file system connects to them.
+        self.assertEquals('a', self.fs.get(self.FILENAME).read())
+        self.assertIsNone(new_fs.get(self.FILENAME))
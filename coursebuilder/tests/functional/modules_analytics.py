@@ -32,10 +32,12 @@ from models import transforms
 from models.progress import UnitLessonCompletionTracker
 from modules.analytics import clustering
 from modules.analytics import student_aggregate
+from modules.analytics import user_agent_aggregator
 from tests.functional import actions
 from tools.etl import etl
 
 from google.appengine.api import namespace_manager
+from google.appengine.ext import db
 
 
 # Note to those extending this set of tests in the future:
@@ -290,6 +292,280 @@ class StudentAggregateTest(AbstractModulesAnalyticsTest):
         self.assertEqual(expected, actual['youtube'])
 
 
+class StudentAggregateIncrementalTest(AbstractModulesAnalyticsTest):
+
+    def setUp(self):
+        super(StudentAggregateIncrementalTest, self).setUp()
+        self.load_course('simple_questions')
+        self.load_datastore('location_locale')
+
+        self.processed = []
+        old_process_event = (
+            user_agent_aggregator.UserAgentAggregator.process_event.im_func)
+
+        def process_event(cls, event, static_params):
+            self.processed.append(event.key())
+            return old_process_event(cls, event, static_params)
+
+        self.swap(user_agent_aggregator.UserAgentAggregator, 'process_event',
+                  classmethod(process_event))
+
+    def _add_events(self, user_agent, count):
+        with common_utils.Namespace('ns_' + self.COURSE_NAME):
+            student = models.Student.get_by_email('foo@bar.com')
+            template = [
+                event for event in models.EventEntity.all()
+                if event.source == 'enter-page' and
+                event.user_id == student.user_id][0]
+            data = transforms.loads(template.data)
+            data['user_agent'] = user_agent
+            for _ in xrange(count):
+                models.EventEntity(
+                    source=template.source, user_id=template.user_id,
+                    data=transforms.dumps(data)).put()
+
+    def _get_user_agent_frequencies(self):
+        return sorted(
+            self.get_aggregated_data_by_email('foo@bar.com')[
+                'user_agent_frequencies'],
+            key=lambda x: x['user_agent'])
+
+    def test_incremental_run_matches_full_rebuild(self):
+        self.run_aggregator_job()
+        num_events = len(self.processed)
+        self._add_events('new-agent', 2)
+
+        del self.processed[:]
+        self.run_aggregator_job()
+        self.assertEqual(2, len(self.processed))
+        incremental = self._get_user_agent_frequencies()
+        self.assertIn('new-agent', [x['user_agent'] for x in incremental])
+
+        del self.processed[:]
+        job = student_aggregate.StudentAggregateGenerator(
+            self.app_context, full_rebuild=True)
+        job.submit()
+        self.execute_all_deferred_tasks()
+        self.assertEqual(num_events + 2, len(self.processed))
+        self.assertEqual(incremental, self._get_user_agent_frequencies())
+
+    def test_retried_incremental_reduce_merges_items_from_before_run(self):
+        self.run_aggregator_job()
+        self._add_events('new-agent', 2)
+
+        # As if an earlier attempt of the next run had already reduced the
+        # Student and saved the items merged with the new events.
+        job = student_aggregate.StudentAggregateGenerator(self.app_context)
+        with common_utils.Namespace('ns_' + self.COURSE_NAME):
+            sequence_num = job.load().sequence_num
+            user_id = models.Student.get_by_email('foo@bar.com').user_id
+            entity = student_aggregate.StudentAggregateEntity.get_by_key_name(
+                user_id)
+            db.put(student_aggregate.StudentAggregateEntity.build(
+                user_id, entity.data, zlib.compress(transforms.dumps({})),
+                previous_event_items=entity.event_items,
+                sequence_num=sequence_num + 1))
+
+        self.run_aggregator_job()
+        incremental = self._get_user_agent_frequencies()
+        self.assertIn('new-agent', [x['user_agent'] for x in incremental])
+
+        job = student_aggregate.StudentAggregateGenerator(
+            self.app_context, full_rebuild=True)
+        job.submit()
+        self.execute_all_deferred_tasks()
+        self.assertEqual(incremental, self._get_user_agent_frequencies())
+
+    def test_aggregate_without_items_is_kept_until_full_run(self):
+        self.run_aggregator_job()
+        num_events = len(self.processed)
+        frequencies = self._get_user_agent_frequencies()
+
+        # Drop the items kept with the aggregate, as when they are too large.
+        with common_utils.Namespace('ns_' + self.COURSE_NAME):
+            user_id = models.Student.get_by_email('foo@bar.com').user_id
+            entity = student_aggregate.StudentAggregateEntity.get_by_key_name(
+                user_id)
+            db.put(student_aggregate.StudentAggregateEntity.build(
+                user_id, entity.data, None))
+        self._add_events('new-agent', 2)
+
+        del self.processed[:]
+        self.run_aggregator_job()
+        self.assertEqual(2, len(self.processed))
+        self.assertEqual(frequencies, self._get_user_agent_frequencies())
+
+        # The aggregate is brought up to date by the full run that follows.
+        del self.processed[:]
+        self.run_aggregator_job()
+        self.assertEqual(num_events + 2, len(self.processed))
+        self.assertIn('new-agent', [
+            x['user_agent'] for x in self._get_user_agent_frequencies()])
+
+    def test_run_after_failed_run_maps_all_events(self):
+        self.run_aggregator_job()
+        num_events = len(self.processed)
+
+        job = student_aggregate.StudentAggregateGenerator(self.app_context)
+        with common_utils.Namespace('ns_' + self.COURSE_NAME):
+            sequence_num = job.load().sequence_num
+            db.run_in_transaction(
+                jobs.DurableJobEntity._fail_job, job._job_name, sequence_num,
+                None, 0)
+
+        del self.processed[:]
+        self.run_aggregator_job()
+        self.assertEqual(num_events, len(self.processed))
+
+        # Once that run has completed, the next one is incremental again.
+        del self.processed[:]
+        self.run_aggregator_job()
+        self.assertEqual(0, len(self.processed))
+
+
+class StudentAggregateReduceTest(AbstractModulesAnalyticsTest):
+
+    NUM_STUDENTS = 5
+
+    def _add_students_and_events(self, events_per_student):
+        with common_utils.Namespace('ns_' + self.COURSE_NAME):
+            for index in xrange(self.NUM_STUDENTS):
+                user_id = str(1000 + index)
+                models.Student(
+                    key_name='student%d@example.com' % index,
+                    user_id=user_id, is_enrolled=True).put()
+                data = transforms.dumps({'user_agent': 'agent-%d' % index})
+                for _ in xrange(events_per_student):
+                    models.EventEntity(
+                        source='enter-page', user_id=user_id, data=data).put()
+
+    def test_combine_merges_items_per_component(self):
+        combined = list(student_aggregate.StudentAggregateGenerator.combine(
+            '1000', ['a:1', 'a:{"x": 2}', 'b:"c"'], ['a::[3, 4]']))
+        items = dict(
+            student_aggregate.StudentAggregateGenerator._parse_value(value)
+            for value in combined)
+        self.assertEqual(2, len(combined))
+        self.assertEqual([1, {'x': 2}, 3, 4], items['a'])
+        self.assertEqual(['c'], items['b'])
+
+    def test_course_is_loaded_once_per_run(self):
+        self._add_students_and_events(3)
+        contexts = []
+        old_init = student_aggregate.StudentAggregateReduceContext.__init__
+
+        def init(reduce_context, *args, **kwargs):
+            contexts.append(reduce_context)
+            old_init(reduce_context, *args, **kwargs)
+
+        self.swap(student_aggregate.StudentAggregateReduceContext,
+                  '__init__', init)
+        self.run_aggregator_job()
+
+        self.assertEqual(1, len(contexts))
+        with common_utils.Namespace('ns_' + self.COURSE_NAME):
+            for index in xrange(self.NUM_STUDENTS):
+                entity = (
+                    student_aggregate.StudentAggregateEntity.get_by_key_name(
+                        str(1000 + index)))
+                aggregate = entity.get_data()
+                self.assertEqual(
+                    [{'user_agent': 'agent-%d' % index, 'frequency': 1.0}],
+                    aggregate['user_agent_frequencies'])
+
+    def _get_shard_count(self):
+        with common_utils.Namespace('ns_' + self.COURSE_NAME):
+            return student_aggregate.StudentAggregateShardEntity.all().count()
+
+    def test_large_aggregates_are_sharded(self):
+        self._add_students_and_events(3)
+        self.swap(student_aggregate, 'MAX_SHARD_SIZE', 20)
+        self.swap(student_aggregate, 'MAX_NUM_SHARDS', 1000)
+        self.run_aggregator_job()
+        self.assertTrue(self._get_shard_count())
+
+        with common_utils.Namespace('ns_' + self.COURSE_NAME):
+            entities = student_aggregate.StudentAggregateEntity.all().fetch(
+                self.NUM_STUDENTS)
+            self.assertEqual(self.NUM_STUDENTS, len(entities))
+            shards = student_aggregate.StudentAggregateEntity.load_shards(
+                entities)
+            for entity in entities:
+                self.assertTrue(entity.data_shards)
+                index = int(entity.key().name()) - 1000
+                self.assertEqual(
+                    [{'user_agent': 'agent-%d' % index, 'frequency': 1.0}],
+                    entity.get_data(shards)['user_agent_frequencies'])
+                self.assertEqual(
+                    entity.get_data(shards), entity.get_data())
+
+    def test_stale_shards_are_deleted(self):
+        self._add_students_and_events(3)
+        self.swap(student_aggregate, 'MAX_SHARD_SIZE', 20)
+        self.swap(student_aggregate, 'MAX_NUM_SHARDS', 1000)
+        self.run_aggregator_job()
+        self.assertTrue(self._get_shard_count())
+
+        self.swap(student_aggregate, 'MAX_SHARD_SIZE', 1000 * 1000)
+        job = student_aggregate.StudentAggregateGenerator(
+            self.app_context, full_rebuild=True)
+        job.submit()
+        self.execute_all_deferred_tasks()
+        self.assertEqual(0, self._get_shard_count())
+
+
+    def test_rewrite_does_not_mix_old_entity_with_new_shards(self):
+        self._add_students_and_events(3)
+        self.swap(student_aggregate, 'MAX_SHARD_SIZE', 20)
+        self.swap(student_aggregate, 'MAX_NUM_SHARDS', 1000)
+        self.run_aggregator_job()
+        with common_utils.Namespace('ns_' + self.COURSE_NAME):
+            old_entity = (
+                student_aggregate.StudentAggregateEntity.get_by_key_name(
+                    '1000'))
+
+        job = student_aggregate.StudentAggregateGenerator(
+            self.app_context, full_rebuild=True)
+        job.submit()
+        self.execute_all_deferred_tasks()
+
+        with common_utils.Namespace('ns_' + self.COURSE_NAME):
+            new_entity = (
+                student_aggregate.StudentAggregateEntity.get_by_key_name(
+                    '1000'))
+            self.assertNotEqual(
+                old_entity.shards_generation, new_entity.shards_generation)
+            self.assertFalse(
+                set(old_entity.get_shard_key_names()) &
+                set(new_entity.get_shard_key_names()))
+            with self.assertRaises(ValueError):
+                old_entity.get_data()
+            self.assertEqual(
+                [{'user_agent': 'agent-0', 'frequency': 1.0}],
+                new_entity.get_data()['user_agent_frequencies'])
+
+    def test_corrupt_aggregate_is_skipped_by_data_source(self):
+        self._add_students_and_events(1)
+        self.run_aggregator_job()
+        with common_utils.Namespace('ns_' + self.COURSE_NAME):
+            entity = student_aggregate.StudentAggregateEntity.get_by_key_name(
+                '1000')
+            entity.data = 'not compressed'
+            entity.put()
+            with self.assertRaises(ValueError):
+                entity.get_data()
+
+            registry = student_aggregate.StudentAggregateComponentRegistry
+            data_source_context = (
+                registry.get_context_class().build_blank_default({}, 20))
+            data_source_context.send_uncensored_pii_data = True
+            rows = registry._postprocess_rows(
+                self.app_context, data_source_context, None, None, 0,
+                student_aggregate.StudentAggregateEntity.all().fetch(
+                    self.NUM_STUDENTS))
+            self.assertEqual(self.NUM_STUDENTS - 1, len(rows))
+
+
 class ClusteringTabTests(actions.TestBase):
     """Test for the clustering subtab of analytics tab."""
     COURSE_NAME = 'clustering_course'
@@ -1507,9 +1783,117 @@ class ClusteringGeneratorTests(actions.TestBase):
                       result)
         self.assertIn(['student_count', self.sv_number + 1], result)
 
+    def test_incremental_run_matches_full_run(self):
+        self._add_entities()
+        self.run_generator_job()
+
+        self._add_student_vector('0', range(6, 6 + self.dim_number))
+        self._add_student_vector('1', [0] * self.dim_number)
+        self._add_student_vector(str(self.sv_number), range(1, 11))
+        student = models.Student(user_id=str(self.sv_number + 1))
+        student.put()
+        self._add_student_vector(student.user_id, range(2, 12))
+        models.Student(user_id=str(self.sv_number + 2)).put()
+
+        evaluated = []
+        evaluate_student = clustering.ClusteringGenerator._evaluate_student
+
+        def _evaluate_student(user_id, student_vector, *args):
+            evaluated.append(user_id)
+            return evaluate_student(user_id, student_vector, *args)
+
+        self.swap(clustering.ClusteringGenerator, '_evaluate_student',
+                  staticmethod(_evaluate_student))
+        self.run_generator_job()
+        self.assertEqual(
+            ['0', '1', str(self.sv_number), str(self.sv_number + 1)],
+            sorted(evaluated))
+        job = clustering.ClusteringGenerator(self.app_context).load()
+        incremental_results = clustering.ClusteringGenerator.get_statistics(
+            job)
+
+        clustering.ClusteringGenerator(
+            self.app_context, full_rebuild=True).submit()
+        self.execute_all_deferred_tasks()
+        job = clustering.ClusteringGenerator(self.app_context).load()
+        full_results = jobs.MapReduceJob.get_results(job)
+        self.assertIn(['student_count', self.sv_number + 3], full_results)
+        self.assertEqual(sorted(full_results), sorted(incremental_results))
+        self.assertEqual(
+            sorted(full_results),
+            sorted(clustering.ClusteringGenerator.get_statistics(job)))
+
+    def _update_some_student_vectors(self):
+        self._add_student_vector('0', range(6, 6 + self.dim_number))
+        self._add_student_vector('1', [0] * self.dim_number)
+
+    def _get_full_run_results(self):
+        clustering.ClusteringGenerator(
+            self.app_context, full_rebuild=True).submit()
+        self.execute_all_deferred_tasks()
+        job = clustering.ClusteringGenerator(self.app_context).load()
+        return sorted(jobs.MapReduceJob.get_results(job))
+
+    def test_retried_incremental_map_subtracts_previous_memberships(self):
+        self._add_entities()
+        self.run_generator_job()
+        self._update_some_student_vectors()
+
+        # As if an earlier attempt of the next run had already evaluated
+        # student '0' and saved its new memberships.
+        job = clustering.ClusteringGenerator(self.app_context).load()
+        stored = clustering.StudentClusters.get_by_key_name('0')
+        clustering.StudentClusters(
+            key_name='0', clusters=transforms.dumps({}),
+            previous_clusters=stored.clusters,
+            sequence_num=job.sequence_num + 1).put()
+
+        self.run_generator_job()
+        job = clustering.ClusteringGenerator(self.app_context).load()
+        incremental_results = sorted(
+            clustering.ClusteringGenerator.get_statistics(job))
+        self.assertEqual(self._get_full_run_results(), incremental_results)
+
+    def test_refused_submit_keeps_statistics_of_last_run(self):
+        self._add_entities()
+        self.run_generator_job()
+        self._update_some_student_vectors()
+        self.run_generator_job()
+        job = clustering.ClusteringGenerator(self.app_context).load()
+        statistics = clustering.ClusteringGenerator.get_statistics(job)
+
+        # A submit prepares the run before finding out in its transaction
+        # that another one has just started.
+        generator = clustering.ClusteringGenerator(self.app_context)
+        generator._pre_transaction_setup()
+        self.swap(generator, 'is_active', lambda: True)
+        self.assertEqual(-1, generator.non_transactional_submit())
+        self.assertEqual(
+            statistics, clustering.ClusteringGenerator.get_statistics(job))
+
+    def test_changed_clusters_force_full_run(self):
+        self._add_entities()
+        self.run_generator_job()
+        self.assertEqual(
+            clustering.StudentVector,
+            clustering.ClusteringGenerator(self.app_context).entity_class())
+        self.assertEqual(
+            models.Student,
+            clustering.ClusteringGenerator(
+                self.app_context, full_rebuild=True).entity_class())
+
+        self._add_cluster([(0, 1)])
+        self.assertEqual(
+            models.Student,
+            clustering.ClusteringGenerator(self.app_context).entity_class())
+
     def _check_hamming(self, cluster_vector, student_vector, value):
         self.assertEqual(clustering.hamming_distance(
             cluster_vector, student_vector), value)
+        packed_clusters = clustering.PackedClusterVectors(
+            [{'id': 1, 'vector': cluster_vector}])
+        self.assertEqual(
+            [(1, value)], list(packed_clusters.get_distances(student_vector)))
 
     def test_hamming_distance(self):
         cluster_vector = [
@@ -1575,6 +1959,50 @@ class ClusteringGeneratorTests(actions.TestBase):
         ]
         self._check_hamming(cluster_vector, [], 1)
 
+    def _make_unit_vector(self, key, values):
+        return [{clustering.DIM_TYPE: clustering.DIM_TYPE_UNIT,
+                 clustering.DIM_ID: str(index),
+                 key: value} for index, value in enumerate(values)]
+
+    def test_hamming_distance_stops_at_max_distance(self):
+        cluster_vector = [
+            dict(dim, **{clustering.DIM_LOW: 5})
+            for dim in self._make_unit_vector(clustering.DIM_HIGH, [6] * 5)]
+        student_vector = self._make_unit_vector(
+            clustering.DIM_VALUE, [0, 0, 0, 5, 0])
+        self.assertEqual(
+            4, clustering.hamming_distance(cluster_vector, student_vector))
+        self.assertEqual(3, clustering.hamming_distance(
+            cluster_vector, student_vector, max_distance=2))
+        self.assertEqual(4, clustering.hamming_distance(
+            cluster_vector, student_vector, max_distance=4))
+
+    def test_packed_distances_match_hamming_distance(self):
+        clusters = [
+            {'id': 1, 'vector': self._make_unit_vector(
+                clustering.DIM_HIGH, [10, 5, None, 0])},
+            {'id': 2, 'vector': [
+                dict(dim, **{clustering.DIM_LOW: 3}) for dim in
+                self._make_unit_vector(clustering.DIM_HIGH, [7, '', 3])]},
+            {'id': 3, 'vector': []},
+        ]
+        packed_clusters = clustering.PackedClusterVectors(clusters)
+        for values in ([], [0, 0, 0, 0], [3, 7, 3, 1], [11, 5.5, 2, None],
+                       [7, 3, 100, -1]):
+            student_vector = self._make_unit_vector(
+                clustering.DIM_VALUE, values)
+            expected = [
+                (cluster['id'], clustering.hamming_distance(
+                    cluster['vector'], student_vector))
+                for cluster in clusters]
+            self.assertEqual(expected, list(
+                packed_clusters.get_distances(student_vector)))
+            self.assertEqual(
+                [(cluster_id, distance) for cluster_id, distance in expected
+                 if distance <= 1],
+                list(packed_clusters.get_distances(
+                    student_vector, max_distance=1)))
+
 
 class TestClusterStatisticsDataSource(actions.TestBase):
 
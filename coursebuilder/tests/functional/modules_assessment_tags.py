@@ -0,0 +1,106 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for modules/assessment_tags/."""
+
+from common import caching
+from common import tags
+from common import utils as common_utils
+from models import models
+from modules.assessment_tags import questions
+from tests.functional import actions
+
+COURSE_NAME = 'assessment_tags'
+ADMIN_EMAIL = 'admin@example.com'
+
+
+class QuestionPrefetchTest(actions.TestBase):
+    """Tests that question tags on a page share one bulk load."""
+
+    def setUp(self):
+        super(QuestionPrefetchTest, self).setUp()
+        actions.simple_add_course(COURSE_NAME, ADMIN_EMAIL, 'Assessment Tags')
+        self.namespace = 'ns_%s' % COURSE_NAME
+        with common_utils.Namespace(self.namespace):
+            self.mc_id = models.QuestionDAO.save(models.QuestionDTO(None, {
+                'description': 'mc', 'type': models.QuestionDTO.MULTIPLE_CHOICE,
+                'question': 'mc question text', 'multiple_selections': False,
+                'choices': [{'text': 'a', 'score': 1.0}], 'version': '1.5'}))
+            self.sa_id = models.QuestionDAO.save(models.QuestionDTO(None, {
+                'description': 'sa', 'type': models.QuestionDTO.SHORT_ANSWER,
+                'question': 'sa question text', 'hint': '', 'graders': [],
+                'defaultFeedback': '', 'version': '1.5'}))
+            self.group_id = models.QuestionGroupDAO.save(
+                models.QuestionGroupDTO(None, {
+                    'description': 'group', 'introduction': 'group intro',
+                    'items': [
+                        {'question': str(self.mc_id), 'weight': 1},
+                        {'question': str(self.sa_id), 'weight': 1}],
+                    'version': '1.5'}))
+
+        self.loads = []
+        self.bulk_loads = []
+        old_load = models.QuestionDAO.load.im_func
+        old_bulk_load = models.QuestionDAO.bulk_load.im_func
+
+        def load(cls, obj_id):
+            self.loads.append(obj_id)
+            return old_load(cls, obj_id)
+
+        def bulk_load(cls, obj_id_list):
+            self.bulk_loads.append(obj_id_list)
+            return old_bulk_load(cls, obj_id_list)
+
+        self.swap(models.QuestionDAO, 'load', classmethod(load))
+        self.swap(models.QuestionDAO, 'bulk_load', classmethod(bulk_load))
+        caching.RequestScopedSingleton.clear_all()
+
+    def tearDown(self):
+        caching.RequestScopedSingleton.clear_all()
+        super(QuestionPrefetchTest, self).tearDown()
+
+    def _render(self, html):
+        with common_utils.Namespace(self.namespace):
+            return tags.html_to_safe_dom(html, None).sanitized
+
+    def test_questions_on_page_are_bulk_loaded(self):
+        html = (
+            '<question quid="%s" instanceid="q1"></question>'
+            '<question quid="%s" instanceid="q2"></question>'
+            '<question quid="%s" instanceid="q3"></question>'
+            '<question-group qgid="%s" instanceid="g1"></question-group>'
+        ) % (self.mc_id, self.sa_id, self.mc_id, self.group_id)
+        rendered = self._render(html)
+
+        self.assertIn('mc question text', rendered)
+        self.assertIn('sa question text', rendered)
+        self.assertIn('group intro', rendered)
+        self.assertNotIn('[Invalid question]', rendered)
+        self.assertEquals([], self.loads)
+        self.assertEquals(
+            set([self.mc_id, self.sa_id]),
+            set(quid for ids in self.bulk_loads for quid in ids))
+
+    def test_questions_not_prefetched_are_loaded_individually(self):
+        rendered = questions.render_question(self.mc_id, 'q1')
+        self.assertIn('mc question text', rendered)
+        self.assertEquals([self.mc_id], self.loads)
+        self.assertEquals([], self.bulk_loads)
+
+    def test_invalid_and_deleted_questions(self):
+        rendered = self._render(
+            '<question quid="bogus" instanceid="q1"></question>'
+            '<question quid="9999" instanceid="q2"></question>')
+        self.assertIn('[Invalid question]', rendered)
+        self.assertIn('[Question deleted]', rendered)
@@ -48,7 +48,7 @@ class CertificateHandlerTestCase(actions.TestBase):
         self.is_qualified = True
         self.original_student_is_qualified = certificate.student_is_qualified
         certificate.student_is_qualified = (
-            lambda student, course: self.is_qualified)
+            lambda student, course, evaluator=None: self.is_qualified)
 
     def tearDown(self):
         certificate.student_is_qualified = self.original_student_is_qualified
@@ -105,6 +105,40 @@ class CertificateHandlerTestCase(actions.TestBase):
             response.headers['Content-Disposition'])
         self.assertIn('/Title (Course Builder Certificate)', response.body)
 
+    def test_download_pdf_is_cached(self):
+        actions.login('test@example.com')
+        models.Student.add_new_student_for_current_user('Test User', None, self)
+
+        response = self.get('/certificate.pdf')
+        self.assertEqual('application/pdf', response.headers['Content-Type'])
+        self.assertEqual(1, len(certificate.CertificatePdfEntity.all().fetch(
+            10)))
+
+        # A certificate once issued is served without checking again.
+        self.is_qualified = False
+        cached_response = self.get('/certificate.pdf')
+        self.assertEqual(
+            'application/pdf', cached_response.headers['Content-Type'])
+        self.assertEqual(response.body, cached_response.body)
+
+        # A change of name needs a new document, and a new check.
+        student = models.Student.get_by_email('test@example.com')
+        student.name = 'Other Name'
+        student.put()
+        response = self.get('/certificate.pdf')
+        self.assertEquals(302, response.status_code)
+
+        self.is_qualified = True
+        response = self.get('/certificate.pdf')
+        self.assertEqual('application/pdf', response.headers['Content-Type'])
+        self.assertEqual(2, len(certificate.CertificatePdfEntity.all().fetch(
+            10)))
+
+    def test_background_is_loaded_once(self):
+        self.assertIs(
+            certificate.CertificateBackground.instance(),
+            certificate.CertificateBackground.instance())
+
     def test_certificate_table_entry(self):
         actions.login('test@example.com')
         models.Student.add_new_student_for_current_user('Test User', None, self)
@@ -208,6 +242,81 @@ class CertificateCriteriaTestCase(actions.TestBase):
         self.assertEquals(expected_certificates, total_certificates)
         actions.login(self.STUDENT_EMAIL)
 
+    def _run_pdf_generator_and_expect(
+        self, expected_rendered, expected_cached, expected_not_qualified):
+        actions.login(self.ADMIN_EMAIL)
+        url = ('/' + self.COURSE_NAME +
+               '/dashboard?action=analytics&tab=certificate_pdfs')
+        response = self.get(url)
+        self.submit(response.forms['gcb-run-visualization-certificate_pdfs'],
+                    response)
+        self.execute_all_deferred_tasks()
+
+        dom = self.parse_html_string(self.get(url).body)
+        self.assertEquals(expected_rendered, int(
+            dom.find('.//span[@id="pdfs_rendered"]').text))
+        self.assertEquals(expected_cached, int(
+            dom.find('.//span[@id="pdfs_already_cached"]').text))
+        self.assertEquals(expected_not_qualified, int(
+            dom.find('.//span[@id="students_not_qualified"]').text))
+        actions.login(self.STUDENT_EMAIL)
+
+    def test_pdf_pregeneration(self):
+        self._run_pdf_generator_and_expect(0, 0, 1)
+
+        def pregeneration_criterion(unused_student, unused_course):
+            return True
+
+        criterion = 'pregeneration_criterion'
+        setattr(custom_criteria, criterion, pregeneration_criterion)
+        custom_criteria.registration_table.append(criterion)
+        try:
+            self.certificate_criteria.append({'custom_criteria': criterion})
+            self._run_pdf_generator_and_expect(1, 0, 0)
+            self._run_pdf_generator_and_expect(0, 1, 0)
+
+            response = self.get('certificate.pdf')
+            self.assertEqual(
+                'application/pdf', response.headers['Content-Type'])
+        finally:
+            custom_criteria.registration_table.remove(criterion)
+            delattr(custom_criteria, criterion)
+
+    def test_map_jobs_evaluate_students_in_batches(self):
+        for email in ['bar@foo.com', 'baz@foo.com']:
+            actions.login(email)
+            actions.register(self, email)
+        actions.login(self.STUDENT_EMAIL)
+
+        def batch_criterion(student, unused_course):
+            return student.email != self.STUDENT_EMAIL
+
+        criterion = 'batch_criterion'
+        setattr(custom_criteria, criterion, batch_criterion)
+        custom_criteria.registration_table.append(criterion)
+        batch_sizes = []
+        evaluate = certificate.CertificateCriteriaEvaluator.evaluate
+
+        def counting_evaluate(evaluator, students):
+            batch_sizes.append(len(students))
+            return evaluate(evaluator, students)
+
+        self.swap(certificate.CertificateCriteriaEvaluator, 'evaluate',
+                  counting_evaluate)
+        self.swap(certificate, 'MAPREDUCE_EVALUATION_BATCH_SIZE', 2)
+        try:
+            self.certificate_criteria.append({'custom_criteria': criterion})
+            self._run_analytic_and_expect(3, 0, 2)
+            self.assertTrue(len(batch_sizes) < 3)
+            self.assertTrue(max(batch_sizes) <= 2)
+
+            del batch_sizes[:]
+            self._run_pdf_generator_and_expect(2, 0, 1)
+            self.assertTrue(len(batch_sizes) < 3)
+        finally:
+            custom_criteria.registration_table.remove(criterion)
+            delattr(custom_criteria, criterion)
+
     def test_no_criteria_analytic(self):
         self._run_analytic_and_expect(1, 0, 0)
 
@@ -252,6 +361,51 @@ class CertificateCriteriaTestCase(actions.TestBase):
         self.assertEquals(200, response.status_code)
         self._run_analytic_and_expect(1, 1, 1)  # 1 student, 1 active, 1 cert
 
+    def test_batch_evaluation(self):
+        assessment = self.course.add_assessment()
+        assessment.title = 'Assessment'
+        assessment.html_content = 'assessment content'
+        assessment.now_available = True
+        self.course.save()
+        self.certificate_criteria.append(
+            {'assessment_id': assessment.unit_id, 'pass_percent': 70.0})
+
+        actions.submit_assessment(
+            self,
+            assessment.unit_id,
+            {'answers': '', 'score': 80,
+             'assessment_type': assessment.unit_id},
+            presubmit_checks=False
+        )
+        other_email = 'bar@foo.com'
+        actions.login(other_email)
+        actions.register(self, other_email)
+        other = models.StudentProfileDAO.get_enrolled_student_by_email_for(
+            other_email, self.course.app_context)
+        actions.login(self.STUDENT_EMAIL)
+
+        student = models.Student.get_by_email(self.STUDENT_EMAIL)
+        course = courses.Course(None, self.course.app_context)
+        evaluator = certificate.CertificateCriteriaEvaluator(course)
+        self.assertEquals([True, False], evaluator.evaluate([student, other]))
+        self.assertEquals(
+            [certificate.student_is_qualified(student, course),
+             certificate.student_is_qualified(other, course)],
+            evaluator.evaluate([student, other]))
+        self.assertEquals(
+            [certificate.student_is_qualified(
+                student, course, evaluator=evaluator),
+             certificate.student_is_qualified(
+                 other, course, evaluator=evaluator)],
+            evaluator.evaluate([student, other]))
+        self.assertEquals([], evaluator.evaluate([]))
+
+        # Evaluation does not create progress for students who have none.
+        tracker = course.get_progress_tracker()
+        self.assertIsNone(models.StudentPropertyEntity.get_by_key_name(
+            models.StudentPropertyEntity.create_key(
+                other.user_id, tracker.PROPERTY_KEY)))
+
     def _submit_review(self, assessment):
         """Submits a review by the current student.
 
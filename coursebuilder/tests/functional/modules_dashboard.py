@@ -18,10 +18,12 @@ __author__ = 'Glenn De Jonghe (gdejonghe@google.com)'
 
 import cgi
 import time
+import urllib
 
 import actions
 from common import crypto
 from common.utils import Namespace
+from models import config
 from models import courses
 from models import models
 from models import transforms
@@ -29,6 +31,7 @@ from models.custom_modules import Module
 from models.roles import Permission
 from models.roles import Roles
 from modules.dashboard import dashboard
+from modules.dashboard import question_index
 from modules.dashboard import tabs
 from modules.dashboard.dashboard import DashboardHandler
 from modules.dashboard.question_group_editor import QuestionGroupRESTHandler
@@ -348,6 +351,91 @@ class QuestionDashboardTestCase(actions.TestBase):
             question_id, qg_id, 'a', xsrf_token).body)
         self.assertEquals(response['status'], 500)
 
+    def _get_question_list(self, **params):
+        params['action'] = 'question_list'
+        response = transforms.loads(
+            self.get('dashboard?%s' % urllib.urlencode(params)).body)
+        self.assertEquals(200, response['status'])
+        return transforms.loads(response['payload'])
+
+    def test_question_list_is_paginated(self):
+        self.swap(question_index, 'QUESTIONS_PER_PAGE', 2)
+        for description, question_type in [
+            ('Question B', models.QuestionDTO.MULTIPLE_CHOICE),
+            ('Question A', models.QuestionDTO.SHORT_ANSWER),
+            ('Question C', models.QuestionDTO.MULTIPLE_CHOICE)]:
+            models.QuestionDAO.save(models.QuestionDTO(None, {
+                'description': description, 'type': question_type}))
+
+        # Only the first page of questions is rendered with the page.
+        dom = self.parse_html_string(self.get(self.URL).body)
+        questions_table = dom.find('.//table[@id="question-table"]')
+        self.assertEquals(
+            'dashboard?action=question_list',
+            questions_table.get('data-list-url'))
+        rows = questions_table.findall('./tbody/tr[@data-filter]')
+        self.assertEquals(
+            ['Question A', 'Question B'],
+            [row[0].findall('a')[1].tail for row in rows])
+        self.assertIsNotNone(dom.find('.//div[@id="question-pager"]'))
+
+        # The following pages are served by the question_list action.
+        payload = self._get_question_list(offset=2)
+        self.assertEquals(3, payload['total'])
+        self.assertEquals(2, payload['offset'])
+        self.assertIn('Question C', payload['rows'])
+        self.assertNotIn('Question A', payload['rows'])
+
+        # Filters are applied before paging.
+        payload = self._get_question_list(
+            type=models.QuestionDTO.MULTIPLE_CHOICE, description='question')
+        self.assertEquals(2, payload['total'])
+        self.assertIn('Question B', payload['rows'])
+        self.assertIn('Question C', payload['rows'])
+        payload = self._get_question_list(unused='true', description='c')
+        self.assertEquals(1, payload['total'])
+        self.assertIn('Question C', payload['rows'])
+
+    def test_question_index_is_rebuilt_after_changes(self):
+        config.Registry.test_overrides[models.CAN_USE_MEMCACHE.name] = True
+        builds = []
+        old_build = question_index.QuestionIndex._build.im_func
+
+        def build(cls):
+            builds.append(True)
+            return old_build(cls)
+
+        self.swap(question_index.QuestionIndex, '_build', classmethod(build))
+
+        question = models.QuestionDTO(None, {
+            'description': 'Question', 'type': 0})
+        question.id = models.QuestionDAO.save(question)
+        self.assertIn(
+            question.id, question_index.QuestionIndex.get()['questions'])
+        self.assertEquals(1, len(builds))
+
+        group_id = models.QuestionGroupDAO.save(models.QuestionGroupDTO(
+            None, {'description': 'Group', 'items': [
+                {'question': str(question.id), 'weight': 1}]}))
+        index = question_index.QuestionIndex.get()
+        self.assertEquals([question.id], index['groups'][group_id][
+            'question_ids'])
+        self.assertEquals(2, len(builds))
+        question_index.QuestionIndex.get()
+        self.assertEquals(2, len(builds))
+
+        question.description = 'Renamed question'
+        models.QuestionDAO.save(question)
+        index = question_index.QuestionIndex.get()
+        self.assertEquals(
+            'Renamed question', index['questions'][question.id]['description'])
+
+        models.QuestionDAO.delete(question)
+        self.assertNotIn(
+            question.id, question_index.QuestionIndex.get()['questions'])
+        self.assertEquals(4, len(builds))
+        del config.Registry.test_overrides[models.CAN_USE_MEMCACHE.name]
+
 
 class CourseOutlineTestCase(actions.TestBase):
     """Tests the Course Outline."""
@@ -471,6 +559,91 @@ class CourseOutlineTestCase(actions.TestBase):
         self.assertIn(
             'md-lock', lis[2].find('ol/li/div/div/div[3]').get('class', ''))
 
+    def test_outline_is_cached_until_course_is_saved(self):
+        config.Registry.test_overrides[models.CAN_USE_MEMCACHE.name] = True
+        try:
+            renders = []
+            old_render = DashboardHandler._render_course_outline_template
+
+            def render(handler, course, unit_title_template):
+                renders.append(True)
+                return old_render(handler, course, unit_title_template)
+
+            self.swap(
+                DashboardHandler, '_render_course_outline_template', render)
+
+            pre_assessment = self.course.add_assessment()
+            pre_assessment.title = 'Pre Assessment'
+            unit = self.course.add_unit()
+            unit.title = 'First Unit'
+            unit.pre_assessment = pre_assessment.unit_id
+            self.course.update_unit(unit)
+            self.course.save()
+
+            body = self.get(self.URL).body
+            self.assertEquals(1, len(renders))
+            self.assertIn('First Unit', body)
+            self.assertNotIn('__gcb_outline_xsrf_token_', body)
+            course_outline = self.parse_html_string(body).find(
+                './/div[@class="course-outline editable"]')
+            self.assertTrue(crypto.XsrfTokenManager.is_xsrf_token_valid(
+                course_outline.get('data-status-xsrf-token', ''),
+                'set_draft_status'))
+            lis = course_outline.findall('.//ol[@class="course"]/li')
+            self.assertEquals(1, len(lis))
+
+            # Tokens are issued per user, even when the outline is cached.
+            actions.login('other_admin@foo.com', is_admin=True)
+            body = self.get(self.URL).body
+            self.assertEquals(1, len(renders))
+            course_outline = self.parse_html_string(body).find(
+                './/div[@class="course-outline editable"]')
+            self.assertTrue(crypto.XsrfTokenManager.is_xsrf_token_valid(
+                course_outline.get('data-status-xsrf-token', ''),
+                'set_draft_status'))
+
+            course = courses.Course(None, self.course.app_context)
+            unit = course.find_unit_by_id(unit.unit_id)
+            unit.title = 'Renamed Unit'
+            course.update_unit(unit)
+            course.save()
+
+            body = self.get(self.URL).body
+            self.assertEquals(2, len(renders))
+            self.assertIn('Renamed Unit', body)
+            self.assertNotIn('First Unit', body)
+        finally:
+            del config.Registry.test_overrides[models.CAN_USE_MEMCACHE.name]
+
+    def test_parent_unit_index(self):
+        pre_assessment = self.course.add_assessment()
+        post_assessment = self.course.add_assessment()
+        unit = self.course.add_unit()
+        unit.pre_assessment = pre_assessment.unit_id
+        unit.post_assessment = post_assessment.unit_id
+        self.course.update_unit(unit)
+        self.assertEquals(
+            unit.unit_id,
+            self.course.get_parent_unit(pre_assessment.unit_id).unit_id)
+        self.course.save()
+
+        course = courses.Course(None, self.course.app_context)
+        self.assertEquals(
+            unit.unit_id, course.get_parent_unit(pre_assessment.unit_id).unit_id)
+        self.assertEquals(
+            unit.unit_id,
+            course.get_parent_unit(post_assessment.unit_id).unit_id)
+        self.assertIsNone(course.get_parent_unit(unit.unit_id))
+
+        unit = course.find_unit_by_id(unit.unit_id)
+        unit.post_assessment = None
+        course.update_unit(unit)
+        self.assertIsNone(course.get_parent_unit(post_assessment.unit_id))
+
+        course.delete_unit(course.find_unit_by_id(pre_assessment.unit_id))
+        self.assertIsNone(course.get_parent_unit(pre_assessment.unit_id))
+        self.assertIsNone(course.find_unit_by_id(unit.unit_id).pre_assessment)
+
 
 class RoleEditorTestCase(actions.TestBase):
     """Tests the Roles tab and Role Editor."""
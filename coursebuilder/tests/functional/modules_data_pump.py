@@ -31,6 +31,7 @@ from models import models
 from models import transforms
 from modules.data_pump import data_pump
 from modules.data_source_providers import rest_providers
+from modules.rating import rating
 
 from google.appengine.ext import deferred
 
@@ -505,6 +506,68 @@ class MockServiceClient(object):
         return self.mock_http.request()
 
 
+class FakeBigQueryHttp(object):
+    """In-process fake of BigQuery, including its resumable upload endpoint.
+
+    Stands in for the authorized HTTP client.  Dataset and table calls made
+    through MockServiceClient succeed, a POST creates an upload job, and
+    PUTs to the upload URL follow the resumable upload protocol, keeping
+    the bytes received by the latest upload job.  Failures can be injected
+    by mapping the sequence number of a data upload (starting at 1) to an
+    HTTP status.
+    """
+
+    UPLOAD_URL = 'https://bigquery.fake/upload/jobs/1'
+
+    def __init__(self):
+        self.received = ''
+        self.completed = False
+        self.upload_jobs = []
+        self.num_requests = 0
+        self.num_status_checks = 0
+        self.num_uploads = 0
+        self.upload_failures = {}
+
+    def request(self, uri=None, method=None, body=None, headers=None):
+        self.num_requests += 1
+        if uri is None:
+            return MockResponse({'status': 200}), ''
+        if method == 'POST':
+            self.upload_jobs.append(transforms.loads(body))
+            self.received = ''
+            self.completed = False
+            return MockResponse(
+                {'status': 200, 'location': self.UPLOAD_URL}), ''
+
+        content_range = headers['Content-Range']
+        if content_range == 'bytes */*':
+            self.num_status_checks += 1
+            return self._progress_response(), ''
+
+        self.num_uploads += 1
+        status = self.upload_failures.pop(self.num_uploads, None)
+        if status:
+            return MockResponse({'status': status}), ''
+        byte_range, total = content_range.split(' ')[1].split('/')
+        if int(byte_range.split('-')[0]) == len(self.received):
+            self.received += body
+        if total != '*' and len(self.received) == int(total):
+            self.completed = True
+        return self._progress_response(), ''
+
+    def _progress_response(self):
+        if self.completed:
+            return MockResponse({'status': 200})
+        if not self.received:
+            return MockResponse({'status': 308})
+        return MockResponse(
+            {'status': 308, 'range': '0-%d' % (len(self.received) - 1)})
+
+    def get_rows(self):
+        return [transforms.loads(line)
+                for line in self.received.split('\n') if line.strip()]
+
+
 class InteractionTests(actions.TestBase):
 
     def setUp(self):
@@ -1178,6 +1241,251 @@ class BigQueryInteractionTests(InteractionTests):
         self.assertEqual(0, num_tasks)
 
 
+class BatchedUploadTests(InteractionTests):
+    """Runs whole jobs against FakeBigQueryHttp, counting the work done."""
+
+    def setUp(self):
+        super(BatchedUploadTests, self).setUp()
+        self.fake_http = FakeBigQueryHttp()
+        fake_service_client = MockServiceClient(self.fake_http)
+        data_pump.DataPumpJob._get_bigquery_service = (
+            lambda slf, set: (fake_service_client, self.fake_http))
+
+        self.fetched_pages = []
+        old_fetch_values = TrivialDataSource.fetch_values.im_func
+
+        def fetch_values(cls, app_context, source_context, schema, log, page):
+            self.fetched_pages.append(page)
+            return old_fetch_values(
+                cls, app_context, source_context, schema, log, page)
+
+        self.swap(TrivialDataSource, 'fetch_values', classmethod(fetch_values))
+
+    def _set_pages_per_task(self, pages_per_task):
+        course_settings = self.app_context.get_environ()
+        course_settings[data_pump.DATA_PUMP_SETTINGS_SCHEMA_SECTION][
+            data_pump.PAGES_PER_TASK] = pages_per_task
+        course = courses.Course(None, app_context=self.app_context)
+        course.save_settings(course_settings)
+
+    def _set_pages_fetched_ahead(self, pages_fetched_ahead):
+        course_settings = self.app_context.get_environ()
+        course_settings[data_pump.DATA_PUMP_SETTINGS_SCHEMA_SECTION][
+            data_pump.PAGES_FETCHED_AHEAD] = pages_fetched_ahead
+        course = courses.Course(None, app_context=self.app_context)
+        course.save_settings(course_settings)
+
+    def _run_job(self):
+        self.job.submit()
+        num_tasks = self.execute_all_deferred_tasks()
+        job_object = self.job.load()
+        self.assertEqual(jobs.STATUS_CODE_COMPLETED, job_object.status_code)
+        job_context, _ = self.job._load_state(job_object,
+                                              job_object.sequence_num)
+        self.assertEqual(10, job_context[data_pump.ITEMS_UPLOADED])
+        self.assertEqual([{'thing': thing} for thing in range(10)],
+                         self.fake_http.get_rows())
+        return num_tasks
+
+    def test_pages_per_task_setting(self):
+        settings = self.job._get_bigquery_settings(self.app_context)
+        self.assertEqual(data_pump.DEFAULT_PAGES_PER_TASK,
+                         settings.pages_per_task)
+        self._set_pages_per_task(5)
+        settings = self.job._get_bigquery_settings(self.app_context)
+        self.assertEqual(5, settings.pages_per_task)
+        self._set_pages_per_task(data_pump.MAX_PAGES_PER_TASK + 1)
+        settings = self.job._get_bigquery_settings(self.app_context)
+        self.assertEqual(data_pump.MAX_PAGES_PER_TASK, settings.pages_per_task)
+
+    def test_one_page_per_task(self):
+        # Each page takes a task and a status check, and each full page is
+        # followed by a one-row probe for the end of the data.
+        self.assertEqual(4, self._run_job())
+        self.assertEqual(4, self.fake_http.num_status_checks)
+        self.assertEqual(4, self.fake_http.num_uploads)
+        self.assertEqual([0, 1, 1, 2, 2, 3, 3], self.fetched_pages)
+
+    def test_several_pages_per_task(self):
+        # Reading the next page tells whether the one before is the last.
+        self._set_pages_per_task(4)
+        self.assertEqual(1, self._run_job())
+        self.assertEqual(1, self.fake_http.num_status_checks)
+        self.assertEqual(4, self.fake_http.num_uploads)
+        self.assertEqual([0, 1, 2, 3], self.fetched_pages)
+
+    def test_pages_per_task_splits_upload_across_tasks(self):
+        # Only the last page of a task needs a probe for the end of the data.
+        self._set_pages_per_task(2)
+        self.assertEqual(2, self._run_job())
+        self.assertEqual(2, self.fake_http.num_status_checks)
+        self.assertEqual(4, self.fake_http.num_uploads)
+        self.assertEqual([0, 1, 2, 2, 3], self.fetched_pages)
+
+    def test_pages_fetched_ahead_setting(self):
+        settings = self.job._get_bigquery_settings(self.app_context)
+        self.assertEqual(data_pump.DEFAULT_PAGES_FETCHED_AHEAD,
+                         settings.pages_fetched_ahead)
+        self._set_pages_fetched_ahead(0)
+        settings = self.job._get_bigquery_settings(self.app_context)
+        self.assertEqual(0, settings.pages_fetched_ahead)
+        self._set_pages_fetched_ahead(data_pump.MAX_PAGES_FETCHED_AHEAD + 1)
+        settings = self.job._get_bigquery_settings(self.app_context)
+        self.assertEqual(data_pump.MAX_PAGES_FETCHED_AHEAD,
+                         settings.pages_fetched_ahead)
+
+    def test_pages_are_fetched_while_page_is_sent(self):
+        self._set_pages_per_task(4)
+        fetched_while_sending = []
+        old_request = self.fake_http.request
+
+        def request(uri=None, method=None, body=None, headers=None):
+            if method == 'PUT' and headers['Content-Range'] != 'bytes */*':
+                # Pages 0 and 1 are read before page 0 is sent; page 2 is
+                # read while page 0 is being sent.
+                deadline = time.time() + 5
+                while 2 not in self.fetched_pages and time.time() < deadline:
+                    time.sleep(0.01)
+                fetched_while_sending.append(2 in self.fetched_pages)
+            return old_request(uri, method, body, headers)
+
+        self.swap(self.fake_http, 'request', request)
+        self.assertEqual(1, self._run_job())
+        self.assertTrue(fetched_while_sending[0])
+        self.assertEqual([0, 1, 2, 3], self.fetched_pages)
+
+    def test_no_pages_fetched_ahead(self):
+        self._set_pages_per_task(4)
+        self._set_pages_fetched_ahead(0)
+        self.assertEqual(1, self._run_job())
+        self.assertEqual(4, self.fake_http.num_uploads)
+        self.assertEqual([0, 1, 2, 3], self.fetched_pages)
+
+    def test_server_error_stops_sending_until_next_task(self):
+        # Page #1 is refused; the rest of the task's pages are not sent, and
+        # the next task re-sends page #1 once it has checked upload state.
+        self._set_pages_per_task(4)
+        self.fake_http.upload_failures[2] = 503
+        self.assertEqual(2, self._run_job())
+        self.assertEqual(2, self.fake_http.num_status_checks)
+        self.assertEqual(5, self.fake_http.num_uploads)
+
+
+class IncrementalExportTests(InteractionTests):
+    """Exports of a data source with a watermark column, to FakeBigQueryHttp."""
+
+    def setUp(self):
+        super(IncrementalExportTests, self).setUp()
+        self.registered = not data_sources.Registry.is_registered(
+            rating.RatingEventDataSource)
+        if self.registered:
+            data_sources.Registry.register(rating.RatingEventDataSource)
+        self.fake_http = FakeBigQueryHttp()
+        self.fake_service_client = MockServiceClient(self.fake_http)
+        data_pump.DataPumpJob._get_bigquery_service = (
+            lambda slf, set: (self.fake_service_client, self.fake_http))
+        self.now = datetime.datetime.now()
+
+    def tearDown(self):
+        if self.registered:
+            data_sources.Registry.unregister(rating.RatingEventDataSource)
+        super(IncrementalExportTests, self).tearDown()
+
+    def _add_ratings(self, user_ids, recorded_on):
+        with common_utils.Namespace('ns_' + COURSE_NAME):
+            for user_id in user_ids:
+                rating.StudentRatingEvent(
+                    source='rating-event', user_id=user_id,
+                    recorded_on=recorded_on,
+                    data=transforms.dumps({
+                        'key': '/unit?unit=1&lesson=2', 'rating': 'good',
+                        'additional_comments': None})).put()
+
+    def _run_job(self, incremental, lag, send_uncensored_pii_data=True):
+        self.swap(data_pump, 'WATERMARK_LAG_SECONDS', lag)
+        del self.fake_service_client.calls[:]
+        job = data_pump.DataPumpJob(
+            self.app_context, rating.RatingEventDataSource.__name__,
+            send_uncensored_pii_data=send_uncensored_pii_data,
+            incremental=incremental)
+        job.submit()
+        self.execute_all_deferred_tasks()
+        job_object = job.load()
+        self.assertEqual(jobs.STATUS_CODE_COMPLETED, job_object.status_code)
+        return sorted(row['user_id'] for row in self.fake_http.get_rows())
+
+    def _get_watermark(self):
+        with common_utils.Namespace('ns_' + COURSE_NAME):
+            return data_pump.DataPumpWatermarkEntity.get_by_key_name(
+                rating.RatingEventDataSource.__name__)
+
+    def _assert_table_replaced(self, replaced):
+        self.assertEqual(replaced, 'delete' in self.fake_service_client.calls)
+        load = self.fake_http.upload_jobs[-1]['configuration']['load']
+        self.assertEqual('WRITE_APPEND' if not replaced else None,
+                         load.get('writeDisposition'))
+
+    def test_incremental_export_sends_only_new_items(self):
+        self._add_ratings(['1', '2', '3'],
+                          self.now - datetime.timedelta(hours=2))
+        self.assertEqual(['1', '2', '3'], self._run_job(False, 3600))
+        self._assert_table_replaced(True)
+        self.assertIsNotNone(self._get_watermark())
+
+        # Items added too recently are left for the next export.
+        self._add_ratings(['4', '5'],
+                          self.now - datetime.timedelta(minutes=30))
+        self._add_ratings(['6'], self.now)
+        self.assertEqual(['4', '5'], self._run_job(True, 600))
+        self._assert_table_replaced(False)
+
+        # Nothing new: the upload is empty, but the watermark moves on.
+        until = self._get_watermark().until
+        self.assertEqual([], self._run_job(True, 600))
+        self.assertLess(until, self._get_watermark().until)
+
+        self.assertEqual(['6'], self._run_job(True, 0))
+        self._assert_table_replaced(False)
+
+    def test_full_export_leaves_recent_items_to_next_export(self):
+        self._add_ratings(['1'], self.now - datetime.timedelta(hours=2))
+        self._add_ratings(['2'], self.now)
+        self.assertEqual(['1'], self._run_job(False, 3600))
+        self._assert_table_replaced(True)
+
+        # The next incremental export sends them, and nothing else again.
+        self.assertEqual(['2'], self._run_job(True, 0))
+        self._assert_table_replaced(False)
+
+    def test_full_export_replaces_table_and_resets_watermark(self):
+        self._add_ratings(['1', '2'], self.now - datetime.timedelta(hours=2))
+        self.assertEqual(['1', '2'], self._run_job(False, 3600))
+        self._add_ratings(['3'], self.now - datetime.timedelta(minutes=30))
+        self.assertEqual(['1', '2', '3'], self._run_job(False, 600))
+        self._assert_table_replaced(True)
+        self.assertEqual([], self._run_job(True, 600))
+        self._assert_table_replaced(False)
+
+    def test_incremental_export_without_watermark_is_full(self):
+        self._add_ratings(['1', '2'], self.now - datetime.timedelta(hours=2))
+        self.assertEqual(['1', '2'], self._run_job(True, 0))
+        self._assert_table_replaced(True)
+
+    def test_changed_pii_handling_forces_full_export(self):
+        # Items whose user IDs were obscured cannot be added to a table
+        # exported with un-obscured ones.
+        self._add_ratings(['1', '2'], self.now - datetime.timedelta(hours=2))
+        self._run_job(False, 3600, send_uncensored_pii_data=False)
+        self._add_ratings(['3'], self.now - datetime.timedelta(minutes=30))
+        self.assertEqual(['1', '2', '3'], self._run_job(True, 600))
+        self._assert_table_replaced(True)
+
+    def test_students_are_not_exported_incrementally(self):
+        # Students are updated after they enroll, so a full export is made.
+        self.assertIsNone(
+            rest_providers.StudentsDataSource.get_watermark_column())
+
+
 class UserInteractionTests(InteractionTests):
 
     URL = '/data_pump/dashboard?action=analytics&tab=data_pump'
@@ -177,11 +177,14 @@ class InvitationHandlerTests(BaseInvitationTests):
         response = self._post_to_rest_handler(self._get_rest_request({}))
         self.assertEquals(500, response['status'])
 
-    def _do_valid_email_list_post(self, email_list):
+    def _do_valid_email_list_post(self, email_list, deliver=True):
         self.register()
         with actions.OverriddenEnvironment(self.EMAIL_ENV):
-            return self._post_to_rest_handler(
+            response = self._post_to_rest_handler(
                 self._get_rest_request({'emailList': ','.join(email_list)}))
+        if deliver:
+            self.execute_all_deferred_tasks()
+        return response
 
     def test_rest_handler_requires_non_empty_email_list(self):
         response = self._do_valid_email_list_post([''])
@@ -273,6 +276,32 @@ class InvitationHandlerTests(BaseInvitationTests):
             set(email_list),
             {log['args'][0] for log in self.send_async_call_log})
 
+    def test_rest_handler_queues_invitations_for_delivery(self):
+        registered_student = 'some_other_student@foo.com'
+        models.Student(key_name=registered_student, is_enrolled=True).put()
+        unsubscribed_email = 'unsubscribed@foo.com'
+        unsubscribe.set_subscribed(unsubscribed_email, False)
+        email_list = [
+            'a@foo.com', 'b@foo.com', registered_student, unsubscribed_email]
+
+        response = self._do_valid_email_list_post(email_list, deliver=False)
+        self.assertEquals(200, response['status'])
+        self.assertEquals('OK, 4 messages sent', response['message'])
+        self.assertEqual(0, self.send_async_count)
+
+        self.execute_all_deferred_tasks()
+        self.assertEqual(2, self.send_async_count)
+        self.assertEquals(
+            set(['a@foo.com', 'b@foo.com']),
+            {log['args'][0] for log in self.send_async_call_log})
+        for log in self.send_async_call_log:
+            unsubscribe_url = urlparse.urlparse(
+                log['kwargs']['audit_trail']['unsubscribe_url'])
+            query = urlparse.parse_qs(unsubscribe_url.query)
+            self.assertEquals(log['args'][0], query['email'][0])
+            self.assertIn(log['kwargs']['audit_trail']['unsubscribe_url'],
+                          log['args'][3])
+
     def test_rest_handler_can_send_some_invitations_but_not_others(self):
         spammed_email = 'spammed@foo.com'
         response = self._do_valid_email_list_post([spammed_email])
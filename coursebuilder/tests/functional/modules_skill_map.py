@@ -28,9 +28,11 @@ from babel.messages import pofile
 from networkx import DiGraph
 from xml.etree import cElementTree
 
+from common import caching
 from common import crypto
 from common import resource
 from controllers import sites
+from models import config
 from models import courses
 from models import jobs
 from models import models
@@ -47,6 +49,7 @@ from modules.skill_map.skill_map import SkillMap
 from modules.skill_map.skill_map import SkillRestHandler
 from modules.skill_map.skill_map import SkillCompletionAggregate
 from modules.skill_map.skill_map import _SkillDao
+from modules.skill_map import skill_map
 from modules.skill_map.skill_map import SkillCompletionTracker
 from modules.skill_map.skill_map_metrics import SkillMapMetrics
 from modules.skill_map.skill_map_metrics import CHAINS_MIN_LENGTH
@@ -383,6 +386,92 @@ class SkillMapTests(BaseSkillMapTests):
         skill_map_3 = SkillMap.load(self.course)
         self.assertEqual(skill_map_2, skill_map_3)
 
+    def test_topo_sort_of_empty_and_cyclic_graphs(self):
+        skill_map = SkillMap.load(self.course)
+        self.assertEqual([], skill_map._topo_sort())
+
+        skill_graph = SkillGraph.load()
+        skill_1 = skill_graph.add(Skill.build(SKILL_NAME, SKILL_DESC))
+        skill_2 = skill_graph.add(Skill.build(SKILL_NAME_2, SKILL_DESC_2))
+        skill_3 = skill_graph.add(Skill.build(SKILL_NAME_3, SKILL_DESC_3))
+        skill_graph.add_prerequisite(skill_2.id, skill_1.id)
+        skill_graph.add_prerequisite(skill_3.id, skill_2.id)
+        skill_graph.add_prerequisite(skill_2.id, skill_3.id)
+
+        skill_map = SkillMap.load(self.course)
+        self.assertIsNone(skill_map._topo_sort())
+        self.assertEqual(
+            3, len(skill_map.skills(sort_by='prerequisites')))
+
+
+class SkillGraphCacheTests(BaseSkillMapTests):
+    """Tests for the process scoped cache of skill graphs."""
+
+    def setUp(self):
+        super(SkillGraphCacheTests, self).setUp()
+        config.Registry.test_overrides[models.CAN_USE_MEMCACHE.name] = True
+        self.swap(skill_map, 'SKILL_GRAPH_CACHE_DELAY_SEC', -1)
+        skill_map.ProcessScopedSkillGraphCache.instance().clear()
+
+        self.loads = []
+        get_all_mapped = _SkillDao.get_all_mapped.im_func
+
+        def _get_all_mapped(cls):
+            self.loads.append(namespace_manager.get_namespace())
+            return get_all_mapped(cls)
+
+        self.swap(_SkillDao, 'get_all_mapped', classmethod(_get_all_mapped))
+
+    def tearDown(self):
+        del config.Registry.test_overrides[models.CAN_USE_MEMCACHE.name]
+        skill_map.ProcessScopedSkillGraphCache.instance().clear()
+        super(SkillGraphCacheTests, self).tearDown()
+
+    def _load_graph(self):
+        # Each request gets its own SkillGraph.
+        caching.RequestScopedSingleton.clear_all()
+        return SkillGraph.load()
+
+    def test_skills_are_loaded_once_until_changed(self):
+        skill = self._load_graph().add(Skill.build(SKILL_NAME, SKILL_DESC))
+        del self.loads[:]
+
+        self.assertEqual([skill.id], [s.id for s in self._load_graph().skills])
+        self.assertEqual(1, len(self.loads))
+        self.assertEqual([skill.id], [s.id for s in self._load_graph().skills])
+        self.assertEqual(1, len(self.loads))
+
+        skill_graph = self._load_graph()
+        skill_2 = skill_graph.add(Skill.build(SKILL_NAME_2, SKILL_DESC_2))
+        skill_graph.add_prerequisite(skill_2.id, skill.id)
+        skill_graph = self._load_graph()
+        self.assertEqual(2, len(self.loads))
+        self.assertEqual(
+            [skill_2.id], [s.id for s in skill_graph.successors(skill.id)])
+
+        # Saving the course structure changes the skills of lessons.
+        self._load_graph()
+        self.assertEqual(2, len(self.loads))
+        self.course.save()
+        self._load_graph()
+        self.assertEqual(3, len(self.loads))
+
+    def test_changes_do_not_affect_cached_skills(self):
+        skill_graph = self._load_graph()
+        skill_1 = skill_graph.add(Skill.build(SKILL_NAME, SKILL_DESC))
+        skill_2 = skill_graph.add(Skill.build(SKILL_NAME_2, SKILL_DESC_2))
+        skill_graph.add_prerequisite(skill_2.id, skill_1.id)
+        cached_skills = dict(
+            (s.id, s) for s in self._load_graph().skills)
+
+        skill_graph = self._load_graph()
+        skill_graph.delete_prerequisite(skill_2.id, skill_1.id)
+        self.assertEqual(
+            set([skill_1.id]), cached_skills[skill_2.id].prerequisite_ids)
+        self.assertEqual(set(), skill_graph.get(skill_2.id).prerequisite_ids)
+        self.assertEqual(
+            set(), self._load_graph().get(skill_2.id).prerequisite_ids)
+
 
 class LocationListRestHandlerTests(BaseSkillMapTests):
     URL = 'rest/modules/skill_map/location_list'
@@ -1900,3 +1989,55 @@ class SkillCompletionTrackerTests(BaseSkillMapTests):
         # Just does not raise any error
         tracker.update_skills(self.student, lprogress, self.lesson1.lesson_id)
         tracker.recalculate_progress(lprogress_tracker, lprogress, self.sa)
+
+    def test_progress_event_puts_skills_with_linear_progress(self):
+        """Skill progress is saved in the same batch as the lesson progress."""
+        self._build_sample_graph()
+        self._create_lessons()  # 3 lessons in unit 1
+        self._add_student_and_progress()  # sa completed, sb in progress
+        self._create_linear_progress()  # Lesson 1 and 2 completed
+        self.lesson3.properties[LESSON_SKILL_LIST_KEY] = [self.sc.id]
+        self.course.save()
+
+        single_puts = []
+        batch_puts = []
+        old_put = models.StudentPropertyEntity.put
+        old_put_multi = models.StudentPropertyEntity.put_multi.im_func
+
+        def put(entity):
+            single_puts.append(entity.key().name())
+            return old_put(entity)
+
+        def put_multi(cls, properties):
+            batch_puts.append(sorted(prop.key().name() for prop in properties))
+            return old_put_multi(cls, properties)
+
+        self.swap(models.StudentPropertyEntity, 'put', put)
+        self.swap(models.StudentPropertyEntity, 'put_multi',
+                  classmethod(put_multi))
+
+        lprogress_tracker = UnitLessonCompletionTracker(self.course)
+        lprogress_tracker.put_html_completed(
+            self.student, self.unit.unit_id, self.lesson3.lesson_id)
+
+        # One write per event, holding both the linear and skill progress.
+        self.assertEqual([], single_puts)
+        self.assertEqual([sorted([
+            models.StudentPropertyEntity.create_key(
+                self.student.user_id, UnitLessonCompletionTracker.PROPERTY_KEY),
+            models.StudentPropertyEntity.create_key(
+                self.student.user_id, SkillCompletionTracker.PROPERTY_KEY),
+            ])], batch_puts)
+        result = SkillCompletionTracker().get_skills_progress(
+            self.student, [self.sc.id])
+        self.assertEqual(SkillCompletionTracker.COMPLETED,
+                         result[self.sc.id][0])
+
+        # An event that leaves the skills unchanged only writes the lesson.
+        del batch_puts[:]
+        lprogress_tracker.put_html_completed(
+            self.student, self.unit.unit_id, self.lesson3.lesson_id)
+        self.assertEqual([], single_puts)
+        lprogress_key = models.StudentPropertyEntity.create_key(
+            self.student.user_id, UnitLessonCompletionTracker.PROPERTY_KEY)
+        self.assertEqual([[lprogress_key]], batch_puts)
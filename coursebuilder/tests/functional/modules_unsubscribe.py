@@ -20,6 +20,8 @@ import urlparse
 
 from common import utils
 from controllers import sites
+from models import config
+from models import models
 from modules.unsubscribe import unsubscribe
 from tests.functional import actions
 
@@ -76,6 +78,36 @@ class SubscribeAndUnsubscribeTests(BaseUnsubscribeTests):
             unsubscribe.set_subscribed(self.EMAIL, False)
             self.assertUnsubscribed(self.EMAIL, self.namespace)
 
+    def test_has_unsubscribed_multi(self):
+        other_email = 'other@example.com'
+        never_set_email = 'never_set@example.com'
+        with utils.Namespace(self.namespace):
+            unsubscribe.set_subscribed(self.EMAIL, False)
+            unsubscribe.set_subscribed(other_email, True)
+            self.assertEquals(
+                {self.EMAIL: True, other_email: False, never_set_email: False},
+                unsubscribe.has_unsubscribed_multi(
+                    [self.EMAIL, other_email, never_set_email]))
+            self.assertEquals({}, unsubscribe.has_unsubscribed_multi([]))
+
+    def test_cached_state_is_updated_by_set_subscribed(self):
+        config.Registry.test_overrides[models.CAN_USE_MEMCACHE.name] = True
+        try:
+            with utils.Namespace(self.namespace):
+                self.assertSubscribed(self.EMAIL, self.namespace)
+                unsubscribe.set_subscribed(self.EMAIL, False)
+                self.assertUnsubscribed(self.EMAIL, self.namespace)
+
+                # Subsequent checks are served from memcache.
+                unsubscribe.SubscriptionStateEntity.get_by_key_name(
+                    self.EMAIL).delete()
+                self.assertUnsubscribed(self.EMAIL, self.namespace)
+
+                unsubscribe.set_subscribed(self.EMAIL, True)
+                self.assertSubscribed(self.EMAIL, self.namespace)
+        finally:
+            del config.Registry.test_overrides[models.CAN_USE_MEMCACHE.name]
+
     def test_subscription_state_entity_must_have_key_name(self):
         with self.assertRaises(db.BadValueError):
             unsubscribe.SubscriptionStateEntity()
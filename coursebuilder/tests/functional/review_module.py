@@ -447,6 +447,131 @@ class ManagerTest(actions.TestBase):
         self.assertEqual(1, summary.completed_count)
         self.assertEqual(1, summary.expired_count)
 
+    def _put_auto_step(self, summary_key, reviewee_email,
+                       state=domain.REVIEW_STATE_ASSIGNED):
+        reviewee_key = models.Student(key_name=reviewee_email).put()
+        submission_key = student_work.Submission(
+            reviewee_key=reviewee_key, unit_id=self.unit_id).put()
+        return peer.ReviewStep(
+            assigner_kind=domain.ASSIGNER_KIND_AUTO,
+            review_key=db.Key.from_path(student_work.Review.kind(), 'review'),
+            review_summary_key=summary_key, reviewee_key=reviewee_key,
+            reviewer_key=self.reviewer_key, submission_key=submission_key,
+            state=state, unit_id=self.unit_id
+        ).put()
+
+    def test_expire_old_reviews_for_unit_in_batches_expires_found_reviews(self):
+        first_summary_key = peer.ReviewSummary(
+            assigned_count=2, completed_count=1, reviewee_key=self.reviewee_key,
+            submission_key=self.submission_key, unit_id=self.unit_id
+        ).put()
+        second_summary_key = peer.ReviewSummary(
+            assigned_count=1, reviewee_key=self.reviewee_key,
+            submission_key=self.submission_key, unit_id=self.unit_id
+        ).put()
+        step_keys = [
+            self._put_auto_step(first_summary_key, 'reviewee1@example.com'),
+            self._put_auto_step(first_summary_key, 'reviewee2@example.com'),
+            self._put_auto_step(second_summary_key, 'reviewee3@example.com')]
+        transactions = (
+            review_module.COUNTER_EXPIRE_REVIEWS_FOR_SUMMARY_START.value)
+
+        expired_keys, exception_keys = (
+            review_module.Manager.expire_old_reviews_for_unit_in_batches(
+                0, self.unit_id))
+        steps = db.get(step_keys)
+        first_summary, second_summary = db.get(
+            [first_summary_key, second_summary_key])
+
+        self.assertEqual(sorted(step_keys), sorted(expired_keys))
+        self.assertEqual([], exception_keys)
+        self.assertEqual(
+            2, review_module.COUNTER_EXPIRE_REVIEWS_FOR_SUMMARY_START.value -
+            transactions)
+        self.assertEqual(
+            [domain.REVIEW_STATE_EXPIRED] * 3, [step.state for step in steps])
+        self.assertEqual(0, first_summary.assigned_count)
+        self.assertEqual(1, first_summary.completed_count)
+        self.assertEqual(2, first_summary.expired_count)
+        self.assertEqual(0, second_summary.assigned_count)
+        self.assertEqual(1, second_summary.expired_count)
+
+    def test_expire_old_reviews_for_unit_in_batches_splits_transactions(self):
+        self.swap(review_module, '_EXPIRY_MAX_STEPS_PER_TRANSACTION', 2)
+        summary_key = peer.ReviewSummary(
+            assigned_count=3, reviewee_key=self.reviewee_key,
+            submission_key=self.submission_key, unit_id=self.unit_id
+        ).put()
+        for i in xrange(3):
+            self._put_auto_step(summary_key, 'reviewee%s@example.com' % i)
+        transactions = (
+            review_module.COUNTER_EXPIRE_REVIEWS_FOR_SUMMARY_START.value)
+
+        expired_keys, unused_exception_keys = (
+            review_module.Manager.expire_old_reviews_for_unit_in_batches(
+                0, self.unit_id))
+        summary = db.get(summary_key)
+
+        self.assertEqual(3, len(expired_keys))
+        self.assertEqual(
+            2, review_module.COUNTER_EXPIRE_REVIEWS_FOR_SUMMARY_START.value -
+            transactions)
+        self.assertEqual(0, summary.assigned_count)
+        self.assertEqual(3, summary.expired_count)
+
+    def test_expire_old_reviews_for_unit_in_batches_skips_errors(self):
+        query_containing_unprocessable_entities = peer.ReviewStep.all(
+            keys_only=True)
+        query_fn = types.MethodType(
+            lambda x, y, z: query_containing_unprocessable_entities,
+            review_module.Manager(), review_module.Manager)
+        self.swap(
+            review_module.Manager, 'get_expiry_query', query_fn)
+
+        summary_key = peer.ReviewSummary(
+            assigned_count=1, completed_count=1, reviewee_key=self.reviewee_key,
+            submission_key=self.submission_key, unit_id=self.unit_id
+        ).put()
+        missing_summary_key = db.Key.from_path(
+            peer.ReviewSummary.kind(), 'no_summary_found_for_key')
+        processable_step_key = self._put_auto_step(
+            summary_key, 'reviewee1@example.com')
+        completed_step_key = self._put_auto_step(
+            summary_key, 'reviewee2@example.com',
+            state=domain.REVIEW_STATE_COMPLETED)
+        orphan_step_key = self._put_auto_step(
+            missing_summary_key, 'reviewee3@example.com')
+
+        expired_keys, exception_keys = (
+            review_module.Manager.expire_old_reviews_for_unit_in_batches(
+                0, self.unit_id))
+        processed_step, completed_step, orphan_step, summary = db.get(
+            [processable_step_key, completed_step_key, orphan_step_key,
+             summary_key])
+
+        self.assertEqual([processable_step_key], expired_keys)
+        self.assertEqual(
+            sorted([completed_step_key, orphan_step_key]),
+            sorted(exception_keys))
+        self.assertEqual(domain.REVIEW_STATE_EXPIRED, processed_step.state)
+        self.assertEqual(domain.REVIEW_STATE_COMPLETED, completed_step.state)
+        self.assertEqual(domain.REVIEW_STATE_ASSIGNED, orphan_step.state)
+        self.assertEqual(0, summary.assigned_count)
+        self.assertEqual(1, summary.completed_count)
+        self.assertEqual(1, summary.expired_count)
+
+    def test_expire_reviews_for_summary_raises_key_error_for_missing_summary(
+            self):
+        missing_summary_key = db.Key.from_path(
+            peer.ReviewSummary.kind(), 'no_summary_found_for_key')
+        step_key = self._put_auto_step(
+            missing_summary_key, 'reviewee1@example.com')
+
+        self.assertRaises(
+            KeyError, review_module.Manager.expire_reviews_for_summary,
+            missing_summary_key, [step_key])
+        self.assertEqual(domain.REVIEW_STATE_ASSIGNED, db.get(step_key).state)
+
     def test_get_assignment_candidates_query_filters_and_orders_correctly(self):
         unused_wrong_unit_key = peer.ReviewSummary(
             reviewee_key=self.reviewee_key, submission_key=self.submission_key,
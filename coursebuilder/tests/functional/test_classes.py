@@ -60,6 +60,7 @@ from models import vfs
 from models.courses import Course
 import modules.admin.admin
 from modules.announcements.announcements import AnnouncementEntity
+from modules.dashboard import question_editor
 import modules.oeditor.oeditor
 from tools import verify
 from tools.etl import etl
@@ -1136,6 +1137,59 @@ class InfrastructureTest(actions.TestBase):
         finally:
             namespace_manager.set_namespace(old_namespace)
 
+    def _put_config_from_another_instance(self, name, value):
+        # Writes the entity without telling the local registry, as a save
+        # made by the admin on another instance would.
+        entity = config.ConfigPropertyEntity(key_name=name)
+        entity.value = value
+        entity.is_draft = False
+        entity.updated_on = datetime.datetime.utcnow()
+        db.put(entity)
+        config.ConfigVersionStamp.bump(name)
+
+    def test_config_changes_propagate_by_version_stamp(self):
+        prop = config.ConfigProperty(
+            'gcb_test_version_stamp', config.TYPE_STR, '',
+            default_value='default')
+        config.Registry.get_overrides(force_update=True)
+        update_index = config.Registry.update_index
+        self.assertEqual('default', prop.value)
+
+        # Unchanged stamp: nothing is reloaded.
+        self._put_config_from_another_instance(prop.name, 'foo')
+        config.Registry.version = config.ConfigVersionStamp.get()
+        config.Registry.last_version_check_time = 0
+        self.assertEqual('default', prop.value)
+
+        # Changed stamp: the property is reloaded without a full reload.
+        self._put_config_from_another_instance(prop.name, 'bar')
+        config.Registry.last_version_check_time = 0
+        self.assertEqual('bar', prop.value)
+        self.assertEqual(update_index, config.Registry.update_index)
+
+        # Deleting the property is noticed as well.
+        db.delete(config.ConfigPropertyEntity.get_by_key_name(prop.name))
+        config.ConfigVersionStamp.bump(prop.name)
+        config.Registry.last_version_check_time = 0
+        self.assertEqual('default', prop.value)
+        self.assertEqual(update_index, config.Registry.update_index)
+
+    def test_config_version_stamp_recreated_from_datastore(self):
+        prop = config.ConfigPropertyEntity(key_name='gcb_test_version_stamp')
+        prop.value = 'foo'
+        prop.is_draft = False
+        prop.put()
+        version = config.ConfigVersionStamp.get()
+        self.assertEqual(
+            'gcb_test_version_stamp',
+            config.ConfigVersionStamp.get_name(version))
+
+        # An evicted stamp is rebuilt from the last saved property.
+        memcache.flush_all()
+        self.assertEqual(
+            'gcb_test_version_stamp', config.ConfigVersionStamp.get_name(
+                config.ConfigVersionStamp.get()))
+
 
 class AdminAspectTest(actions.TestBase):
     """Test site from the Admin perspective."""
@@ -5212,6 +5266,107 @@ class ImportGiftQuestionsTests(DatastoreBackedCourseTest):
         assert_equals(response.status_int, 200)
         assert_contains('gift group', response.body)
 
+    def _put_gift_questions(self, description, questions):
+        actions.login('gift@google.com', is_admin=True)
+        request = {
+            'payload': transforms.dumps({
+                'description': description, 'questions': questions}),
+            'xsrf_token': XsrfTokenManager.create_xsrf_token(
+                'import-gift-questions')}
+        return self.testapp.put('/rest/question/gift?%s' % urllib.urlencode(
+            {'request': transforms.dumps(request)}), {})
+
+    def test_import_reports_all_invalid_questions(self):
+        response = self._put_gift_questions(
+            'gift group',
+            '::t1:: q1? {=c ~w}\n\n'
+            '::t2:: q2? {=c ~w\n\n'
+            '::t3:: q3? {T}\n\n'
+            '::t4:: q4? {~%30% c ~%30% w}\n')
+        assert_equals(response.status_int, 200)
+        assert_contains('412', response.body)
+        assert_contains('Line 3:', response.body)
+        assert_contains('Line 7:', response.body)
+        assert_does_not_contain('Line 1:', response.body)
+        assert_does_not_contain('Line 5:', response.body)
+        with Namespace(self.namespace):
+            self.assertEquals([], models.QuestionDAO.get_all())
+            self.assertEquals([], models.QuestionGroupDAO.get_all())
+
+    def test_large_import_is_saved_by_deferred_tasks(self):
+        question_count = 7
+        gift_text = '\n\n'.join(
+            '::title %s:: q%s? {T}' % (i, i) for i in xrange(question_count))
+        save_all_calls = []
+        old_save_all = models.QuestionDAO.save_all
+
+        def save_all(unused_cls, dtos):
+            save_all_calls.append(len(dtos))
+            return old_save_all(dtos)
+
+        self.swap(question_editor, 'MAX_QUESTIONS_IMPORTED_INLINE', 2)
+        self.swap(question_editor, 'QUESTION_IMPORT_BATCH_SIZE', 3)
+        self.swap(models.QuestionDAO, 'save_all', classmethod(save_all))
+
+        response = self._put_gift_questions('large group', gift_text)
+        assert_contains('Importing 7 questions into: large group.',
+                        response.body)
+        with Namespace(self.namespace):
+            self.assertEquals([], models.QuestionDAO.get_all())
+
+        self.execute_all_deferred_tasks()
+        self.assertEquals([3, 3, 1], save_all_calls)
+        with Namespace(self.namespace):
+            descriptions = sorted(
+                q.description for q in models.QuestionDAO.get_all())
+            self.assertEquals(
+                ['title %s' % i for i in xrange(question_count)],
+                descriptions)
+            groups = models.QuestionGroupDAO.get_all()
+            self.assertEquals(1, len(groups))
+            self.assertEquals('large group', groups[0].description)
+            self.assertEquals(question_count, len(groups[0].question_ids))
+            self.assertEquals(
+                [], question_editor.GiftImportEntity.all().fetch(1))
+
+    def test_retried_import_task_does_not_duplicate_questions(self):
+        gift_text = '\n\n'.join(
+            '::title %s:: q%s? {T}' % (i, i) for i in xrange(5))
+        self.swap(question_editor, 'MAX_QUESTIONS_IMPORTED_INLINE', 2)
+        self.swap(question_editor, 'QUESTION_IMPORT_BATCH_SIZE', 3)
+        self._put_gift_questions('large group', gift_text)
+        with Namespace(self.namespace):
+            import_id = question_editor.GiftImportEntity.all().get().key().id()
+
+        # The first task fails after saving its batch, and is run again.
+        old_record_progress = question_editor._record_gift_import_progress
+        failures = []
+
+        def record_progress(*args):
+            if not failures:
+                failures.append(args)
+                raise ValueError('Task interrupted.')
+            return old_record_progress(*args)
+
+        self.swap(question_editor, '_record_gift_import_progress',
+                  record_progress)
+        with self.assertRaises(ValueError):
+            question_editor._import_gift_questions(self.namespace, import_id)
+        with Namespace(self.namespace):
+            self.assertEquals(3, len(models.QuestionDAO.get_all()))
+
+        self.execute_all_deferred_tasks()
+        with Namespace(self.namespace):
+            questions = models.QuestionDAO.get_all()
+            self.assertEquals(
+                ['title %s' % i for i in xrange(5)],
+                sorted(q.description for q in questions))
+            groups = models.QuestionGroupDAO.get_all()
+            self.assertEquals(1, len(groups))
+            self.assertEquals(
+                sorted(q.id for q in questions),
+                sorted(long(quid) for quid in groups[0].question_ids))
+
 
 class NamespaceTest(actions.TestBase):
 
@@ -123,6 +123,13 @@ class WhitelistTest(actions.TestBase):
         actions.login(NONSTUDENT_EMAIL)
         self._expect_invisible()
 
+    def test_no_whitelist_as_student_with_default_config(self):
+        self.assertEquals('', roles.GCB_ADMIN_LIST.value)
+        self.assertEquals('', roles.GCB_WHITELISTED_USERS.value)
+        actions.login(STUDENT_EMAIL)
+        self.assertFalse(roles.Roles.is_super_admin())
+        self._expect_visible()
+
     def test_course_whitelist_as_student(self):
         WhitelistTest._whitelist = STUDENT_WHITELIST
         actions.login(STUDENT_EMAIL)
@@ -178,3 +185,42 @@ class WhitelistTest(actions.TestBase):
             '[%s] ' % NONSTUDENT_EMAIL * 100)
         actions.login(STUDENT_EMAIL)
         self._expect_visible()
+
+    def test_course_whitelist_domain_entry_admits_no_one(self):
+        WhitelistTest._whitelist = '@FOO.com'
+        actions.login(STUDENT_EMAIL)
+        self._expect_invisible()
+        actions.logout()
+        actions.login(NONSTUDENT_EMAIL)
+        self._expect_invisible()
+
+    def test_course_whitelist_edit_recompiles(self):
+        WhitelistTest._whitelist = STUDENT_WHITELIST
+        actions.login(STUDENT_EMAIL)
+        self._expect_visible()
+        WhitelistTest._whitelist = '[%s]' % NONSTUDENT_EMAIL
+        self._expect_invisible()
+
+
+class AccessControlListTest(actions.TestBase):
+
+    def test_parses_emails(self):
+        acl = roles.AccessControlList('[a@foo.com], b@foo.com\n@Bar.com  @')
+        self.assertEquals(
+            set(['a@foo.com', 'b@foo.com', '@Bar.com', '@']), acl.emails)
+        self.assertTrue(acl.contains('a@foo.com'))
+        self.assertFalse(acl.contains('c@foo.com'))
+        self.assertFalse(acl.contains(None))
+
+    def test_domain_entries_match_no_address(self):
+        acl = roles.AccessControlList('@bar.com')
+        self.assertFalse(acl.contains('anyone@bar.com'))
+
+    def test_compiled_list_is_reused(self):
+        text = '[a@foo.com] [b@foo.com]'
+        self.assertIs(
+            roles.AccessControlList.get(text),
+            roles.AccessControlList.get(text))
+        self.assertIsNot(
+            roles.AccessControlList.get(text),
+            roles.AccessControlList.get(text + ' [c@foo.com]'))
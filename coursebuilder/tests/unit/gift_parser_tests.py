@@ -335,8 +335,7 @@ class TestMultiChoiceQuestion(unittest.TestCase):
 class TestCreateManyGiftQuestion(unittest.TestCase):
     """Tests for parsing and converting ``a list of GIFT questions."""
 
-    def test_create_many(self):
-        gift_text = """
+    GIFT_TEXT = """
 ::t1:: q1? {~%30% c1 #fb1 ~%70% c2 ~c3 # fb3}
 
 ::t2:: q2? {=c1 #c1fb ~w1a #w1afb ~w1b # w1bfb}
@@ -351,9 +350,55 @@ class TestCreateManyGiftQuestion(unittest.TestCase):
 
 ::t7:: When was Ulysses S. Grant born?{#1822:5}
 """
-        questions = gift.GiftParser.parse_questions(gift_text)
+
+    def test_create_many(self):
+        questions = gift.GiftParser.parse_questions(self.GIFT_TEXT)
         assert all(questions)
         self.assertEqual(
             ['multi_choice'] * 4 + ['short_answer'] * 3,
             [x['type'] for x in questions])
 
+
+class TestParseQuestionsWithErrors(unittest.TestCase):
+    """Tests for parsing GIFT questions one at a time."""
+
+    def test_split_questions(self):
+        gift_text = (
+            '// A comment\n'
+            '::t1:: q1? {\n'
+            '// Another comment\n'
+            '=c1 ~w1}\n'
+            '\n'
+            '\n'
+            '::t2:: q2? {T}\n'
+            '// Trailing comment\n'
+            '\n'
+            '// Comment only\n')
+        self.assertEqual(
+            [(1, '\n::t1:: q1? {\n\n=c1 ~w1}'), (7, '::t2:: q2? {T}\n')],
+            gift.GiftParser.split_questions(gift_text))
+
+    def test_errors_do_not_stop_parsing(self):
+        gift_text = (
+            '::t1:: q1? {=c1 ~w1}\n'
+            '\n'
+            '::t2:: q2? {=c1 ~w1\n'
+            '\n'
+            '::t3:: q3? {T}\n'
+            '\n'
+            '::t4:: q4? {~%30% c1 ~%30% w1}\n')
+        questions, errors = gift.GiftParser.parse_questions_with_errors(
+            gift_text)
+        self.assertEqual(
+            ['t1', 't3'], [x['description'] for x in questions])
+        self.assertEqual(2, len(errors))
+        self.assertTrue(errors[0].startswith('Line 3: '))
+        self.assertTrue(errors[1].startswith('Line 7: '))
+
+    def test_same_questions_as_parse_questions(self):
+        gift_text = TestCreateManyGiftQuestion.GIFT_TEXT
+        questions, errors = gift.GiftParser.parse_questions_with_errors(
+            gift_text)
+        self.assertEqual([], errors)
+        self.assertEqual(
+            gift.GiftParser.parse_questions(gift_text), questions)